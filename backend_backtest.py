@@ -0,0 +1,1482 @@
+# backend/app/services/indicators.py
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# All indicators take (symbols, bars) float64 matrices and work along axis=1,
+# so a whole universe is computed with a handful of array operations.
+# Warm-up bars and bars before a symbol's first quote are NaN.
+
+
+def _valid_count(x: np.ndarray) -> np.ndarray:
+    return np.cumsum(~np.isnan(x), axis=1)
+
+
+def ffill(x: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs along the bar axis"""
+    idx = np.where(np.isnan(x), 0, np.arange(x.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return x[np.arange(x.shape[0])[:, None], idx]
+
+
+def shift(x: np.ndarray, n: int = 1) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if n < x.shape[1]:
+        out[:, n:] = x[:, :-n] if n else x
+    return out
+
+
+def rolling_sum(x: np.ndarray, period: int) -> np.ndarray:
+    filled = np.nan_to_num(x)
+    csum = np.cumsum(filled, axis=1)
+    out = csum.copy()
+    out[:, period:] = csum[:, period:] - csum[:, :-period]
+    # A window is only valid once it holds `period` real observations
+    nans = np.cumsum(np.isnan(x), axis=1)
+    nan_in_window = nans.copy()
+    nan_in_window[:, period:] = nans[:, period:] - nans[:, :-period]
+    out[nan_in_window > 0] = np.nan
+    out[:, : period - 1] = np.nan
+    return out
+
+
+def sma(x: np.ndarray, period: int = 20) -> np.ndarray:
+    return rolling_sum(x, period) / period
+
+
+def rolling_std(x: np.ndarray, period: int = 20) -> np.ndarray:
+    mean = sma(x, period)
+    var = sma(x * x, period) - mean * mean
+    return np.sqrt(np.maximum(var, 0.0))
+
+
+def _smooth(x: np.ndarray, alpha: float, period: int) -> np.ndarray:
+    """Exponential smoothing as an IIR filter over every row at once"""
+    if x.shape[1] == 0:
+        return x.copy()
+    filled = ffill(x)
+    first = filled[np.arange(x.shape[0]), np.argmax(~np.isnan(filled), axis=1)]
+    filled = np.where(np.isnan(filled), first[:, None], filled)
+    filled = np.nan_to_num(filled)
+    zi = ((1.0 - alpha) * filled[:, 0])[:, None]
+    out, _ = lfilter([alpha], [1.0, alpha - 1.0], filled, axis=1, zi=zi)
+    out[_valid_count(x) < period] = np.nan
+    return out
+
+
+def ema(x: np.ndarray, period: int = 20) -> np.ndarray:
+    return _smooth(x, 2.0 / (period + 1.0), period)
+
+
+def wilder(x: np.ndarray, period: int = 14) -> np.ndarray:
+    return _smooth(x, 1.0 / period, period)
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    delta = close - shift(close)
+    gain = wilder(np.where(np.isnan(delta), np.nan, np.maximum(delta, 0.0)), period)
+    loss = wilder(np.where(np.isnan(delta), np.nan, np.maximum(-delta, 0.0)), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = 100.0 - 100.0 / (1.0 + gain / loss)
+    out[(loss == 0) & ~np.isnan(gain)] = 100.0
+    return out
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    prev_close = shift(close)
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return tr
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    return wilder(true_range(high, low, close), period)
+
+
+def vwap(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray, period: int = 20) -> np.ndarray:
+    typical = (high + low + close) / 3.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return rolling_sum(typical * volume, period) / rolling_sum(volume, period)
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26) -> np.ndarray:
+    return ema(close, fast) - ema(close, slow)
+
+
+def macd_signal(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> np.ndarray:
+    return ema(macd(close, fast, slow), signal)
+
+
+def bb_upper(close: np.ndarray, period: int = 20, std: float = 2.0) -> np.ndarray:
+    return sma(close, period) + std * rolling_std(close, period)
+
+
+def bb_lower(close: np.ndarray, period: int = 20, std: float = 2.0) -> np.ndarray:
+    return sma(close, period) - std * rolling_std(close, period)
+
+
+def _rolling_reduce(x: np.ndarray, period: int, reducer) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if period <= x.shape[1]:
+        windows = sliding_window_view(x, period, axis=1)
+        out[:, period - 1:] = reducer(windows, axis=-1)
+    return out
+
+
+def highest(x: np.ndarray, period: int = 20) -> np.ndarray:
+    return _rolling_reduce(x, period, np.max)
+
+
+def lowest(x: np.ndarray, period: int = 20) -> np.ndarray:
+    return _rolling_reduce(x, period, np.min)
+
+
+def roc(x: np.ndarray, period: int = 10) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (x / shift(x, period) - 1.0) * 100.0
+
+
+# name -> (function, price inputs, default parameters)
+INDICATORS = {
+    "sma": (sma, ("close",), {"period": 20}),
+    "ema": (ema, ("close",), {"period": 20}),
+    "rsi": (rsi, ("close",), {"period": 14}),
+    "atr": (atr, ("high", "low", "close"), {"period": 14}),
+    "vwap": (vwap, ("high", "low", "close", "volume"), {"period": 20}),
+    "macd": (macd, ("close",), {"fast": 12, "slow": 26}),
+    "macd_signal": (macd_signal, ("close",), {"fast": 12, "slow": 26, "signal": 9}),
+    "bb_upper": (bb_upper, ("close",), {"period": 20, "std": 2.0}),
+    "bb_lower": (bb_lower, ("close",), {"period": 20, "std": 2.0}),
+    "highest": (highest, ("high",), {"period": 20}),
+    "lowest": (lowest, ("low",), {"period": 20}),
+    "roc": (roc, ("close",), {"period": 10}),
+    "volume_sma": (sma, ("volume",), {"period": 20}),
+}
+
+PRICE_FIELDS = ("open", "high", "low", "close", "volume")
+
+---
+
+# backend/app/services/condition_compiler.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services import indicators
+
+# Scan and strategy conditions compile to a DAG of hashable tuples:
+#
+#   ("operand", key)                     price field or indicator, key from operand_key()
+#   ("prev", key)                        the same operand one bar earlier
+#   ("const", value)
+#   ("cmp", operator, left, right[, prev_left, prev_right])
+#   ("all" | "any" | "count", *children)
+#
+# Structurally equal nodes are equal tuples, so a memo dict shared between
+# plans evaluates every distinct comparison, and reads every distinct
+# indicator, once. Plans are cached by a hash of the condition JSON: editing a
+# scan or strategy changes the hash and yields a fresh plan.
+
+OPERATORS = (">", "<", ">=", "<=", "==", "crosses_above", "crosses_below")
+COMBINERS = ("all", "any", "count")
+
+Node = Tuple
+
+
+class ConditionError(ValueError):
+    pass
+
+
+def operand_key(spec: Dict[str, Any]) -> Tuple:
+    """Canonical key for a price field or indicator spec, e.g. ("ema", ("period", 20))"""
+    if "field" in spec:
+        name = spec["field"]
+        if name not in indicators.PRICE_FIELDS:
+            raise ConditionError(f"Unknown price field: {name}")
+        return (name,)
+
+    name = spec.get("indicator")
+    if name not in indicators.INDICATORS:
+        raise ConditionError(f"Unknown indicator: {name}")
+    _, _, defaults = indicators.INDICATORS[name]
+    params = dict(defaults)
+    for key in defaults:
+        if key in spec:
+            params[key] = spec[key]
+    return (name,) + tuple(sorted(params.items()))
+
+
+def parse_operand(name: str) -> Dict[str, Any]:
+    """Scan shorthand to a spec: "close", "change_percent", "rsi_14", "macd_12_26", "bb_upper_20_2" """
+    name = name.strip().lower()
+    if name in indicators.PRICE_FIELDS:
+        return {"field": name}
+    if name == "change_percent":
+        return {"indicator": "roc", "period": 1}
+
+    for indicator in sorted(indicators.INDICATORS, key=len, reverse=True):
+        if name == indicator or name.startswith(indicator + "_"):
+            _, _, defaults = indicators.INDICATORS[indicator]
+            args = [a for a in name[len(indicator):].split("_") if a]
+            if len(args) > len(defaults):
+                raise ConditionError(f"Too many parameters for {indicator}: {name}")
+            spec = {"indicator": indicator}
+            for key, arg in zip(defaults, args):
+                try:
+                    spec[key] = int(arg) if isinstance(defaults[key], int) else float(arg)
+                except ValueError:
+                    raise ConditionError(f"Invalid parameter in {name}")
+            return spec
+    raise ConditionError(f"Unknown indicator: {name}")
+
+
+def _operand(spec: Any) -> Node:
+    if isinstance(spec, str):
+        return ("operand", operand_key(parse_operand(spec)))
+    if not isinstance(spec, dict):
+        raise ConditionError(f"Invalid operand: {spec!r}")
+    if "field" in spec or spec.get("indicator") in indicators.INDICATORS:
+        return ("operand", operand_key(spec))
+    if isinstance(spec.get("indicator"), str):
+        # "rsi_14" with explicit params still allowed to override
+        return ("operand", operand_key({**parse_operand(spec["indicator"]), **{k: v for k, v in spec.items() if k != "indicator"}}))
+    raise ConditionError("Condition needs an 'indicator' or a 'field'")
+
+
+def _previous(node: Node) -> Node:
+    return node if node[0] == "const" else ("prev", node[1])
+
+
+def compile_condition(condition: Dict[str, Any]) -> Node:
+    if condition.get("type") == "custom":
+        raise ConditionError("Custom conditions are not supported")
+    params = condition.get("params", condition)
+
+    operator = params.get("operator")
+    if operator not in OPERATORS:
+        raise ConditionError(f"Unknown operator: {operator}")
+
+    left = _operand(params)
+    if "compare" in params:
+        right = _operand(params["compare"])
+    elif "value" in params:
+        try:
+            right = ("const", float(params["value"]))
+        except (TypeError, ValueError):
+            raise ConditionError(f"Invalid value: {params['value']!r}")
+    else:
+        raise ConditionError("Condition needs a 'value' or a 'compare' operand")
+
+    if operator.startswith("crosses"):
+        return ("cmp", operator, left, right, _previous(left), _previous(right))
+    return ("cmp", operator, left, right)
+
+
+@dataclass(frozen=True)
+class Plan:
+    digest: str
+    root: Node
+    nodes: Tuple[Node, ...]  # children before parents
+    operands: Tuple[Tuple, ...]
+
+
+def condition_digest(conditions: List[Dict[str, Any]], combine: str) -> str:
+    payload = json.dumps([combine, conditions], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _build(conditions: List[Dict[str, Any]], combine: str, digest: str) -> Plan:
+    if combine not in COMBINERS:
+        raise ConditionError(f"Unknown combiner: {combine}")
+    if not isinstance(conditions, list):
+        raise ConditionError("Conditions must be a list")
+
+    children = [compile_condition(c) for c in conditions]
+    if combine != "count":
+        children = set(children)  # AND/OR of a repeated condition is the condition
+    root = (combine, *sorted(children, key=repr))
+
+    nodes: Dict[Node, None] = {}
+
+    def visit(node: Node):
+        if node in nodes:
+            return
+        if node[0] == "cmp":
+            for child in node[2:]:
+                visit(child)
+        elif node[0] in COMBINERS:
+            for child in node[1:]:
+                visit(child)
+        nodes[node] = None
+
+    visit(root)
+    operands = tuple(dict.fromkeys(node[1] for node in nodes if node[0] in ("operand", "prev")))
+    return Plan(digest, root, tuple(nodes), operands)
+
+
+_plans: "OrderedDict[str, Plan]" = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def compile_conditions(conditions: List[Dict[str, Any]], combine: str = "all") -> Plan:
+    """Validated plan for a condition list, shared by every caller with the same JSON"""
+    digest = condition_digest(conditions, combine)
+    with _plans_lock:
+        plan = _plans.get(digest)
+        if plan is not None:
+            _plans.move_to_end(digest)
+            return plan
+
+    plan = _build(conditions, combine, digest)
+    with _plans_lock:
+        _plans[digest] = plan
+        while len(_plans) > settings.CONDITION_PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def evict(digest: str):
+    with _plans_lock:
+        _plans.pop(digest, None)
+
+
+def _compare(operator: str, left, right, prev_left=None, prev_right=None) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        if operator == ">":
+            return left > right
+        if operator == "<":
+            return left < right
+        if operator == ">=":
+            return left >= right
+        if operator == "<=":
+            return left <= right
+        if operator == "==":
+            return np.isclose(left, right)
+        if operator == "crosses_above":
+            return (left > right) & (prev_left <= prev_right)
+        return (left < right) & (prev_left >= prev_right)
+
+
+def evaluate(plan: Plan, source, memo: Dict[Node, Any] = None) -> np.ndarray:
+    """Evaluate a plan against an operand source.
+
+    The source provides value(key), previous_value(key) and shape: a batch
+    panel (symbols, bars) for backtests or one bar (symbols,) for live scans.
+    Passing the same memo to several plans shares their common nodes.
+    """
+    memo = {} if memo is None else memo
+    for node in plan.nodes:
+        if node in memo:
+            continue
+        kind = node[0]
+        if kind == "operand":
+            result = source.value(node[1])
+        elif kind == "prev":
+            result = source.previous_value(node[1])
+        elif kind == "const":
+            result = node[1]
+        elif kind == "cmp":
+            result = _compare(node[1], *(memo[child] for child in node[2:]))
+        elif kind == "count":
+            result = np.zeros(source.shape, dtype=np.int32)
+            for child in node[1:]:
+                result += memo[child]
+        elif kind == "all":
+            result = np.ones(source.shape, dtype=bool) if len(node) > 1 else np.zeros(source.shape, dtype=bool)
+            for child in node[1:]:
+                result = result & memo[child]
+        else:
+            result = np.zeros(source.shape, dtype=bool)
+            for child in node[1:]:
+                result = result | memo[child]
+        memo[node] = result
+    return memo[plan.root]
+
+---
+
+# backend/app/services/backtest_service.py
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import indicators
+from app.services.condition_compiler import ConditionError, compile_conditions, evaluate, operand_key
+from app.services.market_data import OHLCV
+
+# Strategy conditions are the StrategyCondition dicts stored on Strategy:
+#
+#   {"type": "indicator", "params": {"indicator": "rsi", "period": 14, "operator": "<", "value": 30}}
+#   {"type": "indicator", "params": {"indicator": "ema", "period": 20,
+#                                    "operator": "crosses_above", "compare": {"indicator": "ema", "period": 50}}}
+#   {"type": "price_action", "params": {"field": "close", "operator": ">", "compare": {"indicator": "sma", "period": 200}}}
+#
+# Entry conditions are ANDed, exit conditions are ORed; both are compiled by
+# app.services.condition_compiler. Signals are taken on the bar close and
+# filled on the next bar, long only.
+
+# Trading bars per year; NSE cash session is 375 minutes
+BARS_PER_YEAR = {
+    "1m": 252 * 375,
+    "5m": 252 * 75,
+    "15m": 252 * 25,
+    "1h": 252 * 375 / 60,
+    "1d": 252,
+}
+
+
+@dataclass
+class BacktestOutcome:
+    total_return: float
+    cagr: float
+    max_drawdown: float
+    sharpe_ratio: float
+    win_rate: float
+    profit_factor: float
+    expectancy: float
+    total_trades: int
+    timestamps: np.ndarray
+    equity: np.ndarray
+    drawdown: np.ndarray
+    final_equity: float = 0.0
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "total_return": self.total_return,
+            "cagr": self.cagr,
+            "max_drawdown": self.max_drawdown,
+            "sharpe_ratio": self.sharpe_ratio,
+            "win_rate": self.win_rate,
+            "profit_factor": self.profit_factor,
+            "expectancy": self.expectancy,
+        }
+
+
+class SignalEvaluator:
+    """Evaluates compiled condition plans over an OHLCV panel, computing each distinct operand once"""
+
+    def __init__(self, data: OHLCV):
+        self.data = data
+        self._cache: Dict[Tuple, np.ndarray] = {}
+        self._nodes: Dict[Tuple, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache) + len(self._nodes)
+
+    @property
+    def shape(self):
+        return self.data.close.shape
+
+    def value(self, key: Tuple) -> np.ndarray:
+        if key not in self._cache:
+            if len(key) == 1:
+                self._cache[key] = getattr(self.data, key[0])
+            else:
+                fn, inputs, _ = indicators.INDICATORS[key[0]]
+                args = [getattr(self.data, name) for name in inputs]
+                self._cache[key] = fn(*args, **dict(key[1:]))
+        return self._cache[key]
+
+    def previous_value(self, key: Tuple) -> np.ndarray:
+        return indicators.shift(self.value(key))
+
+    def operand(self, spec: Dict[str, Any]) -> np.ndarray:
+        return self.value(operand_key(spec))
+
+    def condition(self, condition: Dict[str, Any]) -> np.ndarray:
+        return self.all_of([condition])
+
+    def all_of(self, conditions: List[Dict[str, Any]]) -> np.ndarray:
+        return evaluate(compile_conditions(conditions, "all"), self, self._nodes)
+
+    def any_of(self, conditions: List[Dict[str, Any]]) -> np.ndarray:
+        return evaluate(compile_conditions(conditions, "any"), self, self._nodes)
+
+
+def positions_from_signals(entry: np.ndarray, exit: np.ndarray) -> np.ndarray:
+    """Long/flat state per bar: in a position once the last entry is newer than the last exit"""
+    idx = np.arange(entry.shape[1])
+    last_entry = np.maximum.accumulate(np.where(entry, idx, -1), axis=1)
+    last_exit = np.maximum.accumulate(np.where(exit, idx, -1), axis=1)
+    return last_entry > last_exit
+
+
+def _position_weight(position_sizing: Optional[Dict[str, Any]], n_symbols: int, initial_capital: float) -> float:
+    sizing = position_sizing or {}
+    method = sizing.get("method", "equal_weight")
+    if method == "percent_equity":
+        return float(sizing.get("percent", 100.0 / max(n_symbols, 1))) / 100.0
+    if method == "fixed":
+        try:
+            amount = float(sizing["amount"])
+        except (KeyError, TypeError, ValueError):
+            raise ConditionError("Fixed position sizing needs a numeric amount")
+        if not amount > 0:
+            raise ConditionError("Fixed position sizing amount must be positive")
+        return amount / initial_capital
+    if method == "equal_weight":
+        return 1.0 / max(n_symbols, 1)
+    raise ConditionError(f"Unknown position sizing method: {method}")
+
+
+@dataclass
+class SymbolBatch:
+    """Per-bar sums for a slice of the universe; batches add up to the whole portfolio"""
+    returns_sum: np.ndarray  # sum of per-symbol strategy returns, shape (bars,)
+    n_open: np.ndarray  # open positions per bar
+    trade_returns: np.ndarray  # one entry per closed or open trade
+
+
+def simulate_symbols(
+    data: OHLCV,
+    entry_conditions: List[Dict[str, Any]],
+    exit_conditions: List[Dict[str, Any]],
+    cost_bps: float = 0.0,
+    evaluator: Optional[SignalEvaluator] = None,
+) -> SymbolBatch:
+    """Run the signal and fill logic for every symbol of `data` at once"""
+    evaluator = evaluator or SignalEvaluator(data)
+    close = data.close
+
+    valid = ~np.isnan(close)
+    entry = evaluator.all_of(entry_conditions) & valid
+    exit = evaluator.any_of(exit_conditions) | ~valid
+    signal = positions_from_signals(entry, exit)
+
+    # Fill on the next bar: held[t] earns the close-to-close return of bar t
+    held = np.zeros_like(signal)
+    held[:, 1:] = signal[:, :-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = close / indicators.ffill(indicators.shift(close)) - 1.0
+    returns = np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+    turnover = np.zeros(close.shape)
+    turnover[:, 1:] = held[:, 1:] != held[:, :-1]
+    symbol_returns = held * returns - turnover * (cost_bps / 10000.0)
+
+    # Trades: runs of held bars, reduced with bincount over a running trade id
+    starts = held.copy()
+    starts[:, 1:] &= ~held[:, :-1]
+    trade_ids = np.cumsum(starts.ravel()) - 1
+    held_flat = held.ravel()
+    log_returns = np.log1p(symbol_returns.ravel()[held_flat])
+    trade_returns = np.expm1(np.bincount(trade_ids[held_flat], weights=log_returns, minlength=int(starts.sum())))
+
+    return SymbolBatch(
+        returns_sum=symbol_returns.sum(axis=0),
+        n_open=held.sum(axis=0),
+        trade_returns=trade_returns,
+    )
+
+
+class PortfolioBook:
+    """Combines symbol batches into the portfolio equity curve and metrics"""
+
+    def __init__(self, n_bars: int, n_symbols: int, position_sizing: Optional[Dict[str, Any]], initial_capital: float):
+        self.initial_capital = initial_capital
+        self.weight = _position_weight(position_sizing, n_symbols, initial_capital)
+        self.returns_sum = np.zeros(n_bars)
+        self.n_open = np.zeros(n_bars)
+        self._trades: List[np.ndarray] = []
+
+    def add(self, batch: SymbolBatch):
+        self.returns_sum += batch.returns_sum
+        self.n_open += batch.n_open
+        self._trades.append(batch.trade_returns)
+
+    def portfolio_returns(self) -> np.ndarray:
+        # Requested weight per position, scaled down when the book would be over 100% invested
+        bar_weight = np.minimum(self.weight, 1.0 / np.maximum(self.n_open, 1))
+        return self.returns_sum * bar_weight
+
+    def equity(self) -> np.ndarray:
+        return self.initial_capital * np.cumprod(1.0 + self.portfolio_returns())
+
+    def outcome(self, timestamps: np.ndarray, timeframe: str) -> BacktestOutcome:
+        initial_capital = self.initial_capital
+        n_bars = len(self.returns_sum)
+        portfolio_returns = self.portfolio_returns()
+        equity = initial_capital * np.cumprod(1.0 + portfolio_returns)
+        peak = np.maximum.accumulate(equity) if n_bars else equity
+        drawdown = equity / peak - 1.0 if n_bars else equity
+
+        trade_pnl = np.concatenate(self._trades) * initial_capital * self.weight if self._trades else np.empty(0)
+        n_trades = len(trade_pnl)
+        wins = trade_pnl[trade_pnl > 0]
+        gross_loss = -trade_pnl[trade_pnl < 0].sum()
+
+        final_equity = float(equity[-1]) if n_bars else initial_capital
+        bars_per_year = BARS_PER_YEAR.get(timeframe, 252)
+        if n_bars > 1:
+            span = (timestamps[-1] - timestamps[0]) / np.timedelta64(1, "D")
+            years = span / 365.25 if span > 0 else n_bars / bars_per_year
+        else:
+            years = 0.0
+        growth = final_equity / initial_capital
+        std = portfolio_returns.std() if n_bars else 0.0
+
+        return BacktestOutcome(
+            total_return=(growth - 1.0) * 100,
+            cagr=(growth ** (1.0 / years) - 1.0) * 100 if years > 0 and growth > 0 else 0.0,
+            max_drawdown=float(drawdown.min()) * 100 if n_bars else 0.0,
+            sharpe_ratio=float(portfolio_returns.mean() / std * math.sqrt(bars_per_year)) if std > 0 else 0.0,
+            win_rate=len(wins) / n_trades * 100 if n_trades else 0.0,
+            profit_factor=float(wins.sum() / gross_loss) if gross_loss > 0 else 0.0,
+            expectancy=float(trade_pnl.mean()) if n_trades else 0.0,
+            total_trades=n_trades,
+            timestamps=timestamps,
+            equity=equity,
+            drawdown=drawdown,
+            final_equity=final_equity,
+        )
+
+
+def run_backtest(
+    data: OHLCV,
+    entry_conditions: List[Dict[str, Any]],
+    exit_conditions: List[Dict[str, Any]],
+    position_sizing: Optional[Dict[str, Any]] = None,
+    initial_capital: float = 100000,
+    cost_bps: float = 0.0,
+    evaluator: Optional[SignalEvaluator] = None,
+) -> BacktestOutcome:
+    """Simulate a strategy over every symbol of `data` at once"""
+    n_symbols, n_bars = data.shape
+    book = PortfolioBook(n_bars, n_symbols, position_sizing, initial_capital)
+    book.add(simulate_symbols(data, entry_conditions, exit_conditions, cost_bps, evaluator))
+    return book.outcome(data.timestamps, data.timeframe)
+
+---
+
+# backend/app/services/equity_curve.py
+import json
+import struct
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# Backtest equity curves are stored per bar on BacktestResult as three raw
+# little-endian arrays (BYTEA): epoch seconds as int64, equity and drawdown
+# as float64. 24 bytes a bar, no JSON on the write path, and a read is a
+# zero-copy np.frombuffer. Charts ask for a few hundred to a few thousand
+# points, so curves are downsampled with LTTB (Largest-Triangle-Three-Buckets),
+# which keeps the peaks and troughs a fixed stride would skip.
+#
+# Served as NDJSON, a chunked JSON document, or the binary columnar layout
+#
+#   b"EQC1" | uint32 n | int64[n] timestamps | float64[n] equity | float64[n] drawdown
+#
+# all little-endian.
+
+BINARY_MAGIC = b"EQC1"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+CHUNK_ROWS = 2048  # Rows per streamed text chunk
+CHUNK_BYTES = 1 << 16
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the `threshold` points that best preserve the shape of y(x)"""
+    n = len(y)
+    if threshold <= 0 or threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:threshold])
+
+    x = x.astype(np.float64)
+    # Bucket edges over the interior points; first and last are always kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+@dataclass
+class EquityCurve:
+    timestamps: np.ndarray  # datetime64[s]
+    equity: np.ndarray
+    drawdown: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.equity)
+
+    @classmethod
+    def from_outcome(cls, outcome) -> "EquityCurve":
+        return cls(outcome.timestamps.astype("datetime64[s]"), outcome.equity, outcome.drawdown)
+
+    @classmethod
+    def from_result(cls, result) -> Optional["EquityCurve"]:
+        """None for results saved before curves were stored"""
+        if result.curve_equity is None:
+            return None
+        return cls(
+            np.frombuffer(result.curve_timestamps, dtype="<i8").view("datetime64[s]"),
+            np.frombuffer(result.curve_equity, dtype="<f8"),
+            np.frombuffer(result.curve_drawdown, dtype="<f8"),
+        )
+
+    def columns(self) -> Dict[str, bytes]:
+        """BacktestResult column values"""
+        return {
+            "curve_timestamps": self.timestamps.astype("datetime64[s]").view(np.int64).astype("<i8").tobytes(),
+            "curve_equity": np.asarray(self.equity, dtype="<f8").tobytes(),
+            "curve_drawdown": np.asarray(self.drawdown, dtype="<f8").tobytes(),
+        }
+
+    def downsample(self, points: int) -> "EquityCurve":
+        if points <= 0 or points >= len(self):
+            return self
+        # Drawdown is a function of equity, so equity's salient points carry it
+        idx = lttb(self.timestamps.view(np.int64), self.equity, points)
+        return EquityCurve(self.timestamps[idx], self.equity[idx], self.drawdown[idx])
+
+    def points(self) -> List[Dict[str, Any]]:
+        dates = np.datetime_as_string(self.timestamps, unit="s")
+        return [
+            {"date": d, "value": round(float(v), 2), "drawdown": round(float(dd) * 100, 4)}
+            for d, v, dd in zip(dates, self.equity, self.drawdown)
+        ]
+
+    # Streaming encoders
+
+    def _text_rows(self) -> Iterator[List[Dict[str, Any]]]:
+        for start in range(0, len(self), CHUNK_ROWS):
+            chunk = EquityCurve(*(a[start:start + CHUNK_ROWS] for a in (self.timestamps, self.equity, self.drawdown)))
+            yield chunk.points()
+
+    def ndjson(self) -> Iterator[bytes]:
+        for rows in self._text_rows():
+            yield "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+    def json(self, head: Dict[str, Any]) -> Iterator[bytes]:
+        """One JSON document, `head` fields followed by "equity_curve", sent in chunks"""
+        prefix = json.dumps(head)[:-1] + (", " if head else "")
+        yield (prefix + '"equity_curve": [').encode()
+        first = True
+        for rows in self._text_rows():
+            body = ", ".join(json.dumps(row) for row in rows)
+            yield (body if first else ", " + body).encode()
+            first = False
+        yield b"]}"
+
+    def binary(self) -> Iterator[bytes]:
+        yield BINARY_MAGIC + struct.pack("<I", len(self))
+        for blob in self.columns().values():
+            view = memoryview(blob)
+            for start in range(0, len(view), CHUNK_BYTES):
+                yield bytes(view[start:start + CHUNK_BYTES])
+
+
+def decode_binary(payload: bytes) -> EquityCurve:
+    """Inverse of EquityCurve.binary(), for clients and tests"""
+    if payload[:4] != BINARY_MAGIC:
+        raise ValueError("Not an equity curve payload")
+    (n,) = struct.unpack_from("<I", payload, 4)
+    body = memoryview(payload)[8:]
+    timestamps = np.frombuffer(body, dtype="<i8", count=n).view("datetime64[s]")
+    equity = np.frombuffer(body, dtype="<f8", count=n, offset=8 * n)
+    drawdown = np.frombuffer(body, dtype="<f8", count=n, offset=16 * n)
+    return EquityCurve(timestamps, equity, drawdown)
+
+---
+
+# backend/app/services/backtest_sweep.py
+import copy
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.backtest_service import SignalEvaluator, SymbolBatch, run_backtest, simulate_symbols
+from app.services.equity_curve import EquityCurve
+from app.services.market_data import OHLCV
+
+# A sweep runs one strategy many times with parameter overrides. The grid maps
+# a dotted path into the strategy config to the values to try, e.g.
+#
+#   {"entry_conditions.0.params.period": [10, 20, 50], "position_sizing.percent": [5, 10]}
+#
+# OHLCV matrices are copied once into a shared memory block; workers map it
+# read-only, so tasks only carry the variant configs.
+
+SWEEP_FIELDS = ("open", "high", "low", "close", "volume")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+@dataclass(frozen=True)
+class PanelDescriptor:
+    name: str
+    n_symbols: int
+    n_bars: int
+    timeframe: str
+
+
+class SharedPanel:
+    """OHLCV matrices and timestamps laid out in one shared memory segment"""
+
+    def __init__(self, data: OHLCV):
+        n_symbols, n_bars = data.shape
+        size = (len(SWEEP_FIELDS) * n_symbols + 1) * n_bars * 8
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 8))
+        panel, timestamps = _views(self._shm.buf, n_symbols, n_bars)
+        for i, name in enumerate(SWEEP_FIELDS):
+            panel[i] = getattr(data, name)
+        timestamps[:] = data.timestamps.astype("datetime64[s]").view(np.int64)
+        self.descriptor = PanelDescriptor(self._shm.name, n_symbols, n_bars, data.timeframe)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _views(buf, n_symbols: int, n_bars: int) -> Tuple[np.ndarray, np.ndarray]:
+    panel = np.ndarray((len(SWEEP_FIELDS), n_symbols, n_bars), dtype=np.float64, buffer=buf)
+    timestamps = np.ndarray((n_bars,), dtype=np.int64, buffer=buf, offset=panel.nbytes)
+    return panel, timestamps
+
+
+# Worker-side state: the attached segment and an indicator cache that is reused
+# across every variant this worker runs on the same panel
+_attached: Dict[str, Any] = {}
+
+
+def _attach(descriptor: PanelDescriptor) -> SignalEvaluator:
+    current = _attached.get("descriptor")
+    if current != descriptor:
+        if current is not None:
+            _attached["shm"].close()
+        shm = shared_memory.SharedMemory(name=descriptor.name)
+        panel, timestamps = _views(shm.buf, descriptor.n_symbols, descriptor.n_bars)
+        panel.flags.writeable = False
+        data = OHLCV(
+            symbols=[],
+            timeframe=descriptor.timeframe,
+            timestamps=timestamps.view("datetime64[s]"),
+            **{name: panel[i] for i, name in enumerate(SWEEP_FIELDS)},
+        )
+        _attached.update(descriptor=descriptor, shm=shm, evaluator=SignalEvaluator(data))
+    elif len(_attached["evaluator"]) > settings.BACKTEST_SWEEP_CACHE_SIZE:
+        _attached["evaluator"] = SignalEvaluator(_attached["evaluator"].data)
+    return _attached["evaluator"]
+
+
+def _run_chunk(
+    descriptor: PanelDescriptor,
+    variants: List[Tuple[int, Dict[str, Any]]],
+    initial_capital: float,
+    cost_bps: float,
+) -> List[Tuple[int, Dict[str, Any]]]:
+    evaluator = _attach(descriptor)
+    results = []
+    for index, config in variants:
+        try:
+            outcome = run_backtest(
+                evaluator.data,
+                config.get("entry_conditions") or [],
+                config.get("exit_conditions") or [],
+                position_sizing=config.get("position_sizing"),
+                initial_capital=initial_capital,
+                cost_bps=cost_bps,
+                evaluator=evaluator,
+            )
+        except ValueError as e:
+            results.append((index, {"error": str(e)}))
+            continue
+        results.append((index, {
+            **outcome.metrics(),
+            "total_trades": outcome.total_trades,
+            "curve": EquityCurve.from_outcome(outcome).columns(),
+        }))
+    return results
+
+
+def simulate_rows(
+    descriptor: PanelDescriptor,
+    start: int,
+    stop: int,
+    entry_conditions: List[Dict[str, Any]],
+    exit_conditions: List[Dict[str, Any]],
+    cost_bps: float,
+) -> SymbolBatch:
+    """Simulate one slice of the universe; used by backtest jobs to report progress"""
+    data = _attach(descriptor).data.rows(start, stop)
+    return simulate_symbols(data, entry_conditions, exit_conditions, cost_bps)
+
+
+def _set_path(config: Dict[str, Any], path: str, value: Any):
+    keys = path.split(".")
+    target = config
+    for key in keys[:-1]:
+        target = target[int(key)] if isinstance(target, list) else target.setdefault(key, {})
+    last = keys[-1]
+    if isinstance(target, list):
+        target[int(last)] = value
+    else:
+        target[last] = value
+
+
+def expand_grid(base: Dict[str, Any], grid: Dict[str, List[Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Cartesian product of the grid, as (overrides, full strategy config) pairs"""
+    paths = list(grid)
+    variants = []
+    for values in itertools.product(*(grid[path] for path in paths)):
+        overrides = dict(zip(paths, values))
+        config = copy.deepcopy(base)
+        for path, value in overrides.items():
+            try:
+                _set_path(config, path, value)
+            except (IndexError, KeyError, ValueError, TypeError):
+                raise ValueError(f"Invalid grid path: {path}")
+        variants.append((overrides, config))
+    return variants
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.BACKTEST_WORKERS or os.cpu_count())
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def run_sweep(
+    data: OHLCV,
+    configs: List[Dict[str, Any]],
+    initial_capital: float = 100000,
+    cost_bps: float = 0.0,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> List[Dict[str, Any]]:
+    """Run every strategy config over `data` on the process pool; results keep input order"""
+    pool = pool or get_pool()
+    workers = pool._max_workers
+    # Contiguous chunks keep neighbouring grid points (which share most
+    # indicators) on the same worker's cache
+    chunk_size = max(1, -(-len(configs) // (workers * 4)))
+    indexed = list(enumerate(configs))
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(configs)
+    with SharedPanel(data) as shared:
+        futures = [
+            pool.submit(_run_chunk, shared.descriptor, chunk, initial_capital, cost_bps)
+            for chunk in chunks
+        ]
+        for future in futures:
+            for index, metrics in future.result():
+                results[index] = metrics
+    return results
+
+---
+
+# backend/app/services/backtest_jobs.py
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import BacktestResult, Strategy
+from app.database.session import AsyncSessionLocal
+from app.services.backtest_service import PortfolioBook
+from app.services.backtest_sweep import SharedPanel, get_pool, simulate_rows
+from app.services.equity_curve import EquityCurve
+from app.services.market_data import OHLCV
+from app.services.ohlcv_store import ohlcv_store
+
+logger = logging.getLogger(__name__)
+
+# Job state lives in Redis so any API worker can report on it:
+#   backtest:job:{id}          hash: status, progress, user_id, backtest_id, error, ...
+#   backtest:job:{id}:equity   JSON partial equity curve
+#   backtest:job:{id}:events   pub/sub channel with progress and status events
+# Scheduling is local to the API worker that accepted the job.
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+TERMINAL = (COMPLETED, FAILED, CANCELLED)
+
+
+def job_key(job_id: str) -> str:
+    return f"backtest:job:{job_id}"
+
+
+def curve_key(job_id: str) -> str:
+    return f"backtest:job:{job_id}:equity"
+
+
+def events_channel(job_id: str) -> str:
+    return f"backtest:job:{job_id}:events"
+
+
+class JobLimitError(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class BacktestJob:
+    id: str
+    user_id: int
+    strategy_id: int
+    config: Dict[str, Any]  # Strategy conditions snapshotted at submit time
+    params: Dict[str, Any]  # start_date, end_date, timeframe, symbols, initial_capital, cost_bps
+    done: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    task: Optional[asyncio.Task] = None
+
+
+def _decode(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+    status = {k.decode(): v.decode() for k, v in raw.items()}
+    for key in ("metrics",):
+        if key in status:
+            status[key] = json.loads(status[key])
+    for key in ("user_id", "strategy_id", "backtest_id", "total_trades", "symbols"):
+        if key in status:
+            status[key] = int(status[key])
+    for key in ("progress", "final_equity"):
+        if key in status:
+            status[key] = float(status[key])
+    return status
+
+
+async def _load_strategy(strategy_id: int) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as db:
+        strategy = await db.get(Strategy, strategy_id)
+        if not strategy:
+            return None
+        return {
+            "user_id": strategy.user_id,
+            "entry_conditions": strategy.entry_conditions or [],
+            "exit_conditions": strategy.exit_conditions or [],
+            "position_sizing": strategy.position_sizing or {},
+        }
+
+
+async def _load_data(params: Dict[str, Any]) -> OHLCV:
+    return await run_in_threadpool(
+        ohlcv_store.load, params["timeframe"], params["start_date"], params["end_date"], params.get("symbols")
+    )
+
+
+async def _save_result(job: BacktestJob, metrics: Dict[str, float], curve: EquityCurve) -> int:
+    async with AsyncSessionLocal() as db:
+        result = BacktestResult(
+            strategy_id=job.strategy_id,
+            **metrics,
+            **curve.columns(),
+            start_date=job.params["start_date"],
+            end_date=job.params["end_date"],
+        )
+        db.add(result)
+        await db.commit()
+        return result.id
+
+
+def curve_points(timestamps: np.ndarray, equity: np.ndarray, max_points: int) -> List[Dict[str, Any]]:
+    step = max(1, -(-len(equity) // max_points))
+    idx = np.arange(0, len(equity), step)
+    if len(equity) and idx[-1] != len(equity) - 1:
+        idx = np.append(idx, len(equity) - 1)
+    dates = np.datetime_as_string(timestamps[idx], unit="s")
+    return [{"date": d, "value": round(float(v), 2)} for d, v in zip(dates, equity[idx])]
+
+
+class BacktestJobQueue:
+    """Bounded, per-user round-robin scheduler for backtest jobs"""
+
+    def __init__(
+        self,
+        max_concurrent: int = settings.BACKTEST_MAX_CONCURRENT_JOBS,
+        max_running_per_user: int = settings.BACKTEST_MAX_RUNNING_PER_USER,
+        max_queued_per_user: int = settings.BACKTEST_MAX_QUEUED_PER_USER,
+        batch_symbols: int = settings.BACKTEST_JOB_BATCH_SYMBOLS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_running_per_user = max_running_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self.batch_symbols = batch_symbols
+
+        self._queues: Dict[int, Deque[BacktestJob]] = {}
+        self._turns: Deque[int] = deque()  # Users with queued jobs, in round-robin order
+        self._jobs: Dict[str, BacktestJob] = {}
+        self._running: Dict[int, int] = {}
+        self._running_total = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        for job in list(self._jobs.values()):
+            if job.task:
+                job.task.cancel()
+            else:
+                await self._finish(job, CANCELLED, error="Server shutting down")
+        await asyncio.gather(*(job.task for job in self._jobs.values() if job.task), return_exceptions=True)
+
+    # Public API
+
+    async def submit(self, strategy_id: int, params: Dict[str, Any]) -> str:
+        config = await _load_strategy(strategy_id)
+        if config is None:
+            raise LookupError("Strategy not found")
+
+        user_id = config.pop("user_id")
+        queue = self._queues.setdefault(user_id, deque())
+        if len(queue) >= self.max_queued_per_user:
+            raise JobLimitError(f"At most {self.max_queued_per_user} queued backtests per user")
+
+        job = BacktestJob(uuid.uuid4().hex, user_id, strategy_id, config, params)
+        self._jobs[job.id] = job
+        await self._update(job, status=QUEUED, progress=0, user_id=user_id, strategy_id=strategy_id,
+                           created_at=datetime.utcnow().isoformat())
+
+        if not queue and user_id not in self._turns:
+            self._turns.append(user_id)
+        queue.append(job)
+        self._wakeup.set()
+        return job.id
+
+    async def result(self, job_id: str) -> Dict[str, Any]:
+        """Wait for a job accepted by this worker and return its final status"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            await asyncio.shield(job.done)
+        return await self.status(job_id)
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await get_redis().hgetall(job_key(job_id))
+        return _decode(raw) if raw else None
+
+    async def equity_curve(self, job_id: str) -> Optional[List[Dict[str, Any]]]:
+        raw = await get_redis().get(curve_key(job_id))
+        return json.loads(raw) if raw else None
+
+    async def cancel(self, job_id: str) -> bool:
+        status = await self.status(job_id)
+        if status is None or status["status"] in TERMINAL:
+            return False
+
+        # The flag reaches jobs running in other API workers between batches
+        await get_redis().hset(job_key(job_id), "cancel_requested", 1)
+        job = self._jobs.get(job_id)
+        if job is not None and job.task is not None:
+            job.task.cancel()
+        elif job is not None:
+            queue = self._queues.get(job.user_id)
+            if queue and job in queue:
+                queue.remove(job)
+            await self._finish(job, CANCELLED)
+        return True
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Current status followed by live events until the job finishes"""
+        redis = get_redis()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(events_channel(job_id))
+        try:
+            status = await self.status(job_id)
+            if status is None:
+                return
+            yield status
+            if status["status"] in TERMINAL:
+                return
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=15.0)
+                if message is None:
+                    # Keep-alive, and a fallback if the terminal event was missed
+                    status = await self.status(job_id)
+                    if status is None or status["status"] in TERMINAL:
+                        if status:
+                            yield status
+                        return
+                    yield {"status": status["status"], "progress": status["progress"]}
+                    continue
+                event = json.loads(message["data"])
+                yield event
+                if event.get("status") in TERMINAL:
+                    return
+        finally:
+            await pubsub.aclose()
+
+    # Scheduling
+
+    def _next_job(self) -> Optional[BacktestJob]:
+        for _ in range(len(self._turns)):
+            user_id = self._turns.popleft()
+            queue = self._queues.get(user_id)
+            if not queue:
+                continue
+            if self._running.get(user_id, 0) >= self.max_running_per_user:
+                self._turns.append(user_id)
+                continue
+            job = queue.popleft()
+            if queue:
+                self._turns.append(user_id)
+            return job
+        return None
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._running_total < self.max_concurrent:
+                job = self._next_job()
+                if job is None:
+                    break
+                self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+                self._running_total += 1
+                job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: BacktestJob):
+        try:
+            await self._execute(job)
+        except (JobCancelled, asyncio.CancelledError):
+            await self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.exception("Backtest job %s failed", job.id)
+            await self._finish(job, FAILED, error=str(e))
+        finally:
+            self._running[job.user_id] -= 1
+            self._running_total -= 1
+            self._wakeup.set()
+
+    async def _execute(self, job: BacktestJob):
+        redis = get_redis()
+        await self._update(job, status=RUNNING, started_at=datetime.utcnow().isoformat())
+
+        data = await _load_data(job.params)
+        if not data.symbols:
+            await self._finish(job, FAILED, error="No market data for the requested period")
+            return
+
+        n_symbols, n_bars = data.shape
+        book = PortfolioBook(n_bars, n_symbols, job.config["position_sizing"], job.params["initial_capital"])
+        loop = asyncio.get_running_loop()
+        pool = get_pool()
+
+        with SharedPanel(data) as shared:
+            batches = range(0, n_symbols, self.batch_symbols)
+            for done, start in enumerate(batches, start=1):
+                if await redis.hget(job_key(job.id), "cancel_requested"):
+                    raise JobCancelled()
+                batch = await loop.run_in_executor(
+                    pool,
+                    simulate_rows,
+                    shared.descriptor,
+                    start,
+                    min(start + self.batch_symbols, n_symbols),
+                    job.config["entry_conditions"],
+                    job.config["exit_conditions"],
+                    job.params["cost_bps"],
+                )
+                book.add(batch)
+
+                # Partial curve: the portfolio over the symbols simulated so far
+                progress = round(done / len(batches) * 100, 1)
+                curve = curve_points(data.timestamps, book.equity(), settings.BACKTEST_JOB_CURVE_POINTS)
+                await redis.set(curve_key(job.id), json.dumps(curve), ex=settings.BACKTEST_JOB_TTL)
+                await self._update(job, progress=progress)
+                await redis.publish(events_channel(job.id), json.dumps(
+                    {"status": RUNNING, "progress": progress, "equity_curve": curve}
+                ))
+
+        outcome = book.outcome(data.timestamps, data.timeframe)
+        metrics = outcome.metrics()
+        backtest_id = await _save_result(job, metrics, EquityCurve.from_outcome(outcome))
+        await self._finish(
+            job,
+            COMPLETED,
+            progress=100,
+            backtest_id=backtest_id,
+            metrics=json.dumps(metrics),
+            total_trades=outcome.total_trades,
+            final_equity=outcome.final_equity,
+            symbols=n_symbols,
+        )
+
+    async def _update(self, job: BacktestJob, **fields):
+        redis = get_redis()
+        await redis.hset(job_key(job.id), mapping={k: v for k, v in fields.items() if v is not None})
+        await redis.expire(job_key(job.id), settings.BACKTEST_JOB_TTL)
+
+    async def _finish(self, job: BacktestJob, status: str, **fields):
+        await self._update(job, status=status, finished_at=datetime.utcnow().isoformat(), **fields)
+        event = {"status": status, **fields}
+        if "metrics" in event:
+            event["metrics"] = json.loads(event["metrics"])
+        await get_redis().publish(events_channel(job.id), json.dumps(event))
+        self._jobs.pop(job.id, None)
+        if not job.done.done():
+            job.done.set_result(status)
+
+
+job_queue = BacktestJobQueue()
+
+---
+
+# backend/benchmarks/bench_backtest.py
+# Usage: python -m benchmarks.bench_backtest [--symbols 500] [--years 5]
+import argparse
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.backtest_service import run_backtest
+from app.services.market_data import OHLCV
+
+ENTRY = [
+    {"type": "indicator", "params": {"indicator": "ema", "period": 20, "operator": "crosses_above",
+                                     "compare": {"indicator": "ema", "period": 50}}},
+    {"type": "indicator", "params": {"indicator": "rsi", "period": 14, "operator": "<", "value": 70}},
+]
+EXIT = [
+    {"type": "indicator", "params": {"indicator": "ema", "period": 20, "operator": "crosses_below",
+                                     "compare": {"indicator": "ema", "period": 50}}},
+    {"type": "price_action", "params": {"field": "close", "operator": "<",
+                                        "compare": {"indicator": "lowest", "period": 20}}},
+]
+
+
+def synthetic_ohlcv(n_symbols: int, n_bars: int, seed: int = 7) -> OHLCV:
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(0.0004, 0.018, size=(n_symbols, n_bars))
+    close = 100.0 * np.exp(np.cumsum(log_returns, axis=1))
+    spread = np.abs(rng.normal(0, 0.01, size=close.shape))
+    timestamps = np.datetime64("2019-01-01") + np.arange(n_bars) * np.timedelta64(1, "D")
+    return OHLCV(
+        symbols=[f"SYM{i}" for i in range(n_symbols)],
+        timeframe="1d",
+        timestamps=timestamps.astype("datetime64[s]"),
+        open=close * (1 + rng.normal(0, 0.005, size=close.shape)),
+        high=close * (1 + spread),
+        low=close * (1 - spread),
+        close=close,
+        volume=rng.integers(10_000, 1_000_000, size=close.shape).astype(np.float64),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--years", type=int, default=settings.BACKTEST_YEARS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = synthetic_ohlcv(args.symbols, args.years * 252)
+    run_backtest(data, ENTRY, EXIT)  # warm-up
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        outcome = run_backtest(data, ENTRY, EXIT, cost_bps=5)
+        timings.append(time.perf_counter() - start)
+
+    print(f"{args.symbols} symbols x {data.close.shape[1]} bars")
+    print(f"best {min(timings) * 1000:.1f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms")
+    print(f"trades={outcome.total_trades} metrics={outcome.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/bench_sweep.py
+# Usage: python -m benchmarks.bench_sweep [--variants 96] [--symbols 500]
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.config import settings
+from app.services.backtest_sweep import expand_grid, run_sweep
+from benchmarks.bench_backtest import ENTRY, EXIT, synthetic_ohlcv
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--years", type=int, default=settings.BACKTEST_YEARS)
+    parser.add_argument("--variants", type=int, default=96)
+    args = parser.parse_args()
+
+    data = synthetic_ohlcv(args.symbols, args.years * 252)
+    base = {"entry_conditions": ENTRY, "exit_conditions": EXIT, "position_sizing": {"method": "percent_equity"}}
+    grid = {
+        "entry_conditions.0.params.period": list(range(10, 10 + max(1, args.variants // 8))),
+        "position_sizing.percent": [1, 2, 5, 10],
+        "entry_conditions.1.params.value": [60, 70],
+    }
+    configs = [config for _, config in expand_grid(base, grid)]
+
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+    baseline = None
+    for workers in worker_counts:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            run_sweep(data, configs[:workers], pool=pool)  # spawn and warm workers
+            start = time.perf_counter()
+            run_sweep(data, configs, pool=pool)
+            elapsed = time.perf_counter() - start
+        throughput = len(configs) / elapsed
+        baseline = baseline or throughput
+        print(
+            f"workers={workers:2d} runs={len(configs)} {elapsed:6.2f}s "
+            f"{throughput:7.1f} runs/s speedup={throughput / baseline:4.2f}x "
+            f"efficiency={throughput / baseline / workers:4.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
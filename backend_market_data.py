@@ -0,0 +1,1641 @@
+# backend/app/services/market_data.py
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database.models import MarketData
+
+
+@dataclass
+class OHLCV:
+    """Aligned (symbols, bars) price matrices; missing bars are NaN"""
+    symbols: List[str]
+    timeframe: str
+    timestamps: np.ndarray  # datetime64[s], shape (bars,)
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @property
+    def shape(self):
+        return self.close.shape
+
+    def rows(self, start: int, stop: int) -> "OHLCV":
+        """Zero-copy view of a contiguous range of symbols"""
+        return OHLCV(
+            symbols=self.symbols[start:stop],
+            timeframe=self.timeframe,
+            timestamps=self.timestamps,
+            open=self.open[start:stop],
+            high=self.high[start:stop],
+            low=self.low[start:stop],
+            close=self.close[start:stop],
+            volume=self.volume[start:stop],
+        )
+
+
+def pivot_bars(
+    symbols: np.ndarray,
+    timestamps: np.ndarray,
+    columns: np.ndarray,
+    timeframe: str,
+) -> OHLCV:
+    """Scatter long-format bars (one row per symbol/timestamp) into OHLCV matrices"""
+    symbol_names, symbol_idx = np.unique(symbols, return_inverse=True)
+    bar_times, bar_idx = np.unique(timestamps.astype("datetime64[s]"), return_inverse=True)
+
+    panel = np.full((5, len(symbol_names), len(bar_times)), np.nan)
+    panel[:, symbol_idx, bar_idx] = columns.T
+
+    return OHLCV(
+        symbols=[str(s) for s in symbol_names],
+        timeframe=timeframe,
+        timestamps=bar_times,
+        open=panel[0],
+        high=panel[1],
+        low=panel[2],
+        close=panel[3],
+        volume=panel[4],
+    )
+
+
+def load_ohlcv(
+    db: Session,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+    symbols: Optional[List[str]] = None,
+) -> OHLCV:
+    """Load bars from market_data_cache for a date range"""
+    query = db.query(
+        MarketData.symbol,
+        MarketData.timestamp,
+        MarketData.open,
+        MarketData.high,
+        MarketData.low,
+        MarketData.close,
+        MarketData.volume,
+    ).filter(
+        (MarketData.timeframe == timeframe)
+        & (MarketData.timestamp >= start)
+        & (MarketData.timestamp <= end)
+    )
+    if symbols:
+        query = query.filter(MarketData.symbol.in_(symbols))
+
+    rows = query.all()
+    if not rows:
+        empty = np.empty((0, 0))
+        return OHLCV([], timeframe, np.empty(0, dtype="datetime64[s]"), empty, empty, empty, empty, empty)
+
+    symbol_col, time_col, *price_cols = zip(*rows)
+    columns = np.array(price_cols, dtype=object)
+    columns = np.where(columns == None, np.nan, columns).astype(np.float64).T  # noqa: E711
+    return pivot_bars(
+        np.array(symbol_col),
+        np.array(time_col, dtype="datetime64[s]"),
+        columns,
+        timeframe,
+    )
+
+
+def load_ohlcv_by_month(
+    db: Session,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+    symbols: Optional[List[str]] = None,
+) -> Iterator[OHLCV]:
+    """Load a long date range one calendar month per query, oldest first
+
+    market_data_cache is partitioned by month, so each query reads a single
+    partition and only one month of bars is held in memory at a time.
+    """
+    month = datetime(start.year, start.month, 1)
+    while month <= end:
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        data = load_ohlcv(db, timeframe, max(start, month), min(end, following - timedelta(microseconds=1)), symbols)
+        if data.symbols:
+            yield data
+        month = following
+
+
+def bar_range(db: Session, timeframe: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Oldest and newest stored bar timestamps of a timeframe"""
+    return db.query(func.min(MarketData.timestamp), func.max(MarketData.timestamp)).filter(
+        MarketData.timeframe == timeframe
+    ).one()
+
+---
+
+# backend/app/services/ohlcv_store.py
+import fcntl
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.market_data import OHLCV
+
+logger = logging.getLogger(__name__)
+
+# On-disk layout, one directory per series:
+#
+#   {root}/{timeframe}/{symbol}/CURRENT        name of the live version directory
+#   {root}/{timeframe}/{symbol}/v000001/ts     int64 epoch seconds, strictly increasing
+#                                      open    float32, likewise high/low/close
+#                                      volume  int64
+#                                      pending.*  late or corrected bars awaiting compaction
+#
+# Bars newer than the last stored bar are appended in place, so a reader can
+# memory-map the columns and slice them without copying. Anything else goes to
+# the pending log; compaction merges it into a new version directory and
+# switches CURRENT atomically, so readers never see a half-written series.
+
+COLUMNS: Dict[str, np.dtype] = {
+    "ts": np.dtype(np.int64),
+    "open": np.dtype(np.float32),
+    "high": np.dtype(np.float32),
+    "low": np.dtype(np.float32),
+    "close": np.dtype(np.float32),
+    "volume": np.dtype(np.int64),
+}
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+@dataclass
+class Bars:
+    """One series; arrays are read-only views into the mapped files when possible"""
+    symbol: str
+    timeframe: str
+    ts: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+def to_epoch(value) -> int:
+    if isinstance(value, datetime):
+        return int(np.datetime64(value.replace(tzinfo=None), "s").astype(np.int64))
+    return int(value)
+
+
+def _as_epoch_array(timestamps) -> np.ndarray:
+    array = np.asarray(timestamps)
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype("datetime64[s]").astype(np.int64)
+    if array.dtype == object:
+        return np.array([to_epoch(t) for t in array], dtype=np.int64)
+    return array.astype(np.int64)
+
+
+def _dedupe_last(ts: np.ndarray, columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Sort by time and keep the last written bar for each timestamp"""
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    keep = np.ones(len(ts), dtype=bool)
+    keep[:-1] = ts[1:] != ts[:-1]
+    return ts[keep], {name: col[order][keep] for name, col in columns.items()}
+
+
+class _Series:
+    def __init__(self, path: str):
+        self.path = path
+        self._maps: Dict[str, np.memmap] = {}
+        self._version: Optional[str] = None
+
+    def version_dir(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                return os.path.join(self.path, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def _length(self, directory: str, prefix: str = "") -> int:
+        lengths = []
+        for name, dtype in COLUMNS.items():
+            try:
+                lengths.append(os.path.getsize(os.path.join(directory, prefix + name)) // dtype.itemsize)
+            except FileNotFoundError:
+                return 0
+        # Columns are appended one after another; a torn write leaves some longer
+        return min(lengths)
+
+    def columns(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        """Read-only views of every column, remapped when the files have grown"""
+        directory = self.version_dir()
+        if directory is None:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        if directory != self._version:
+            self._maps = {}
+            self._version = directory
+
+        n = self._length(directory, prefix)
+        out = {}
+        for name, dtype in COLUMNS.items():
+            key = prefix + name
+            mapped = self._maps.get(key)
+            if n == 0:
+                out[name] = np.empty(0, dtype)
+                continue
+            if mapped is None or len(mapped) < n:
+                mapped = np.memmap(os.path.join(directory, key), dtype=dtype, mode="r")
+                self._maps[key] = mapped
+            out[name] = mapped[:n]
+        return out
+
+
+class OHLCVStore:
+    def __init__(self, root: str = settings.OHLCV_STORE_PATH):
+        self.root = root
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, symbol: str, timeframe: str) -> _Series:
+        key = (symbol, timeframe)
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = _Series(os.path.join(self.root, timeframe, symbol))
+            return self._series[key]
+
+    @contextmanager
+    def _writer(self, symbol: str, timeframe: str):
+        """Exclusive, cross-process write access to one series"""
+        path = os.path.join(self.root, timeframe, symbol)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "LOCK"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                series = self._get_series(symbol, timeframe)
+                directory = series.version_dir()
+                if directory is None:
+                    directory = self._new_version(path, 1)
+                    self._switch(path, directory)
+                self._repair(series, directory)
+                yield series, directory
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _new_version(self, path: str, number: int) -> str:
+        directory = os.path.join(path, f"v{number:06d}")
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            open(os.path.join(directory, name), "ab").close()
+        return directory
+
+    def _switch(self, path: str, directory: str):
+        tmp = os.path.join(path, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(os.path.basename(directory))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, "CURRENT"))
+
+    def _repair(self, series: _Series, directory: str):
+        # Trim columns left uneven by an interrupted append
+        for prefix in ("", "pending."):
+            n = series._length(directory, prefix)
+            for name, dtype in COLUMNS.items():
+                file = os.path.join(directory, prefix + name)
+                if os.path.exists(file) and os.path.getsize(file) != n * dtype.itemsize:
+                    os.truncate(file, n * dtype.itemsize)
+
+    def _write(self, directory: str, prefix: str, ts: np.ndarray, columns: Dict[str, np.ndarray]):
+        # ts goes last: a reader never sees a timestamp without its prices
+        for name in PRICE_COLUMNS + ("ts",):
+            values = ts if name == "ts" else columns[name]
+            with open(os.path.join(directory, prefix + name), "ab") as f:
+                f.write(np.ascontiguousarray(values, dtype=COLUMNS[name]).tobytes())
+
+    # Writes
+
+    def append(self, symbol: str, timeframe: str, timestamps, open, high, low, close, volume) -> int:
+        """Append bars; returns how many landed in the mapped columns (the rest wait for compaction)"""
+        ts = _as_epoch_array(timestamps)
+        if len(ts) == 0:
+            return 0
+        columns = {
+            "open": np.asarray(open, dtype=np.float32),
+            "high": np.asarray(high, dtype=np.float32),
+            "low": np.asarray(low, dtype=np.float32),
+            "close": np.asarray(close, dtype=np.float32),
+            "volume": np.nan_to_num(np.asarray(volume, dtype=np.float64)).astype(np.int64),
+        }
+        ts, columns = _dedupe_last(ts, columns)
+
+        with self._writer(symbol, timeframe) as (series, directory):
+            current = series.columns()["ts"]
+            last = current[-1] if len(current) else np.iinfo(np.int64).min
+            fresh = ts > last
+            if fresh.any():
+                self._write(directory, "", ts[fresh], {k: v[fresh] for k, v in columns.items()})
+            if not fresh.all():
+                late = ~fresh
+                self._write(directory, "pending.", ts[late], {k: v[late] for k, v in columns.items()})
+            return int(fresh.sum())
+
+    def compact(self, symbol: str, timeframe: str) -> bool:
+        """Merge pending bars into a fresh version; returns False when there was nothing to do"""
+        with self._writer(symbol, timeframe) as (series, directory):
+            pending = series.columns("pending.")
+            if len(pending["ts"]) == 0:
+                return False
+
+            main = series.columns()
+            ts = np.concatenate([main["ts"], pending["ts"]])
+            merged = {name: np.concatenate([main[name], pending[name]]) for name in PRICE_COLUMNS}
+            ts, merged = _dedupe_last(ts, merged)
+
+            path = os.path.dirname(directory)
+            number = int(os.path.basename(directory)[1:]) + 1
+            new_directory = self._new_version(path, number)
+            self._write(new_directory, "", ts, merged)
+            for name in COLUMNS:
+                with open(os.path.join(new_directory, name), "rb+") as f:
+                    os.fsync(f.fileno())
+            self._switch(path, new_directory)
+
+        # Open maps of the old version stay valid after the unlink
+        shutil.rmtree(directory, ignore_errors=True)
+        logger.info("Compacted %s %s: %d bars", symbol, timeframe, len(ts))
+        return True
+
+    def compact_all(self, timeframes: Optional[Iterable[str]] = None) -> int:
+        compacted = 0
+        for timeframe in timeframes or self.timeframes():
+            for symbol in self.symbols(timeframe):
+                compacted += self.compact(symbol, timeframe)
+        return compacted
+
+    # Reads
+
+    def timeframes(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def symbols(self, timeframe: str) -> List[str]:
+        path = os.path.join(self.root, timeframe)
+        if not os.path.isdir(path):
+            return []
+        return sorted(d for d in os.listdir(path) if os.path.exists(os.path.join(path, d, "CURRENT")))
+
+    def read(self, symbol: str, timeframe: str, start=None, end=None) -> Bars:
+        """Bars in [start, end]; zero-copy unless uncompacted late bars overlap the series"""
+        series = self._get_series(symbol, timeframe)
+        columns = series.columns()
+        pending = series.columns("pending.")
+        if len(pending["ts"]):
+            ts = np.concatenate([columns["ts"], pending["ts"]])
+            merged = {name: np.concatenate([columns[name], pending[name]]) for name in PRICE_COLUMNS}
+            ts, merged = _dedupe_last(ts, merged)
+            columns = {"ts": ts, **merged}
+
+        ts = columns["ts"]
+        lo = 0 if start is None else int(np.searchsorted(ts, to_epoch(start), side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, to_epoch(end), side="right"))
+        return Bars(symbol, timeframe, **{name: col[lo:hi] for name, col in columns.items()})
+
+    def load(self, timeframe: str, start=None, end=None, symbols: Optional[List[str]] = None) -> OHLCV:
+        """Aligned float64 panel across symbols for the backtest engine and scanner"""
+        names = symbols or self.symbols(timeframe)
+        series = [bars for bars in (self.read(s, timeframe, start, end) for s in names) if len(bars)]
+        if not series:
+            empty = np.empty((0, 0))
+            return OHLCV([], timeframe, np.empty(0, dtype="datetime64[s]"), empty, empty, empty, empty, empty)
+
+        timeline = np.unique(np.concatenate([bars.ts for bars in series]))
+        panel = np.full((len(PRICE_COLUMNS), len(series), len(timeline)), np.nan)
+        for row, bars in enumerate(series):
+            idx = np.searchsorted(timeline, bars.ts)
+            for i, name in enumerate(PRICE_COLUMNS):
+                panel[i, row, idx] = getattr(bars, name)
+
+        return OHLCV(
+            symbols=[bars.symbol for bars in series],
+            timeframe=timeframe,
+            timestamps=timeline.astype("datetime64[s]"),
+            **{name: panel[i] for i, name in enumerate(PRICE_COLUMNS)},
+        )
+
+
+ohlcv_store = OHLCVStore()
+
+
+def import_from_db(timeframe: str, symbols: Optional[List[str]] = None) -> int:
+    """Copy bars from the market_data_cache table into the store, a month at a time"""
+    from app.database.session import SessionLocal
+    from app.services.market_data import bar_range, load_ohlcv_by_month
+
+    written = 0
+    with SessionLocal() as db:
+        first, last = bar_range(db, timeframe)
+        if first is None:
+            return 0
+        for data in load_ohlcv_by_month(db, timeframe, first, last, symbols):
+            ts = data.timestamps.astype(np.int64)
+            for row, symbol in enumerate(data.symbols):
+                present = ~np.isnan(data.close[row])
+                written += ohlcv_store.append(
+                    symbol, timeframe, ts[present],
+                    *(getattr(data, name)[row, present] for name in PRICE_COLUMNS),
+                )
+    return written
+
+
+async def run_compaction():
+    """Background task: periodically fold late bars back into the mapped columns"""
+    import asyncio
+    from fastapi.concurrency import run_in_threadpool
+
+    while True:
+        await asyncio.sleep(settings.OHLCV_COMPACT_INTERVAL)
+        try:
+            compacted = await run_in_threadpool(ohlcv_store.compact_all)
+            if compacted:
+                logger.info("OHLCV compaction rewrote %d series", compacted)
+        except Exception:
+            logger.exception("OHLCV compaction failed")
+
+
+if __name__ == "__main__":
+    # python -m app.services.ohlcv_store compact | import-db <timeframe> [SYMBOL ...]
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "compact"
+    if command == "compact":
+        print(f"Compacted {ohlcv_store.compact_all()} series")
+    elif command == "import-db":
+        print(f"Imported {import_from_db(sys.argv[2], sys.argv[3:] or None)} bars")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
+
+---
+
+# backend/app/services/ohlcv_ingest.py
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import MarketData
+from app.database.partitions import ensure_partitions, oldest_kept, partitioned_tables
+from app.database.session import async_engine
+
+logger = logging.getLogger(__name__)
+
+# Historical bars (Yahoo Finance, broker CSV/Parquet downloads) are loaded
+# into market_data_cache by a streaming pipeline:
+#   - a source yields one symbol's bars (or a file's) INGEST_CHUNK_ROWS at a
+#     time, read with pyarrow, so memory stays flat however large the input
+#   - each chunk is normalized (naive UTC timestamps, float prices), rows
+#     without a timestamp or close are dropped, and repeated
+#     (symbol, timestamp) rows collapse to the last one
+#   - on PostgreSQL the chunk is COPYed into a temporary staging table and
+#     merged with one INSERT .. ON CONFLICT (symbol, timeframe, timestamp)
+#     that skips unchanged rows, so reloading a file is idempotent and
+#     leaves no dead tuples; elsewhere it is upserted directly, with the
+#     same condition
+#   - the monthly partitions a chunk needs are created first; bars older
+#     than market_data_cache's retention are skipped
+#   - INGEST_WORKERS files or symbols load concurrently, each parsing in a
+#     thread and writing on its own connection
+# FileSource reads local files laid out like the remote downloads
+# (<dir>/<SYMBOL>.csv[.gz] or .parquet, or files with a symbol column), so
+# the pipeline runs without network access; YFinanceSource fetches from Yahoo.
+
+TIMEFRAMES = ("1m", "5m", "15m", "1h", "1d")
+PRICE_FIELDS = ("open", "high", "low", "close")
+COLUMN_ALIASES = {
+    "timestamp": "timestamp", "ts": "timestamp", "date": "timestamp", "datetime": "timestamp", "time": "timestamp",
+    "open": "open", "high": "high", "low": "low", "close": "close", "volume": "volume",
+    "symbol": "symbol", "ticker": "symbol", "tradingsymbol": "symbol",
+}
+FILE_SUFFIXES = (".csv", ".csv.gz", ".csv.bz2", ".parquet")
+EXCHANGE_SUFFIX = r"\.(NS|BO)$"  # Yahoo's NSE/BSE ticker suffixes
+RUNNING, COMPLETED, FAILED = "running", "completed", "failed"
+
+Chunk = Dict[str, np.ndarray]  # symbol, timestamp (datetime64[us]), open, high, low, close, volume
+
+STAGING_COLUMNS = ("symbol", "timeframe", "timestamp", "open", "high", "low", "close", "volume")
+STAGING_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS ohlcv_staging (
+    symbol VARCHAR(20), timeframe VARCHAR(10), timestamp TIMESTAMP,
+    open FLOAT8, high FLOAT8, low FLOAT8, close FLOAT8, volume BIGINT
+) ON COMMIT DELETE ROWS
+"""
+MERGE = """
+INSERT INTO market_data_cache AS m (symbol, timeframe, timestamp, open, high, low, close, volume, updated_at)
+SELECT symbol, timeframe, timestamp, open, high, low, close, volume, now() AT TIME ZONE 'UTC' FROM ohlcv_staging
+ON CONFLICT (symbol, timeframe, timestamp) DO UPDATE SET
+    open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+    volume = EXCLUDED.volume, updated_at = EXCLUDED.updated_at
+WHERE (m.open, m.high, m.low, m.close, m.volume)
+    IS DISTINCT FROM (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+"""
+
+
+class IngestError(ValueError):
+    pass
+
+
+# Parsing
+
+def _column_map(names: Iterable[str], where: str) -> Dict[str, str]:
+    """Source column name -> canonical name, for the columns the pipeline reads"""
+    mapped = {}
+    for name in names:
+        canonical = COLUMN_ALIASES.get(str(name).strip().lower())
+        if canonical and canonical not in mapped.values():
+            mapped[name] = canonical
+    missing = {"timestamp", *PRICE_FIELDS} - set(mapped.values())
+    if missing:
+        raise IngestError(f"{where}: missing columns {sorted(missing)}")
+    return mapped
+
+
+def _timestamps(column) -> np.ndarray:
+    """datetime64[us] in naive UTC from timestamp, date, epoch or ISO string columns"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    kind = column.type
+    if pa.types.is_integer(kind) or pa.types.is_floating(kind):
+        values = column.to_numpy(zero_copy_only=False).astype(np.float64)
+        # Epoch seconds, or milliseconds as most broker APIs send them
+        scale = 1e3 if np.nanmax(values, initial=0) > 1e11 else 1e6
+        stamps = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[us]")
+        present = ~np.isnan(values)
+        stamps[present] = (values[present] * scale).astype(np.int64).astype("datetime64[us]")
+        return stamps
+    if pa.types.is_string(kind) or pa.types.is_large_string(kind):
+        # ISO 8601: without an offset the time is taken as UTC, with one it is converted
+        try:
+            column = pc.cast(column, pa.timestamp("us"))
+        except pa.ArrowInvalid:
+            try:
+                column = pc.cast(column, pa.timestamp("us", tz="UTC"))
+            except pa.ArrowInvalid as e:
+                raise IngestError(f"Unrecognised timestamp format: {e}") from None
+    elif pa.types.is_date(kind):
+        column = pc.cast(column, pa.timestamp("us"))
+    elif not pa.types.is_timestamp(kind):
+        raise IngestError(f"Unsupported timestamp column type {kind}")
+    if column.type.tz is not None:
+        column = pc.cast(column, pa.timestamp("us", tz="UTC"))
+    return pc.cast(column, pa.timestamp("us")).to_numpy(zero_copy_only=False).astype("datetime64[us]")
+
+
+def _clean_symbols(column):
+    import pyarrow.compute as pc
+
+    column = pc.utf8_upper(pc.utf8_trim_whitespace(column.cast("string")))
+    return pc.replace_substring_regex(column, EXCHANGE_SUFFIX, "").to_numpy(zero_copy_only=False).astype(object)
+
+
+def clean_symbol(symbol: str) -> str:
+    return re.sub(EXCHANGE_SUFFIX, "", symbol.strip().upper())
+
+
+def _chunk(columns: Dict[str, Any], symbol: Optional[str]) -> Chunk:
+    """Canonical pyarrow columns of one batch -> numpy chunk"""
+    n = len(columns["timestamp"])
+    chunk = {"timestamp": _timestamps(columns["timestamp"])}
+    for field in PRICE_FIELDS:
+        chunk[field] = columns[field].to_numpy(zero_copy_only=False).astype(np.float64)
+    volume = columns.get("volume")
+    chunk["volume"] = (
+        np.nan_to_num(volume.to_numpy(zero_copy_only=False).astype(np.float64)).astype(np.int64)
+        if volume is not None else np.zeros(n, dtype=np.int64)
+    )
+    if "symbol" in columns:
+        chunk["symbol"] = _clean_symbols(columns["symbol"])
+    elif symbol:
+        chunk["symbol"] = np.full(n, symbol, dtype=object)
+    else:
+        raise IngestError("No symbol column and no symbol for the file")
+    return chunk
+
+
+def _batches(batches, mapping: Dict[str, str], symbol: Optional[str]) -> Iterator[Chunk]:
+    for batch in batches:
+        columns = {mapping[name]: batch.column(i) for i, name in enumerate(batch.schema.names)}
+        yield _chunk(columns, symbol)
+
+
+def read_csv(path: str, rows: int, symbol: Optional[str] = None) -> Iterator[Chunk]:
+    """Stream a CSV (optionally .gz/.bz2) in blocks of roughly `rows` bars"""
+    import pyarrow as pa
+    from pyarrow import csv
+
+    with csv.open_csv(path, read_options=csv.ReadOptions(block_size=1 << 16)) as probe:
+        mapping = _column_map(probe.schema.names, path)
+    # Fixed types, so a block that happens to hold only integers parses like the rest
+    types = {name: pa.float64() for name, canonical in mapping.items() if canonical in (*PRICE_FIELDS, "volume")}
+    reader = csv.open_csv(
+        path,
+        read_options=csv.ReadOptions(block_size=max(rows * 64, 1 << 20)),
+        convert_options=csv.ConvertOptions(column_types=types, include_columns=list(mapping)),
+    )
+    with reader:
+        yield from _batches(reader, mapping, symbol)
+
+
+def read_parquet(path: str, rows: int, symbol: Optional[str] = None) -> Iterator[Chunk]:
+    """Stream a Parquet file `rows` bars at a time"""
+    from pyarrow import parquet
+
+    with parquet.ParquetFile(path) as f:
+        mapping = _column_map(f.schema_arrow.names, path)
+        yield from _batches(f.iter_batches(batch_size=rows, columns=list(mapping)), mapping, symbol)
+
+
+def prepare(chunk: Chunk, oldest: Optional[datetime] = None) -> Dict[str, Any]:
+    """Drop unusable, expired and repeated bars; returns the chunk and what was dropped"""
+    valid = ~np.isnat(chunk["timestamp"]) & ~np.isnan(chunk["close"])
+    invalid = int(len(valid) - valid.sum())
+    expired = 0
+    if oldest is not None:
+        keep = chunk["timestamp"] >= np.datetime64(oldest, "us")
+        expired = int((valid & ~keep).sum())
+        valid &= keep
+    chunk = {k: v[valid] for k, v in chunk.items()}
+    n = len(chunk["timestamp"])
+    # Sort by symbol and time, latest row first within a key, and keep the first of each key
+    _, codes = np.unique(chunk["symbol"], return_inverse=True)
+    order = np.lexsort((-np.arange(n), chunk["timestamp"], codes))
+    codes, stamps = codes[order], chunk["timestamp"][order]
+    first = np.ones(n, dtype=bool)
+    first[1:] = (codes[1:] != codes[:-1]) | (stamps[1:] != stamps[:-1])
+    keep = order[first]
+    return {
+        "chunk": {k: v[keep] for k, v in chunk.items()},
+        "invalid": invalid,
+        "expired": expired,
+        "duplicates": int(n - len(keep)),
+    }
+
+
+# Sources
+
+class FileSource:
+    """CSV/Parquet files or directories of them; also the offline stand-in for the remote sources"""
+
+    def __init__(self, paths: Iterable[str], rows: Optional[int] = None):
+        self.rows = rows or settings.INGEST_CHUNK_ROWS
+        self.paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.paths += sorted(
+                    p for p in glob.glob(os.path.join(path, "**", "*"), recursive=True)
+                    if p.lower().endswith(FILE_SUFFIXES)
+                )
+            else:
+                self.paths.append(path)
+
+    def units(self) -> List[str]:
+        return self.paths
+
+    def read(self, path: str) -> Iterator[Chunk]:
+        name = os.path.basename(path)
+        for suffix in FILE_SUFFIXES:
+            if name.lower().endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+        # Used only when the file has no symbol column
+        symbol = clean_symbol(name)
+        if path.lower().endswith(".parquet"):
+            return read_parquet(path, self.rows, symbol)
+        return read_csv(path, self.rows, symbol)
+
+
+class YFinanceSource:
+    """Yahoo Finance history, one symbol per unit; bare symbols are looked up on NSE"""
+
+    def __init__(self, symbols: Iterable[str], timeframe: str, start: Optional[str] = None,
+                 end: Optional[str] = None, rows: Optional[int] = None):
+        self.symbols = list(symbols)
+        self.timeframe = timeframe
+        self.start, self.end = start, end
+        self.rows = rows or settings.INGEST_CHUNK_ROWS
+
+    def units(self) -> List[str]:
+        return self.symbols
+
+    def read(self, symbol: str) -> Iterator[Chunk]:
+        import pyarrow as pa
+        import yfinance
+
+        ticker = symbol if "." in symbol else f"{symbol}.NS"
+        history = yfinance.Ticker(ticker).history(
+            interval=self.timeframe, start=self.start, end=self.end, period=None if self.start else "max",
+            auto_adjust=False,
+        )
+        if history.empty:
+            return
+        table = pa.Table.from_pandas(history.reset_index(), preserve_index=False)
+        mapping = _column_map(table.column_names, ticker)
+        table = table.select(list(mapping))
+        yield from _batches(table.to_batches(max_chunksize=self.rows), mapping, clean_symbol(symbol))
+
+
+# Loading
+
+async def _merge_postgres(raw, timeframe: str, chunk: Chunk) -> int:
+    records = zip(
+        chunk["symbol"].tolist(), itertools.repeat(timeframe), chunk["timestamp"].tolist(),
+        *(chunk[f].tolist() for f in (*PRICE_FIELDS, "volume")),
+    )
+    async with raw.transaction():
+        await raw.copy_records_to_table("ohlcv_staging", columns=STAGING_COLUMNS, records=records)
+        status = await raw.execute(MERGE)
+    return int(status.split()[-1])  # INSERT 0 <rows inserted or changed>
+
+
+async def _merge_generic(conn, timeframe: str, chunk: Chunk) -> int:
+    now = datetime.utcnow()
+    rows = [
+        {"symbol": s, "timeframe": timeframe, "timestamp": ts, "open": o, "high": h, "low": l, "close": c,
+         "volume": v, "updated_at": now}
+        for s, ts, o, h, l, c, v in zip(
+            chunk["symbol"].tolist(), chunk["timestamp"].tolist(),
+            *(chunk[f].tolist() for f in (*PRICE_FIELDS, "volume")),
+        )
+    ]
+    stmt = sqlite_insert(MarketData)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["symbol", "timeframe", "timestamp"],
+        set_={f: stmt.excluded[f] for f in (*PRICE_FIELDS, "volume", "updated_at")},
+        where=or_(*(getattr(MarketData, f).is_distinct_from(stmt.excluded[f]) for f in (*PRICE_FIELDS, "volume"))),
+    )
+    result = await conn.execute(stmt, rows)
+    await conn.commit()
+    return result.rowcount
+
+
+class OHLCVIngest:
+    """One ingestion run: loads every unit of a source for one timeframe"""
+
+    def __init__(self, timeframe: str, workers: Optional[int] = None):
+        if timeframe not in TIMEFRAMES:
+            raise IngestError(f"timeframe must be one of {', '.join(TIMEFRAMES)}")
+        self.timeframe = timeframe
+        self.workers = workers or settings.INGEST_WORKERS
+        retention = oldest_kept(partitioned_tables()["market_data_cache"], datetime.utcnow().date())
+        self.oldest = datetime.combine(retention, datetime.min.time()) if retention else None
+        self._months = set()  # partitions already ensured by this run
+        self._months_lock = asyncio.Lock()
+        self.stats = {"units": 0, "failed": 0, "read": 0, "invalid": 0, "expired": 0, "duplicates": 0,
+                      "written": 0, "unchanged": 0}
+        self.errors: Dict[str, str] = {}
+
+    async def run(self, source, on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        units = source.units()
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def one(unit):
+            async with semaphore:
+                try:
+                    await self._load(source, unit)
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    self.errors[str(unit)] = str(e)
+                    logger.warning("Ingesting %s failed: %s", unit, e)
+                self.stats["units"] += 1
+                if on_progress is not None:
+                    await on_progress({**self.stats, "total_units": len(units)})
+
+        await asyncio.gather(*(one(unit) for unit in units))
+        elapsed = time.perf_counter() - started
+        return {
+            **self.stats,
+            "timeframe": self.timeframe,
+            "seconds": round(elapsed, 3),
+            "bars_per_minute": round(self.stats["read"] / elapsed * 60) if elapsed else 0,
+            "errors": self.errors,
+        }
+
+    async def _load(self, source, unit):
+        chunks = source.read(unit)
+        async with async_engine.connect() as conn:
+            postgres = conn.dialect.name == "postgresql"
+            if postgres:
+                raw = (await conn.get_raw_connection()).driver_connection
+                await raw.execute(STAGING_TABLE)
+            while True:
+                # pyarrow parses off the event loop, and mostly without the GIL
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                self.stats["read"] += len(chunk["timestamp"])
+                prepared = prepare(chunk, self.oldest)
+                for key in ("invalid", "expired", "duplicates"):
+                    self.stats[key] += prepared[key]
+                chunk = prepared["chunk"]
+                if not len(chunk["timestamp"]):
+                    continue
+                if postgres:
+                    await self._ensure_partitions(chunk["timestamp"])
+                    written = await _merge_postgres(raw, self.timeframe, chunk)
+                else:
+                    written = await _merge_generic(conn, self.timeframe, chunk)
+                self.stats["written"] += written
+                self.stats["unchanged"] += len(chunk["timestamp"]) - written
+
+    async def _ensure_partitions(self, stamps: np.ndarray):
+        months = set(np.unique(stamps.astype("datetime64[M]")).tolist()) - self._months
+        if not months:
+            return
+        async with self._months_lock:
+            months -= self._months
+            if months:
+                first, last = (datetime.combine(m, datetime.min.time()) for m in (min(months), max(months)))
+                await ensure_partitions("market_data_cache", first, last)
+                self._months |= months
+
+
+async def ingest(source, timeframe: str, workers: Optional[int] = None, on_progress=None) -> Dict[str, Any]:
+    return await OHLCVIngest(timeframe, workers).run(source, on_progress)
+
+
+# Jobs for the API: run in the accepting worker, status in Redis
+
+def job_key(job_id: str) -> str:
+    return f"ingest:job:{job_id}"
+
+
+class IngestJobs:
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, source, timeframe: str) -> str:
+        run = OHLCVIngest(timeframe)  # validates the timeframe before anything is queued
+        job_id = uuid.uuid4().hex
+        await self._update(job_id, status=RUNNING, timeframe=timeframe, total_units=len(source.units()),
+                           created_at=datetime.utcnow().isoformat())
+        task = asyncio.create_task(self._run(job_id, run, source))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job_id
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await get_redis().get(job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    async def _run(self, job_id: str, run: OHLCVIngest, source):
+        try:
+            result = await run.run(source, on_progress=lambda progress: self._update(job_id, **progress))
+            await self._update(job_id, status=COMPLETED, finished_at=datetime.utcnow().isoformat(), **result)
+        except asyncio.CancelledError:
+            await self._update(job_id, status=FAILED, error="Server shutting down")
+            raise
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job_id)
+            await self._update(job_id, status=FAILED, error=str(e))
+
+    async def _update(self, job_id: str, **fields):
+        current = await self.status(job_id) or {"job_id": job_id}
+        current.update(fields)
+        await get_redis().set(job_key(job_id), json.dumps(current), ex=settings.INGEST_JOB_TTL)
+
+    async def stop(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+ingest_jobs = IngestJobs()
+
+
+def main():
+    # python -m app.services.ohlcv_ingest files 1d data/downloads/
+    # python -m app.services.ohlcv_ingest yfinance 1d RELIANCE TCS --start 2020-01-01
+    parser = argparse.ArgumentParser(description="Load historical bars into market_data_cache")
+    parser.add_argument("source", choices=("files", "yfinance"))
+    parser.add_argument("timeframe", choices=TIMEFRAMES)
+    parser.add_argument("inputs", nargs="+", help="Files or directories, or symbols for yfinance")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=settings.INGEST_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.source == "files":
+        source = FileSource(args.inputs, args.chunk_rows)
+    else:
+        source = YFinanceSource(args.inputs, args.timeframe, args.start, args.end, args.chunk_rows)
+
+    async def run():
+        try:
+            return await ingest(source, args.timeframe, args.workers)
+        finally:
+            await async_engine.dispose()
+
+    print(json.dumps(asyncio.run(run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/app/services/market_overview.py
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+# The market overview is a process-local snapshot of the headline indices.
+# A feed pushes quotes into it; a refresher re-serializes the response at
+# most every MARKET_OVERVIEW_INTERVAL, and only when a quote changed. The
+# endpoint hands out the prebuilt bytes and ETag: no DB session, no JSON
+# encoding, and a 304 when the client's copy is current.
+#
+# Feeds are selected by MARKET_OVERVIEW_FEED:
+#   hub              index ticks arriving at the WebSocket hub (default)
+#   replay:<path>    NDJSON quotes replayed from a file, looping; one object
+#                    per line: {"symbol": "NIFTY", "ltp": 19500.5,
+#                    "prev_close": 19354.75, "ts": "2024-01-05T09:15:00"}
+# Further feeds register with register_feed().
+
+INDICES = {
+    "nifty": "NIFTY",
+    "bank_nifty": "BANKNIFTY",
+    "sensex": "SENSEX",
+}
+_KEYS = {symbol: key for key, symbol in INDICES.items()}
+
+OnQuote = Callable[[Dict[str, Any]], None]
+
+
+class QuoteFeed:
+    """Pushes index quotes to `on_quote` until cancelled"""
+
+    async def run(self, on_quote: OnQuote):
+        raise NotImplementedError
+
+
+class HubFeed(QuoteFeed):
+    async def run(self, on_quote: OnQuote):
+        manager.add_tick_listener(on_quote)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            manager.remove_tick_listener(on_quote)
+
+
+class ReplayFeed(QuoteFeed):
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    async def run(self, on_quote: OnQuote):
+        while True:
+            with open(self.path) as f:
+                quotes = [json.loads(line) for line in f if line.strip()]
+            previous = None
+            for quote in quotes:
+                ts = quote.get("ts")
+                if ts and previous and self.speed > 0:
+                    gap = (datetime.fromisoformat(ts) - datetime.fromisoformat(previous)).total_seconds()
+                    await asyncio.sleep(max(gap, 0) / self.speed)
+                previous = ts or previous
+                on_quote(quote)
+            if not self.loop:
+                return
+            await asyncio.sleep(settings.MARKET_OVERVIEW_INTERVAL)
+
+
+FEEDS: Dict[str, Callable[[str], QuoteFeed]] = {
+    "hub": lambda arg: HubFeed(),
+    "replay": lambda arg: ReplayFeed(arg, settings.MARKET_OVERVIEW_REPLAY_SPEED),
+}
+
+
+def register_feed(name: str, factory: Callable[[str], QuoteFeed]):
+    FEEDS[name] = factory
+
+
+def make_feed(spec: str) -> QuoteFeed:
+    name, _, arg = spec.partition(":")
+    if name not in FEEDS:
+        raise ValueError(f"Unknown market overview feed: {name}")
+    return FEEDS[name](arg)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
+class MarketOverview:
+    def __init__(self):
+        self._quotes: Dict[str, Dict[str, Any]] = {
+            key: {"symbol": symbol, "price": None, "change": None, "change_percent": None, "timestamp": None}
+            for key, symbol in INDICES.items()
+        }
+        self._dirty = True
+        self._tasks = []
+        self.body = b""
+        self.etag = ""
+        self.stats = {"quotes": 0, "rebuilds": 0}
+        self.rebuild()
+
+    def on_quote(self, quote: Dict[str, Any]):
+        """Feed callback; ignores symbols that aren't headline indices"""
+        key = _KEYS.get(quote.get("symbol"))
+        if key is None:
+            return
+        price = quote.get("ltp", quote.get("price"))
+        if price is None:
+            return
+        price = float(price)
+        prev_close = quote.get("prev_close", quote.get("close"))
+        if prev_close:
+            change = price - float(prev_close)
+            change_percent = change / float(prev_close) * 100
+        else:
+            change, change_percent = quote.get("change"), quote.get("change_percent")
+        ts = quote.get("ts") or quote.get("timestamp") or datetime.utcnow().isoformat()
+        self._quotes[key] = {
+            "symbol": INDICES[key],
+            "price": round(price, 2),
+            "change": round(change, 2) if change is not None else None,
+            "change_percent": round(change_percent, 2) if change_percent is not None else None,
+            "timestamp": ts,
+        }
+        self._dirty = True
+        self.stats["quotes"] += 1
+
+    def rebuild(self):
+        self.body = json.dumps(self._quotes).encode()
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:16] + '"'
+        self._dirty = False
+        self.stats["rebuilds"] += 1
+
+    def current(self) -> Tuple[bytes, str]:
+        return self.body, self.etag
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.MARKET_OVERVIEW_INTERVAL)
+            if self._dirty:
+                self.rebuild()
+
+    async def _run_feed(self, feed: QuoteFeed):
+        while True:
+            try:
+                await feed.run(self.on_quote)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Market overview feed failed, restarting")
+                await asyncio.sleep(1.0)
+
+    async def start(self, feed: Optional[QuoteFeed] = None):
+        feed = feed or make_feed(settings.MARKET_OVERVIEW_FEED)
+        self._tasks = [
+            asyncio.create_task(self._run_feed(feed)),
+            asyncio.create_task(self._refresh_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+market_overview = MarketOverview()
+
+---
+
+# backend/app/services/market_replay.py
+import asyncio
+import bz2
+import csv
+import gzip
+import itertools
+import json
+import logging
+import lzma
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.market_data import OHLCV
+from app.services.ohlcv_store import ohlcv_store
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+# Replays recorded market data into the interfaces the live feed drives:
+# ticks go to the WebSocket hub (and from there to the tick listeners: the
+# position book's P&L marks and the market overview), bars go to the live
+# scanner. Sources are recorded ticks or bars in NDJSON or CSV, optionally
+# gzip/bz2/xz compressed, or a range of the OHLCV store. Bars are also
+# expanded into four ticks each (open, high/low, low/high, close) so a bar
+# recording produces tick load too.
+#
+# Events are (epoch seconds, kind, payload) in time order. Pacing follows the
+# recorded timestamps at `speed`x; speed 0 replays as fast as the consumers
+# keep up. Each tick is stamped with "sent" (wall clock) on ingestion so
+# clients can measure ingestion -> delivery latency.
+#
+#   tick recording: {"ts": 1704426300.25, "symbol": "RELIANCE", "ltp": 2580.5, "volume": 1200}
+#   bar recording:  {"ts": "2024-01-05T09:15:00", "symbol": "RELIANCE", "open": .., "high": ..,
+#                    "low": .., "close": .., "volume": ..}     (ts is the bar open)
+
+TICK, BAR = "tick", "bar"
+TIMEFRAME_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "1d": 86400}
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+Event = Tuple[float, str, Any]
+
+
+def open_recording(path: str):
+    for suffix, opener in _OPENERS.items():
+        if path.endswith(suffix):
+            return opener(path, "rt")
+    return open(path)
+
+
+def _records(path: str) -> Iterator[Dict[str, Any]]:
+    """Rows of an NDJSON or CSV recording, by extension before compression"""
+    plain = path
+    for suffix in _OPENERS:
+        plain = plain.removesuffix(suffix)
+    with open_recording(path) as f:
+        if plain.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def to_seconds(value) -> float:
+    """Epoch seconds from a number or an ISO timestamp (naive means UTC, as in the store)"""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def tick_events(path: str) -> Iterator[Event]:
+    for row in _records(path):
+        tick = {"symbol": row["symbol"].upper(), "ltp": float(row.get("ltp") or row["price"])}
+        if row.get("volume") not in (None, ""):
+            tick["volume"] = float(row["volume"])
+        yield to_seconds(row["ts"]), TICK, tick
+
+
+def _bar_ticks(bar_start: float, interval: float, bars: Dict[str, Tuple]) -> List[Event]:
+    """Four ticks per bar: up bars go open, low, high, close; down bars open, high, low, close"""
+    phases = ([], [], [], [])
+    for symbol, (o, h, l, c, v) in bars.items():
+        path = (o, l, h, c) if c >= o else (o, h, l, c)
+        for phase, price in zip(phases, path):
+            phase.append({"symbol": symbol, "ltp": price})
+        phases[3][-1]["volume"] = v
+    offsets = (0.0, interval / 3, interval * 2 / 3, interval * 0.999)
+    return [(bar_start + offset, TICK, tick) for offset, phase in zip(offsets, phases) for tick in phase]
+
+
+def _bar_group_events(bar_start: float, interval: float, bars: Dict[str, Tuple], ticks: bool) -> List[Event]:
+    events = _bar_ticks(bar_start, interval, bars) if ticks else []
+    events.append((bar_start + interval, BAR, (bar_start, bars)))
+    return events
+
+
+def bar_file_events(path: str, timeframe: str, ticks: bool = True) -> Iterator[Event]:
+    """Rows must be ordered by ts; rows sharing a ts form one bar of the universe"""
+    interval = TIMEFRAME_SECONDS[timeframe]
+    rows = ((to_seconds(r["ts"]), r) for r in _records(path))
+    for bar_start, group in itertools.groupby(rows, key=lambda item: item[0]):
+        bars = {r["symbol"].upper(): tuple(float(r[f]) for f in BAR_FIELDS) for _, r in group}
+        yield from _bar_group_events(bar_start, interval, bars, ticks)
+
+
+def store_events(timeframe: str, start=None, end=None, symbols: Optional[List[str]] = None,
+                 ticks: bool = True) -> Iterator[Event]:
+    data: OHLCV = ohlcv_store.load(timeframe, start, end, symbols)
+    interval = TIMEFRAME_SECONDS[timeframe]
+    seconds = data.timestamps.astype("datetime64[s]").astype(np.int64)
+    for t, bar_start in enumerate(seconds):
+        close = data.close[:, t]
+        bars = {
+            data.symbols[i]: tuple(float(getattr(data, f)[i, t]) for f in BAR_FIELDS)
+            for i in np.flatnonzero(~np.isnan(close))
+        }
+        yield from _bar_group_events(float(bar_start), interval, bars, ticks)
+
+
+class MarketReplay:
+    """Paces events and hands them to the hub and the scanner"""
+
+    def __init__(
+        self,
+        events: Iterable[Event],
+        speed: float = 1.0,
+        publish: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+        on_bar: Optional[Callable[[np.datetime64, Dict[str, Tuple]], None]] = None,
+    ):
+        self.events = events
+        self.speed = speed
+        self.publish = publish or manager.publish_ticks
+        self.on_bar = on_bar  # e.g. scanner_service.apply_bar
+        self.stats = {"ticks": 0, "bars": 0, "late_events": 0, "max_lag": 0.0}
+        self.bar_latencies: List[float] = []  # bar ingestion -> scans evaluated
+
+    async def run(self) -> Dict[str, Any]:
+        wall_start = time.perf_counter()
+        first = None
+        for ts, group in itertools.groupby(self.events, key=lambda event: event[0]):
+            if first is None:
+                first = ts
+            if self.speed > 0:
+                delay = wall_start + (ts - first) / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif delay < -0.001:
+                    self.stats["late_events"] += 1
+                    self.stats["max_lag"] = max(self.stats["max_lag"], -delay)
+            else:
+                await asyncio.sleep(0)  # let the hub flush between timestamps
+
+            ticks = []
+            for _, kind, payload in group:
+                if kind == TICK:
+                    ticks.append(payload)
+                else:
+                    if ticks:
+                        await self._publish(ticks)
+                        ticks = []
+                    self._bar(*payload)
+            if ticks:
+                await self._publish(ticks)
+        self.stats["elapsed"] = time.perf_counter() - wall_start
+        return self.stats
+
+    async def _publish(self, ticks: List[Dict[str, Any]]):
+        sent = time.time()
+        for tick in ticks:
+            tick["sent"] = sent
+        await self.publish(ticks)
+        self.stats["ticks"] += len(ticks)
+
+    def _bar(self, bar_start: float, bars: Dict[str, Tuple]):
+        self.stats["bars"] += 1
+        if self.on_bar is None:
+            return
+        started = time.perf_counter()
+        try:
+            self.on_bar(np.datetime64(int(bar_start), "s"), bars)
+        except Exception:
+            logger.exception("Replay bar failed")
+            return
+        self.bar_latencies.append(time.perf_counter() - started)
+
+
+def percentiles(samples: Iterable[float], points=(50, 90, 99, 99.9)) -> Dict[str, float]:
+    """Milliseconds"""
+    values = np.asarray(list(samples), dtype=np.float64) * 1000
+    if not len(values):
+        return {f"p{p:g}": math.nan for p in points}
+    return {f"p{p:g}": float(np.percentile(values, p)) for p in points}
+
+---
+
+# backend/benchmarks/bench_replay.py
+# Usage: python -m benchmarks.bench_replay --store --timeframe 1m --start 2024-01-05 --speed 0 [--clients 2000] [--scans 200]
+#        python -m benchmarks.bench_replay --bars bars.csv.gz --timeframe 1m --speed 60
+#        python -m benchmarks.bench_replay --ticks ticks.ndjson.xz --speed 1 --url ws://localhost:8000/ws/market
+#
+# Replays recorded market data through app.services.market_replay and reports
+# ingestion -> client delivery latency percentiles. In-process mode runs the
+# hub with fake sockets (and, with --scans, the live scanner; with
+# --positions, the position book over the open positions in DATABASE_URL).
+# With --url, ticks go through Redis (--redis) to a running server and real
+# WebSocket clients measure delivery.
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+
+from app.services.market_replay import (
+    MarketReplay, TICK, bar_file_events, percentiles, store_events, tick_events,
+)
+
+
+class RecordingSocket:
+    """Fake socket: delivery latency from each frame's oldest "sent" stamp, parsed once per frame"""
+
+    parsed = {}
+
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    async def send_text(self, frame: str):
+        now = time.time()
+        sent = self.parsed.get(frame)
+        if sent is None:
+            data = json.loads(frame).get("data") or []
+            sent = self.parsed[frame] = min((t.get("sent", now) for t in data), default=now)
+        self.latencies.append(now - sent)
+
+
+def make_events(args):
+    if args.ticks:
+        return lambda: tick_events(args.ticks)
+    if args.bars:
+        return lambda: bar_file_events(args.bars, args.timeframe)
+    start = datetime.fromisoformat(args.start) if args.start else None
+    end = datetime.fromisoformat(args.end) if args.end else None
+    return lambda: store_events(args.timeframe, start, end)
+
+
+def universe_of(events) -> list:
+    return sorted({payload["symbol"] for _, kind, payload in events() if kind == TICK})
+
+
+def watchlists(universe, count: int, clients: int, rng: random.Random):
+    shared = [rng.sample(universe, min(rng.choice((5, 20, 50)), len(universe))) for _ in range(count)]
+    return [rng.choice(shared) for _ in range(clients)]
+
+
+def setup_scanner(args, universe):
+    from app.services import scanner_service
+    from app.services.condition_compiler import compile_conditions
+    from benchmarks.bench_scanner import CONDITION_POOL
+
+    scanner_service.init_scanner(args.timeframe, warm=False, symbols=universe)
+    rng = random.Random(3)
+    for scan_id in range(args.scans):
+        conditions = rng.sample(CONDITION_POOL, rng.randint(1, 4))
+        scanner_service.plan_registry.register(("scan", scan_id), (compile_conditions(conditions, "count"),))
+    return scanner_service.apply_bar
+
+
+async def run_inprocess(args):
+    from app.websocket.manager import manager
+
+    events = make_events(args)
+    universe = universe_of(events)
+    rng = random.Random(7)
+    await manager.start(bridge=False)
+    latencies = []
+    for symbols in watchlists(universe, args.watchlists, args.clients, rng):
+        manager.subscribe(manager.register(RecordingSocket(latencies)), symbols)
+
+    position_book = None
+    if args.positions:
+        from app.services.position_book import position_book
+        await position_book.start()
+
+    on_bar = setup_scanner(args, universe) if args.scans else None
+    replay = MarketReplay(events(), speed=args.speed, on_bar=on_bar)
+    stats = await replay.run()
+    await asyncio.sleep(0.5)
+    summary = manager.summary()
+    if position_book is not None:
+        await position_book.stop()
+    await manager.stop()
+    report(args, stats, latencies, replay.bar_latencies, summary,
+           position_book.stats if position_book is not None else None)
+
+
+async def run_remote(args):
+    import redis.asyncio as redis
+    import websockets
+
+    from app.config import settings
+
+    events = make_events(args)
+    universe = universe_of(events)
+    rng = random.Random(7)
+    latencies = []
+
+    async def client(symbols):
+        async with websockets.connect(args.url, max_queue=None) as ws:
+            await ws.send(json.dumps({"action": "subscribe", "symbols": symbols}))
+            async for frame in ws:
+                now = time.time()
+                data = json.loads(frame).get("data") or []
+                if data:
+                    latencies.append(now - min(t.get("sent", now) for t in data))
+
+    clients = []
+    for i, symbols in enumerate(watchlists(universe, args.watchlists, args.clients, rng)):
+        clients.append(asyncio.create_task(client(symbols)))
+        if i % 500 == 499:
+            await asyncio.sleep(0.5)
+    await asyncio.sleep(2)
+
+    r = redis.from_url(args.redis)
+
+    async def publish(ticks):
+        await r.publish(settings.WS_TICK_CHANNEL, json.dumps(ticks))
+
+    replay = MarketReplay(events(), speed=args.speed, publish=publish)
+    stats = await replay.run()
+    await asyncio.sleep(1)
+    for task in clients:
+        task.cancel()
+    await r.aclose()
+    report(args, stats, latencies, [], None, None)
+
+
+def report(args, stats, latencies, bar_latencies, summary, positions):
+    rate = stats["ticks"] / stats["elapsed"] if stats["elapsed"] else 0
+    print(f"replayed {stats['ticks']} ticks, {stats['bars']} bars in {stats['elapsed']:.2f}s "
+          f"({rate:,.0f} ticks/s at speed {args.speed or 'max'}); "
+          f"{stats['late_events']} late timestamps, max lag {stats['max_lag'] * 1000:.1f} ms")
+    lat = percentiles(latencies)
+    print(f"tick -> client ({len(latencies)} frames): " + ", ".join(f"{k} {v:.1f} ms" for k, v in lat.items()))
+    if bar_latencies:
+        bars = percentiles(bar_latencies)
+        print(f"bar -> scans evaluated ({len(bar_latencies)} bars): " + ", ".join(f"{k} {v:.2f} ms" for k, v in bars.items()))
+    if summary:
+        print(f"frames built {summary['frames_built']}, queued {summary['frames_queued']}, "
+              f"dropped {summary['dropped_frames']}, ticks coalesced {summary['ticks_coalesced']}")
+    if positions:
+        print(f"positions: {positions['marks']} marks, {positions['pushes']} pushes, {positions['rows_written']} rows written")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--ticks", help="NDJSON/CSV tick recording, optionally .gz/.bz2/.xz")
+    source.add_argument("--bars", help="NDJSON/CSV bar recording, optionally .gz/.bz2/.xz")
+    source.add_argument("--store", action="store_true", help="replay bars from the OHLCV store")
+    parser.add_argument("--timeframe", default="1m")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = max")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--watchlists", type=int, default=200)
+    parser.add_argument("--scans", type=int, default=0, help="random scans to evaluate on every bar")
+    parser.add_argument("--positions", action="store_true", help="mark open positions from DATABASE_URL")
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--redis", default="redis://localhost:6379")
+    args = parser.parse_args()
+    asyncio.run(run_remote(args) if args.url else run_inprocess(args))
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/bench_ingest.py
+# Usage: python -m benchmarks.bench_ingest [--symbols 100] [--bars 100000] [--format csv|parquet] [--duplicates 0.02] [--workers 4] [--chunk-rows 100000]
+#
+# Writes --symbols synthetic 1m files of --bars bars each into a temporary
+# directory, laid out like Yahoo Finance downloads (Datetime with a +05:30
+# offset, Open, High, Low, Close, Adj Close, Volume; one file per symbol), as
+# the stand-in for the remote source. --duplicates of each file's rows are
+# repeated later in the file, as overlapping downloads repeat bars. Then ingests the
+# directory into market_data_cache (DATABASE_URL) and prints bars per minute,
+# what was dropped or merged, and the process's peak RSS before and after;
+# a second run over the same files shows the merge is idempotent.
+import argparse
+import asyncio
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+from pyarrow import csv, parquet
+from sqlalchemy import delete, func, select
+
+from app.config import settings
+from app.database.models import MarketData
+from app.database.session import async_engine, init_db
+from app.services.ohlcv_ingest import FileSource, ingest
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_files(directory: str, args) -> int:
+    rng = np.random.default_rng(7)
+    start = np.datetime64("2024-01-01T09:15")
+    written = 0
+    for i in range(args.symbols):
+        minutes = np.arange(args.bars)
+        stamps = start + (minutes // 375) * np.timedelta64(1, "D") + (minutes % 375) * np.timedelta64(1, "m")
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, args.bars)))
+        volume = rng.integers(100, 10000, args.bars)
+        repeat = rng.choice(args.bars, int(args.bars * args.duplicates), replace=False)
+        stamps, close, volume = (np.concatenate([a, a[repeat]]) for a in (stamps, close, volume))
+        local = (stamps + np.timedelta64(330, "m")).astype("datetime64[s]").astype(str)
+        table = pa.table({
+            "Datetime": np.char.add(np.char.replace(local, "T", " "), "+05:30"),
+            "Open": close * 0.999, "High": close * 1.002, "Low": close * 0.998, "Close": close,
+            "Adj Close": close, "Volume": volume,
+        })
+        if args.format == "parquet":
+            parquet.write_table(table, f"{directory}/BENCH{i}.NS.parquet")
+        else:
+            csv.write_csv(table, f"{directory}/BENCH{i}.NS.csv")
+        written += len(close)
+    return written
+
+
+async def run(args, directory: str):
+    await init_db()
+    async with async_engine.begin() as conn:
+        await conn.execute(delete(MarketData).where(MarketData.symbol.like("BENCH%")))
+    for label in ("first load", "reload"):
+        before = peak_rss_mb()
+        result = await ingest(FileSource([directory], args.chunk_rows), "1m", args.workers)
+        print(f"{label}: {result['read']:,} rows from {result['units']} files in {result['seconds']:.1f}s "
+              f"= {result['bars_per_minute']:,} bars/min")
+        print(f"  written {result['written']:,}, unchanged {result['unchanged']:,}, duplicates {result['duplicates']:,}, "
+              f"invalid {result['invalid']:,}, failed files {result['failed']}")
+        print(f"  peak RSS {before:.0f} MB before, {peak_rss_mb():.0f} MB after")
+    async with async_engine.connect() as conn:
+        stored = await conn.scalar(select(func.count()).select_from(MarketData).where(MarketData.symbol.like("BENCH%")))
+    print(f"market_data_cache holds {stored:,} bench bars ({args.symbols * args.bars:,} distinct generated)")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--bars", type=int, default=100000, help="Distinct bars per symbol")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="Fraction of rows repeated in each file")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=settings.INGEST_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        began = time.perf_counter()
+        rows = write_files(directory, args)
+        print(f"Wrote {rows:,} rows in {args.symbols} {args.format} files in {time.perf_counter() - began:.1f}s")
+        asyncio.run(run(args, directory))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
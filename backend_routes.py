@@ -1,6 +1,7 @@
 # backend/app/api/v1/auth.py
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from pydantic import BaseModel, EmailStr
 import jwt
@@ -8,7 +9,15 @@ import jwt
 from app.config import settings
 from app.database.session import get_db
 from app.database.models import User
-from app.security import hash_password, verify_password, create_access_token
+from app.services.audit import audit_sink, client_info
+from app.security import (
+    create_access_token,
+    get_token_payload,
+    hash_password_async,
+    revoke_all,
+    revoke_token,
+    verify_password_async,
+)
 
 router = APIRouter()
 
@@ -29,11 +38,11 @@ class TokenResponse(BaseModel):
     user: dict
 
 @router.post("/register")
-async def register(request: RegisterRequest, db: Session = Depends(get_db)):
+async def register(request: RegisterRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
     # Check if user exists
-    existing = db.query(User).filter(
+    existing = await db.scalar(select(User).where(
         (User.email == request.email) | (User.username == request.username)
-    ).first()
+    ).limit(1))
     
     if existing:
         raise HTTPException(status_code=400, detail="User already exists")
@@ -43,17 +52,19 @@ async def register(request: RegisterRequest, db: Session = Depends(get_db)):
         email=request.email,
         username=request.username,
         full_name=request.full_name,
-        hashed_password=hash_password(request.password),
+        hashed_password=await hash_password_async(request.password),
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await audit_sink.log("user_registered", user.id, "user", user.id, **client_info(http_request))
     
     # Generate tokens
-    access_token = create_access_token({"sub": str(user.id)})
+    # The tier rides in the token so the rate limiter needs no user lookup
+    claims = {"sub": str(user.id), "tier": user.subscription_tier or "free"}
+    access_token = create_access_token(claims)
     refresh_token = create_access_token(
-        {"sub": str(user.id)},
+        claims,
         expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     )
     
@@ -70,18 +81,23 @@ async def register(request: RegisterRequest, db: Session = Depends(get_db)):
     )
 
 @router.post("/login")
-async def login(request: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
+async def login(request: LoginRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == request.email).limit(1))
     
-    if not user or not verify_password(request.password, user.hashed_password):
+    if not await verify_password_async(request.password, user.hashed_password if user else None):
+        await audit_sink.log("login_failed", user.id if user else None, details={"email": request.email},
+                             **client_info(http_request))
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user.is_active:
         raise HTTPException(status_code=403, detail="User account is inactive")
     
-    access_token = create_access_token({"sub": str(user.id)})
+    await audit_sink.log("login", user.id, "user", user.id, **client_info(http_request))
+    
+    claims = {"sub": str(user.id), "tier": user.subscription_tier or "free"}
+    access_token = create_access_token(claims)
     refresh_token = create_access_token(
-        {"sub": str(user.id)},
+        claims,
         expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     )
     
@@ -97,119 +113,99 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
         },
     )
 
+@router.post("/logout")
+async def logout(http_request: Request, payload: dict = Depends(get_token_payload)):
+    """Revoke the presented token"""
+    await revoke_token(payload)
+    await audit_sink.log("logout", int(payload["sub"]), **client_info(http_request))
+    return {"message": "Logged out"}
+
+@router.post("/logout-all")
+async def logout_all(http_request: Request, payload: dict = Depends(get_token_payload)):
+    """Revoke every token issued to the user so far"""
+    await revoke_all(int(payload["sub"]))
+    await audit_sink.log("logout_all", int(payload["sub"]), **client_info(http_request))
+    return {"message": "Logged out of all sessions"}
+
 ---
 
 # backend/app/api/v1/dashboard.py
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Header, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 
 from app.database.session import get_db
-from app.database.models import User, Position, Trade
+from app.database.models import Position
+from app.cache.response_cache import response_cache
+from app.services import trade_stats
+from app.services.market_overview import etag_matches, market_overview
+from app.services.position_book import LivePosition, position_book
 
 router = APIRouter()
 
 @router.get("/market-overview")
-async def get_market_overview(db: Session = Depends(get_db)):
+async def get_market_overview(if_none_match: Optional[str] = Header(None)):
     """Get current market overview with Nifty, Bank Nifty, Sensex"""
-    # In production, integrate with broker APIs for live data
-    return {
-        "nifty": {
-            "symbol": "NIFTY",
-            "price": 19500.50,
-            "change": 145.75,
-            "change_percent": 0.75,
-            "timestamp": datetime.utcnow().isoformat(),
-        },
-        "bank_nifty": {
-            "symbol": "BANKNIFTY",
-            "price": 45200.25,
-            "change": -125.50,
-            "change_percent": -0.28,
-            "timestamp": datetime.utcnow().isoformat(),
-        },
-        "sensex": {
-            "symbol": "SENSEX",
-            "price": 64500.75,
-            "change": 200.25,
-            "change_percent": 0.31,
-            "timestamp": datetime.utcnow().isoformat(),
-        },
-    }
+    # Prebuilt by app.services.market_overview; no DB session on this path
+    body, etag = market_overview.current()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 @router.get("/positions/{user_id}")
-async def get_positions(user_id: int, db: Session = Depends(get_db)):
+async def get_positions(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get all open positions for a user"""
-    positions = db.query(Position).filter(
-        (Position.user_id == user_id) & (Position.status == "open")
-    ).all()
+    if position_book.ready:
+        # Marked to the latest tick; the table lags by up to POSITION_FLUSH_INTERVAL
+        positions = [p.as_dict() for p in position_book.user_positions(user_id)]
+    else:
+        rows = (await db.scalars(select(Position).where(
+            (Position.user_id == user_id) & (Position.status == "open")
+        ))).all()
+        positions = [LivePosition.from_row(p).as_dict() for p in rows]
     
     return {
         "count": len(positions),
-        "total_pnl": sum(p.pnl for p in positions),
-        "total_pnl_percent": sum(p.pnl_percent for p in positions) / len(positions) if positions else 0,
-        "positions": [
-            {
-                "id": p.id,
-                "symbol": p.symbol,
-                "quantity": p.quantity,
-                "entry_price": p.entry_price,
-                "current_price": p.current_price,
-                "pnl": p.pnl,
-                "pnl_percent": p.pnl_percent,
-                "stop_loss": p.stop_loss,
-                "target": p.target,
-            }
-            for p in positions
-        ],
+        "total_pnl": sum(p["pnl"] for p in positions),
+        "total_pnl_percent": sum(p["pnl_percent"] for p in positions) / len(positions) if positions else 0,
+        "positions": positions,
     }
 
 @router.get("/performance-metrics/{user_id}")
-async def get_performance_metrics(user_id: int, db: Session = Depends(get_db)):
+@response_cache.cached(ttl=30, tags=("trades:{user_id}", "positions:{user_id}"))
+async def get_performance_metrics(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get performance metrics for user"""
-    trades = db.query(Trade).filter(Trade.user_id == user_id).all()
-    
-    winning_trades = [t for t in trades if t.status == "completed"]
-    wins = len([t for t in winning_trades if t.side == "sell"])  # Simplified
-    
-    return {
-        "win_rate": (wins / len(winning_trades) * 100) if winning_trades else 0,
-        "total_trades": len(trades),
-        "completed_trades": len(winning_trades),
-        "avg_trade_value": sum(t.price * t.quantity for t in winning_trades) / len(winning_trades) if winning_trades else 0,
-        "pnl_ytd": 0,  # Calculate from actual trades
-        "pnl_mtd": 0,
-    }
+    return await trade_stats.performance_metrics(db, user_id)
 
 @router.get("/pnl-analytics/{user_id}")
-async def get_pnl_analytics(user_id: int, days: int = 30, db: Session = Depends(get_db)):
+@response_cache.cached(ttl=30, tags=("trades:{user_id}", "positions:{user_id}"))
+async def get_pnl_analytics(user_id: int, days: int = 30, db: AsyncSession = Depends(get_db)):
     """Get daily P&L analytics"""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-    
-    # Mock data - in production, aggregate from trades
+    if days < 1 or days > 366:
+        return {"error": "days must be between 1 and 366"}
+    daily = await trade_stats.daily_pnl(db, user_id, days)
     return {
-        "period": {"start": start_date.isoformat(), "end": end_date.isoformat()},
-        "daily_pnl": [
-            {
-                "date": (end_date - timedelta(days=i)).strftime("%Y-%m-%d"),
-                "pnl": -500 + i * 100,
-                "cumulative": i * 1000,
-            }
-            for i in range(days)
-        ],
+        "period": {"start": daily[0]["date"], "end": daily[-1]["date"]},
+        "total_pnl": daily[-1]["cumulative"],
+        "daily_pnl": daily,
     }
 
 ---
 
 # backend/app/api/v1/scanner.py
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from app.database.session import get_db
 from app.database.models import Scan
+from app.cache.scan_cache import scan_result_cache
+from app.services import scanner_service
+from app.services.condition_compiler import ConditionError, compile_conditions
 
 router = APIRouter()
 
@@ -224,16 +220,16 @@ class CreateScanRequest(BaseModel):
     conditions: List[ScanCondition]
 
 @router.get("/scans")
-async def list_scans(user_id: int = Query(None), db: Session = Depends(get_db)):
+async def list_scans(user_id: int = Query(None), db: AsyncSession = Depends(get_db)):
     """List available scans"""
-    query = db.query(Scan)
+    query = select(Scan)
     
     if user_id:
-        query = query.filter((Scan.user_id == user_id) | (Scan.is_public == True))
+        query = query.where((Scan.user_id == user_id) | (Scan.is_public == True))
     else:
-        query = query.filter(Scan.is_public == True)
+        query = query.where(Scan.is_public == True)
     
-    scans = query.all()
+    scans = (await db.scalars(query)).all()
     
     return {
         "count": len(scans),
@@ -254,56 +250,106 @@ async def list_scans(user_id: int = Query(None), db: Session = Depends(get_db)):
 async def create_scan(
     request: CreateScanRequest,
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new scan"""
+    conditions = [c.dict() for c in request.conditions]
+    try:
+        compile_conditions(conditions, "count")
+    except ConditionError as e:
+        return {"error": str(e)}
+    
     scan = Scan(
         user_id=user_id,
         name=request.name,
         description=request.description,
-        conditions=[c.dict() for c in request.conditions],
+        conditions=conditions,
         is_public=False,
     )
     
     db.add(scan)
-    db.commit()
-    db.refresh(scan)
+    await db.commit()
     
     return {"scan_id": scan.id, "message": "Scan created successfully"}
 
+@router.put("/update-scan/{scan_id}")
+async def update_scan(
+    scan_id: int,
+    request: CreateScanRequest,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Update a scan's conditions"""
+    scan = await db.get(Scan, scan_id)
+    
+    if not scan or scan.user_id != user_id:
+        return {"error": "Scan not found"}
+    
+    conditions = [c.dict() for c in request.conditions]
+    try:
+        compile_conditions(conditions, "count")
+    except ConditionError as e:
+        return {"error": str(e)}
+    
+    scan.name = request.name
+    scan.description = request.description
+    scan.conditions = conditions
+    await db.commit()
+    # Drop the old plan; the next run compiles the new conditions
+    scanner_service.unregister(("scan", scan_id))
+    
+    return {"scan_id": scan.id, "message": "Scan updated successfully"}
+
 @router.post("/run-scan/{scan_id}")
-async def run_scan(scan_id: int, db: Session = Depends(get_db)):
+async def run_scan(
+    scan_id: int,
+    min_match: Optional[int] = Query(None, ge=1),
+    limit: int = Query(100, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db),
+):
     """Execute a scan and return results"""
-    scan = db.query(Scan).filter(Scan.id == scan_id).first()
+    scan = await db.get(Scan, scan_id)
     
     if not scan:
         return {"error": "Scan not found"}
     
-    # In production, integrate with market data service
-    results = [
-        {"symbol": "RELIANCE", "score": 85, "match_count": 4},
-        {"symbol": "TCS", "score": 78, "match_count": 3},
-        {"symbol": "INFY", "score": 72, "match_count": 3},
-        {"symbol": "WIPRO", "score": 65, "match_count": 2},
-    ]
+    engine = scanner_service.get_scanner()
+    try:
+        results, cache = await scanner_service.run_scan_cached(scan, min_match=min_match, limit=limit)
+    except ConditionError as e:
+        return {"error": str(e)}
     
     return {
         "scan_id": scan_id,
         "scan_name": scan.name,
+        "timeframe": engine.timeframe,
+        "bar_time": str(engine.bar_time) if engine.bar_time is not None else None,
+        "universe_size": len(engine),
+        "cache": cache,
         "result_count": len(results),
         "results": results,
     }
 
+@router.get("/cache-stats")
+async def scan_cache_stats():
+    """Scan result cache hit/miss counters"""
+    return scan_result_cache.stats()
+
 ---
 
 # backend/app/api/v1/strategy.py
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Dict, Any
 
 from app.database.session import get_db
 from app.database.models import Strategy
+from app.cache.response_cache import response_cache
+from app.services import scanner_service
+from app.services.audit import audit_sink
+from app.services.condition_compiler import ConditionError, compile_conditions
 
 router = APIRouter()
 
@@ -319,9 +365,10 @@ class CreateStrategyRequest(BaseModel):
     position_sizing: Dict[str, Any]
 
 @router.get("/strategies/{user_id}")
-async def get_user_strategies(user_id: int, db: Session = Depends(get_db)):
+@response_cache.cached(ttl=60, tags=("strategies:{user_id}",))
+async def get_user_strategies(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get all strategies for a user"""
-    strategies = db.query(Strategy).filter(Strategy.user_id == user_id).all()
+    strategies = (await db.scalars(select(Strategy).where(Strategy.user_id == user_id))).all()
     
     return {
         "count": len(strategies),
@@ -342,39 +389,94 @@ async def get_user_strategies(user_id: int, db: Session = Depends(get_db)):
 async def create_strategy(
     request: CreateStrategyRequest,
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new strategy"""
+    entry_conditions = [c.dict() for c in request.entry_conditions]
+    exit_conditions = [c.dict() for c in request.exit_conditions]
+    try:
+        compile_conditions(entry_conditions, "all")
+        compile_conditions(exit_conditions, "any")
+    except ConditionError as e:
+        return {"error": str(e)}
+    
     strategy = Strategy(
         user_id=user_id,
         name=request.name,
         description=request.description,
-        entry_conditions=[c.dict() for c in request.entry_conditions],
-        exit_conditions=[c.dict() for c in request.exit_conditions],
+        entry_conditions=entry_conditions,
+        exit_conditions=exit_conditions,
         position_sizing=request.position_sizing,
         is_active=False,
         is_approved=False,
     )
     
     db.add(strategy)
-    db.commit()
-    db.refresh(strategy)
+    await db.commit()
+    await response_cache.invalidate(f"strategies:{user_id}")
+    await audit_sink.log("strategy_created", user_id, "strategy", strategy.id, {"name": strategy.name})
     
     return {
         "strategy_id": strategy.id,
         "message": "Strategy created successfully. Awaiting approval.",
     }
 
+@router.put("/update-strategy/{strategy_id}")
+async def update_strategy(
+    strategy_id: int,
+    request: CreateStrategyRequest,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Update a strategy's logic"""
+    strategy = await db.get(Strategy, strategy_id)
+    
+    if not strategy or strategy.user_id != user_id:
+        return {"error": "Strategy not found"}
+    
+    entry_conditions = [c.dict() for c in request.entry_conditions]
+    exit_conditions = [c.dict() for c in request.exit_conditions]
+    try:
+        compile_conditions(entry_conditions, "all")
+        compile_conditions(exit_conditions, "any")
+    except ConditionError as e:
+        return {"error": str(e)}
+    
+    strategy.name = request.name
+    strategy.description = request.description
+    strategy.entry_conditions = entry_conditions
+    strategy.exit_conditions = exit_conditions
+    strategy.position_sizing = request.position_sizing
+    await db.commit()
+    await response_cache.invalidate(f"strategies:{user_id}")
+    await audit_sink.log("strategy_updated", user_id, "strategy", strategy.id, {"name": strategy.name})
+    # Recompile the live plan of an active strategy
+    scanner_service.register_strategy(strategy)
+    
+    return {"strategy_id": strategy.id, "message": "Strategy updated successfully"}
+
 ---
 
 # backend/app/api/v1/backtest.py
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import json
+import math
 
+from app.config import settings
 from app.database.session import get_db
 from app.database.models import Strategy, BacktestResult
+from app.services.backtest_jobs import COMPLETED, JobLimitError, job_queue
+from app.services.backtest_sweep import expand_grid, run_sweep
+from app.services.equity_curve import BINARY_MEDIA_TYPE, EquityCurve
+from app.services.ohlcv_store import ohlcv_store
 
 router = APIRouter()
 
@@ -383,58 +485,184 @@ class BacktestRequest(BaseModel):
     start_date: datetime
     end_date: datetime
     initial_capital: float = 100000
+    timeframe: str = "1d"
+    symbols: Optional[List[str]] = None  # Defaults to every symbol with data
+    cost_bps: float = settings.BACKTEST_COST_BPS
+
+class BacktestSweepRequest(BacktestRequest):
+    # Dotted path into the strategy config -> values to try,
+    # e.g. {"entry_conditions.0.params.period": [10, 20, 50]}
+    grid: Dict[str, List[Any]]
+
+def _job_params(request: BacktestRequest) -> Dict[str, Any]:
+    return {
+        "start_date": request.start_date,
+        "end_date": request.end_date,
+        "timeframe": request.timeframe,
+        "symbols": request.symbols,
+        "initial_capital": request.initial_capital,
+        "cost_bps": request.cost_bps,
+    }
+
+async def _submit(request: BacktestRequest) -> str:
+    try:
+        return await job_queue.submit(request.strategy_id, _job_params(request))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
 @router.post("/backtest-strategy")
-async def backtest_strategy(
-    request: BacktestRequest,
-    db: Session = Depends(get_db)
+async def backtest_strategy(request: BacktestRequest):
+    """Run backtest on a strategy and wait for the result"""
+    try:
+        job_id = await job_queue.submit(request.strategy_id, _job_params(request))
+    except LookupError:
+        return {"error": "Strategy not found"}
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    job = await job_queue.result(job_id)
+    if job["status"] != COMPLETED:
+        return {"error": job.get("error") or f"Backtest {job['status']}", "job_id": job_id}
+    
+    return {
+        "backtest_id": job["backtest_id"],
+        "strategy_id": request.strategy_id,
+        "job_id": job_id,
+        "symbols": job["symbols"],
+        "total_trades": job["total_trades"],
+        "final_equity": job["final_equity"],
+        "metrics": job["metrics"],
+    }
+
+@router.post("/jobs")
+async def submit_backtest_job(request: BacktestRequest):
+    """Queue a backtest and return immediately"""
+    job_id = await _submit(request)
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}")
+async def get_backtest_job(job_id: str):
+    """Get backtest job status and progress"""
+    job = await job_queue.status(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job
+
+@router.get("/jobs/{job_id}/equity-curve")
+async def get_backtest_job_equity(job_id: str):
+    """Get the latest (possibly partial) equity curve of a job"""
+    curve = await job_queue.equity_curve(job_id)
+    return {"job_id": job_id, "equity_curve": curve or []}
+
+@router.get("/jobs/{job_id}/events")
+async def stream_backtest_job(job_id: str):
+    """Server-sent events with progress and partial equity curves"""
+    async def stream():
+        async for event in job_queue.events(job_id):
+            yield f"data: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_backtest_job(job_id: str):
+    """Cancel a queued or running backtest"""
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or already finished")
+    
+    return {"job_id": job_id, "status": "cancelling"}
+
+@router.post("/backtest-sweep")
+async def backtest_sweep(
+    request: BacktestSweepRequest,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Run backtest on a strategy"""
-    strategy = db.query(Strategy).filter(Strategy.id == request.strategy_id).first()
+    """Run a strategy over every point of a parameter grid"""
+    # Counted before expand_grid builds (and deep-copies) every variant
+    count = math.prod(len(values) for values in request.grid.values())
+    if count > settings.BACKTEST_SWEEP_MAX_VARIANTS:
+        return {"error": f"Grid has {count} variants, limit is {settings.BACKTEST_SWEEP_MAX_VARIANTS}"}
+    
+    strategy = await db.get(Strategy, request.strategy_id)
     
     if not strategy:
         return {"error": "Strategy not found"}
     
-    # Mock backtest results
-    result = BacktestResult(
-        strategy_id=request.strategy_id,
-        total_return=25.5,
-        cagr=7.2,
-        max_drawdown=-12.3,
-        sharpe_ratio=1.85,
-        win_rate=58.5,
-        profit_factor=2.1,
-        expectancy=150.75,
-        start_date=request.start_date,
-        end_date=request.end_date,
+    base = {
+        "entry_conditions": strategy.entry_conditions or [],
+        "exit_conditions": strategy.exit_conditions or [],
+        "position_sizing": strategy.position_sizing or {},
+    }
+    try:
+        variants = expand_grid(base, request.grid)
+    except ValueError as e:
+        return {"error": str(e)}
+    
+    data = await run_in_threadpool(
+        ohlcv_store.load, request.timeframe, request.start_date, request.end_date, request.symbols
     )
+    if not data.symbols:
+        return {"error": "No market data for the requested period"}
     
-    db.add(result)
-    db.commit()
-    db.refresh(result)
+    outcomes = await run_in_threadpool(
+        run_sweep,
+        data,
+        [config for _, config in variants],
+        request.initial_capital,
+        request.cost_bps,
+    )
+    
+    # All successful runs go in with one multi-row INSERT in a single transaction
+    runs = []
+    rows = []
+    for (overrides, _), outcome in zip(variants, outcomes):
+        curve = outcome.pop("curve", None)
+        runs.append({"parameters": overrides, **outcome})
+        if "error" not in outcome:
+            metrics = {k: v for k, v in outcome.items() if k != "total_trades"}
+            rows.append({
+                "strategy_id": request.strategy_id,
+                "parameters": overrides,
+                "start_date": request.start_date,
+                "end_date": request.end_date,
+                "created_at": datetime.utcnow(),
+                **metrics,
+                **curve,
+            })
+    
+    if rows:
+        ids = (await db.scalars(insert(BacktestResult).returning(BacktestResult.id, sort_by_parameter_order=True), rows)).all()
+        await db.commit()
+        for run, backtest_id in zip((r for r in runs if "error" not in r), ids):
+            run["backtest_id"] = backtest_id
     
     return {
-        "backtest_id": result.id,
         "strategy_id": request.strategy_id,
-        "metrics": {
-            "total_return": result.total_return,
-            "cagr": result.cagr,
-            "max_drawdown": result.max_drawdown,
-            "sharpe_ratio": result.sharpe_ratio,
-            "win_rate": result.win_rate,
-            "profit_factor": result.profit_factor,
-            "expectancy": result.expectancy,
-        },
+        "variant_count": len(variants),
+        "symbols": len(data.symbols),
+        "runs": runs,
     }
 
+async def _load_curve(db: AsyncSession, backtest_id: int):
+    result = await db.get(BacktestResult, backtest_id, options=[undefer_group("curve")])
+    if not result:
+        return None, None
+    return result, EquityCurve.from_result(result)
+
 @router.get("/backtest-results/{backtest_id}")
-async def get_backtest_results(backtest_id: int, db: Session = Depends(get_db)):
+async def get_backtest_results(backtest_id: int, db: AsyncSession = Depends(get_db)):
     """Get detailed backtest results"""
-    result = db.query(BacktestResult).filter(BacktestResult.id == backtest_id).first()
+    result, curve = await _load_curve(db, backtest_id)
     
     if not result:
         return {"error": "Backtest not found"}
     
+    if curve is not None:
+        curve = await run_in_threadpool(curve.downsample, settings.BACKTEST_CURVE_POINTS)
+    
     return {
         "id": result.id,
         "strategy_id": result.strategy_id,
@@ -451,11 +679,305 @@ async def get_backtest_results(backtest_id: int, db: Session = Depends(get_db)):
             "profit_factor": result.profit_factor,
             "expectancy": result.expectancy,
         },
-        "equity_curve": [
+        "equity_curve": curve.points() if curve is not None else [],
+    }
+
+@router.get("/backtest-results/{backtest_id}/equity-curve")
+async def stream_backtest_equity(
+    backtest_id: int,
+    format: str = "ndjson",
+    points: int = settings.BACKTEST_CURVE_POINTS,
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream the stored equity and drawdown curve as ndjson, json or binary; points=0 for every bar"""
+    if format not in ("ndjson", "json", "binary"):
+        return {"error": "format must be ndjson, json or binary"}
+    
+    result, curve = await _load_curve(db, backtest_id)
+    if not result:
+        return {"error": "Backtest not found"}
+    if curve is None:
+        return {"error": "No equity curve stored for this backtest"}
+    
+    full_length = len(curve)
+    curve = await run_in_threadpool(curve.downsample, points)
+    headers = {"X-Curve-Points": str(len(curve)), "X-Curve-Bars": str(full_length)}
+    
+    if format == "binary":
+        return StreamingResponse(curve.binary(), media_type=BINARY_MEDIA_TYPE, headers=headers)
+    if format == "json":
+        head = {"backtest_id": backtest_id, "points": len(curve), "bars": full_length}
+        return StreamingResponse(curve.json(head), media_type="application/json", headers=headers)
+    return StreamingResponse(curve.ndjson(), media_type="application/x-ndjson", headers=headers)
+
+---
+
+# backend/app/api/v1/trading.py
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+
+from app.config import settings
+from app.security import get_admin_user_id, get_current_user_id
+from app.services.broker_gateway import ORDER_ID_MAX, Order, new_order_id, order_gateway
+from app.services.risk_engine import risk_engine
+
+router = APIRouter()
+
+class OrderRequest(BaseModel):
+    symbol: str
+    side: str  # buy, sell
+    quantity: int
+    price: Optional[float] = None  # Market order when omitted
+    order_id: Optional[str] = None  # Client idempotency key, per user; resubmitting it never places twice
+    exchange: str = "NSE"
+    product: str = "MIS"
+    position_id: Optional[int] = None
+    instrument_token: Optional[str] = None
+    strategy_id: Optional[int] = None
+    stop_loss: Optional[float] = None
+    target: Optional[float] = None
+
+class PlaceOrdersRequest(BaseModel):
+    broker: Optional[str] = None  # Defaults to the user's active credentials
+    orders: List[OrderRequest]
+
+def _order(user_id: int, request: OrderRequest) -> Order:
+    if request.side not in ("buy", "sell"):
+        raise HTTPException(status_code=422, detail="side must be buy or sell")
+    if request.quantity <= 0:
+        raise HTTPException(status_code=422, detail="quantity must be positive")
+    if request.order_id is not None and not 0 < len(request.order_id) <= ORDER_ID_MAX:
+        # Sent to the broker as the order tag
+        raise HTTPException(status_code=422, detail=f"order_id must be 1 to {ORDER_ID_MAX} characters")
+    return Order(
+        user_id=user_id,
+        symbol=request.symbol.upper(),
+        side=request.side,
+        quantity=request.quantity,
+        price=request.price,
+        order_id=request.order_id or new_order_id(),
+        exchange=request.exchange,
+        product=request.product,
+        position_id=request.position_id,
+        instrument_token=request.instrument_token,
+        strategy_id=request.strategy_id,
+        stop_loss=request.stop_loss,
+        target=request.target,
+    )
+
+@router.post("/place-orders")
+async def place_orders(request: PlaceOrdersRequest, user_id: int = Depends(get_current_user_id)):
+    """Place a batch of orders with the user's broker"""
+    if not request.orders:
+        return {"error": "No orders"}
+    if len(request.orders) > settings.ORDER_BATCH_MAX:
+        return {"error": f"At most {settings.ORDER_BATCH_MAX} orders per request"}
+    
+    orders = [_order(user_id, o) for o in request.orders]
+    account = await order_gateway.account_for(user_id, request.broker)
+    if account is None:
+        return {"error": "No active broker credentials"}
+    
+    states = await order_gateway.submit(account, orders)
+    return {"broker": account.broker, "orders": [s.as_dict() for s in states]}
+
+@router.post("/place-order")
+async def place_order(request: OrderRequest, broker: Optional[str] = None, user_id: int = Depends(get_current_user_id)):
+    """Place a single order with the user's broker"""
+    result = await place_orders(PlaceOrdersRequest(broker=broker, orders=[request]), user_id)
+    if "error" in result:
+        return result
+    return {"broker": result["broker"], **result["orders"][0]}
+
+@router.get("/orders/{order_id}")
+async def get_order(order_id: str, user_id: int = Depends(get_current_user_id)):
+    """Get the latest known state of one of the user's orders"""
+    state = await order_gateway.state(user_id, order_id)
+    
+    if not state:
+        return {"error": "Order not found"}
+    
+    return state.as_dict()
+
+@router.get("/gateway-stats")
+async def gateway_stats(admin_id: int = Depends(get_admin_user_id)):
+    """Order gateway counters per broker"""
+    return order_gateway.summary()
+
+@router.get("/risk")
+async def get_risk(user_id: int = Depends(get_current_user_id)):
+    """Pre-trade risk state and loss limit for the user"""
+    return risk_engine.snapshot(user_id)
+
+---
+
+# backend/app/api/v1/portfolio.py
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.session import get_db
+from app.services.portfolio_summary import portfolio_maintainer
+
+router = APIRouter()
+
+@router.get("/summary/{user_id}")
+async def get_portfolio_summary(user_id: int, db: AsyncSession = Depends(get_db)):
+    """Get capital, invested amount and P&L for user"""
+    # One portfolio_summary row; lags fills and ticks by up to PORTFOLIO_FLUSH_INTERVAL
+    return {"user_id": user_id, **await portfolio_maintainer.get(db, user_id)}
+
+---
+
+# backend/app/api/v1/alerts.py
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+
+from app.database.session import get_db
+from app.database.models import Alert
+from app.services.alert_engine import alert_engine, validate_alert
+from app.services.audit import audit_sink
+from app.services.condition_compiler import ConditionError
+
+router = APIRouter()
+
+class CreateAlertRequest(BaseModel):
+    alert_type: str  # price, indicator, news
+    symbol: Optional[str] = None
+    condition: Dict[str, Any]  # {"operator": ">=", "value": 2500} or a scan condition such as {"indicator": "rsi_14", "operator": "<", "value": 30}
+
+@router.get("/alerts/{user_id}")
+async def get_user_alerts(user_id: int, db: AsyncSession = Depends(get_db)):
+    """Get all alerts for a user"""
+    alerts = (await db.scalars(select(Alert).where(Alert.user_id == user_id).order_by(Alert.id))).all()
+    
+    return {
+        "count": len(alerts),
+        "alerts": [
             {
-                "date": (result.start_date + timedelta(days=i)).strftime("%Y-%m-%d"),
-                "value": 100000 + i * 500,
+                "id": a.id,
+                "alert_type": a.alert_type,
+                "symbol": a.symbol,
+                "condition": a.condition,
+                "is_active": a.is_active,
+                "alert_count": a.alert_count or 0,
+                "last_triggered": a.last_triggered.isoformat() if a.last_triggered else None,
+                "created_at": a.created_at.isoformat(),
             }
-            for i in range(int((result.end_date - result.start_date).days))
+            for a in alerts
         ],
     }
+
+@router.post("/create-alert")
+async def create_alert(
+    request: CreateAlertRequest,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Create an alert; it is evaluated from the next tick or bar"""
+    symbol = request.symbol.upper() if request.symbol else None
+    try:
+        validate_alert(request.alert_type, symbol, request.condition)
+    except ConditionError as e:
+        return {"error": str(e)}
+    
+    alert = Alert(
+        user_id=user_id,
+        alert_type=request.alert_type,
+        symbol=symbol,
+        condition=request.condition,
+        is_active=True,
+        alert_count=0,
+    )
+    
+    db.add(alert)
+    await db.commit()
+    await alert_engine.created(alert)
+    await audit_sink.log("alert_created", user_id, "alert", alert.id,
+                         {"alert_type": alert.alert_type, "symbol": symbol, "condition": request.condition})
+    
+    return {"alert_id": alert.id, "message": "Alert created successfully"}
+
+@router.delete("/delete-alert/{alert_id}")
+async def delete_alert(alert_id: int, user_id: int, db: AsyncSession = Depends(get_db)):
+    """Delete an alert"""
+    alert = await db.get(Alert, alert_id)
+    
+    if not alert or alert.user_id != user_id:
+        return {"error": "Alert not found"}
+    
+    await db.delete(alert)
+    await db.commit()
+    await alert_engine.deleted(alert_id)
+    await audit_sink.log("alert_deleted", user_id, "alert", alert_id)
+    
+    return {"alert_id": alert_id, "message": "Alert deleted successfully"}
+
+@router.get("/stats")
+async def alert_stats():
+    """Alert index counters for this worker"""
+    return alert_engine.summary()
+
+---
+
+# backend/app/api/v1/market_data.py
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from typing import List, Optional
+import os
+
+from app.config import settings
+from app.security import get_admin_user_id
+from app.services.ohlcv_ingest import FileSource, IngestError, TIMEFRAMES, YFinanceSource, ingest_jobs
+
+router = APIRouter()
+
+class IngestRequest(BaseModel):
+    timeframe: str
+    source: str = "files"  # files, yfinance
+    paths: List[str] = []  # Files or directories under INGEST_ROOT
+    symbols: List[str] = []  # yfinance symbols; bare ones are looked up on NSE
+    start: Optional[str] = None  # yfinance range, YYYY-MM-DD
+    end: Optional[str] = None
+
+def _ingest_path(path: str) -> Optional[str]:
+    root = os.path.realpath(settings.INGEST_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    return resolved if resolved == root or resolved.startswith(root + os.sep) else None
+
+# Ingest rewrites the shared market_data_cache, so it is for admins only
+@router.post("/ingest")
+async def start_ingest(request: IngestRequest, admin_id: int = Depends(get_admin_user_id)):
+    """Load historical bars into market_data_cache in the background"""
+    if request.timeframe not in TIMEFRAMES:
+        return {"error": f"timeframe must be one of {', '.join(TIMEFRAMES)}"}
+    if request.source == "files":
+        paths = [_ingest_path(p) for p in request.paths]
+        if not paths or None in paths:
+            return {"error": f"paths must name files or directories under {settings.INGEST_ROOT}"}
+        source = FileSource(paths)
+    elif request.source == "yfinance":
+        if not request.symbols:
+            return {"error": "No symbols"}
+        source = YFinanceSource(request.symbols, request.timeframe, request.start, request.end)
+    else:
+        return {"error": "source must be files or yfinance"}
+    
+    try:
+        job_id = await ingest_jobs.submit(source, request.timeframe)
+    except IngestError as e:
+        return {"error": str(e)}
+    return {"job_id": job_id, "status": "running"}
+
+@router.get("/ingest/{job_id}")
+async def get_ingest(job_id: str, admin_id: int = Depends(get_admin_user_id)):
+    """Progress and counts of an ingest job"""
+    status = await ingest_jobs.status(job_id)
+    
+    if not status:
+        return {"error": "Job not found"}
+    
+    return status
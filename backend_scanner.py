@@ -0,0 +1,2422 @@
+# backend/app/services/live_indicators.py
+import hashlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.services import indicators
+from app.services.market_data import OHLCV
+
+# Streaming counterparts of app.services.indicators. Each state holds one slot
+# per symbol and advances the whole universe by one bar with a few vector
+# operations, so the cost per bar does not depend on history length. Outputs
+# match the batch functions bar for bar, including NaN warm-up and missing
+# bars (NaN close): windows count bar positions, so a window holding a missing
+# bar is NaN, and smoothers carry the last value across the gap, as the batch
+# functions do with their forward-filled input. bench_scanner checks parity.
+
+
+class _Smoother:
+    """Exponential smoothing seeded with the first observation; missing inputs repeat the last one"""
+
+    def __init__(self, n: int, alpha: float, period: int):
+        self.alpha = alpha
+        self.period = period
+        self.value = np.full(n, np.nan)
+        self.last = np.full(n, np.nan)
+        self.count = np.zeros(n, dtype=np.int64)
+
+    def update(self, x: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        first = valid & (self.count == 0)
+        self.last = np.where(valid, x, self.last)
+        self.value = np.where(first, x, self.value)
+        rest = ~first & (self.count > 0)
+        self.value = np.where(rest, self.value + self.alpha * (self.last - self.value), self.value)
+        self.count += valid
+        return np.where(self.count >= self.period, self.value, np.nan)
+
+
+class _Window:
+    """Ring buffer of the last `period` bars for every symbol; missing bars are kept as NaN"""
+
+    def __init__(self, n: int, period: int):
+        self.period = period
+        self.buffer = np.full((period, n), np.nan)
+        self.pos = 0
+        self.missing = np.full(n, period)  # NaNs in the window
+
+    def push(self, x: np.ndarray) -> np.ndarray:
+        """Store x and return the values it evicted (NaN where missing)"""
+        evicted = self.buffer[self.pos].copy()
+        self.buffer[self.pos] = x
+        self.pos = (self.pos + 1) % self.period
+        self.missing += np.isnan(x).astype(np.int64) - np.isnan(evicted)
+        return evicted
+
+    @property
+    def full(self) -> np.ndarray:
+        """The window holds `period` real observations"""
+        return self.missing == 0
+
+
+class EMAState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, period: int = 20):
+        self._ema = _Smoother(n, 2.0 / (period + 1.0), period)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        return self._ema.update(bar["close"], valid)
+
+
+class SMAState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, period: int = 20, field: str = "close"):
+        self.field = field
+        self.period = period
+        self._window = _Window(n, period)
+        self._sum = np.zeros(n)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        x = bar[self.field]
+        evicted = self._window.push(x)
+        self._sum += np.nan_to_num(x) - np.nan_to_num(evicted)
+        return np.where(self._window.full, self._sum / self.period, np.nan)
+
+
+class VolumeSMAState(SMAState):
+    inputs = ("volume",)
+
+    def __init__(self, n: int, period: int = 20):
+        super().__init__(n, period, field="volume")
+
+
+class RSIState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, period: int = 14):
+        self._gain = _Smoother(n, 1.0 / period, period)
+        self._loss = _Smoother(n, 1.0 / period, period)
+        self._prev = np.full(n, np.nan)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        # Change from the previous bar; none across a missing bar
+        close = bar["close"]
+        has_delta = valid & ~np.isnan(self._prev)
+        delta = np.where(has_delta, close - self._prev, 0.0)
+        gain = self._gain.update(np.maximum(delta, 0.0), has_delta)
+        loss = self._loss.update(np.maximum(-delta, 0.0), has_delta)
+        self._prev = close
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = 100.0 - 100.0 / (1.0 + gain / loss)
+        return np.where((loss == 0) & ~np.isnan(gain), 100.0, out)
+
+
+class ATRState:
+    inputs = ("high", "low", "close")
+
+    def __init__(self, n: int, period: int = 14):
+        self._tr = _Smoother(n, 1.0 / period, period)
+        self._prev = np.full(n, np.nan)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        high, low = bar["high"], bar["low"]
+        tr = np.fmax(high - low, np.fmax(np.abs(high - self._prev), np.abs(low - self._prev)))
+        out = self._tr.update(tr, ~np.isnan(tr))
+        self._prev = bar["close"]  # the previous bar's close, NaN after a missing bar
+        return out
+
+
+class VWAPState:
+    inputs = ("high", "low", "close", "volume")
+
+    def __init__(self, n: int, period: int = 20):
+        self.period = period
+        self._pv = _Window(n, period)
+        self._v = _Window(n, period)
+        self._sum_pv = np.zeros(n)
+        self._sum_v = np.zeros(n)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        typical = (bar["high"] + bar["low"] + bar["close"]) / 3.0
+        pv = typical * bar["volume"]
+        self._sum_pv += np.nan_to_num(pv) - np.nan_to_num(self._pv.push(pv))
+        self._sum_v += np.nan_to_num(bar["volume"]) - np.nan_to_num(self._v.push(bar["volume"]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self._pv.full & self._v.full, self._sum_pv / self._sum_v, np.nan)
+
+
+class MACDState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, fast: int = 12, slow: int = 26):
+        self._fast = _Smoother(n, 2.0 / (fast + 1.0), fast)
+        self._slow = _Smoother(n, 2.0 / (slow + 1.0), slow)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        return self._fast.update(bar["close"], valid) - self._slow.update(bar["close"], valid)
+
+
+class MACDSignalState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, fast: int = 12, slow: int = 26, signal: int = 9):
+        self._macd = MACDState(n, fast, slow)
+        self._signal = _Smoother(n, 2.0 / (signal + 1.0), signal)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        macd = self._macd.update(bar, valid)
+        return self._signal.update(macd, ~np.isnan(macd))
+
+
+class BollingerState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, period: int = 20, std: float = 2.0, side: float = 1.0):
+        self.period = period
+        self.width = std * side
+        self._window = _Window(n, period)
+        self._sum = np.zeros(n)
+        self._sum_sq = np.zeros(n)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        x = np.nan_to_num(bar["close"])
+        evicted = np.nan_to_num(self._window.push(bar["close"]))
+        self._sum += x - evicted
+        self._sum_sq += x * x - evicted * evicted
+        mean = self._sum / self.period
+        std = np.sqrt(np.maximum(self._sum_sq / self.period - mean * mean, 0.0))
+        return np.where(self._window.full, mean + self.width * std, np.nan)
+
+
+class BBUpperState(BollingerState):
+    def __init__(self, n: int, period: int = 20, std: float = 2.0):
+        super().__init__(n, period, std, side=1.0)
+
+
+class BBLowerState(BollingerState):
+    def __init__(self, n: int, period: int = 20, std: float = 2.0):
+        super().__init__(n, period, std, side=-1.0)
+
+
+class _ExtremeState:
+    """Rolling max/min: O(period) per bar, but still a single vector reduction"""
+    field = "high"
+    reducer: Callable = staticmethod(np.max)
+
+    def __init__(self, n: int, period: int = 20):
+        self._window = _Window(n, period)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        self._window.push(bar[self.field])
+        with np.errstate(invalid="ignore"):
+            out = self.reducer(self._window.buffer, axis=0)
+        return np.where(self._window.full, out, np.nan)
+
+
+class HighestState(_ExtremeState):
+    inputs = ("high",)
+
+
+class LowestState(_ExtremeState):
+    inputs = ("low",)
+    field = "low"
+    reducer = staticmethod(np.min)
+
+
+class ROCState:
+    inputs = ("close",)
+
+    def __init__(self, n: int, period: int = 10):
+        self._window = _Window(n, period)
+
+    def update(self, bar: Dict[str, np.ndarray], valid: np.ndarray) -> np.ndarray:
+        evicted = self._window.push(bar["close"])  # the close `period` bars ago
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (bar["close"] / evicted - 1.0) * 100.0
+
+
+LIVE_INDICATORS = {
+    "sma": SMAState,
+    "ema": EMAState,
+    "rsi": RSIState,
+    "atr": ATRState,
+    "vwap": VWAPState,
+    "macd": MACDState,
+    "macd_signal": MACDSignalState,
+    "bb_upper": BBUpperState,
+    "bb_lower": BBLowerState,
+    "highest": HighestState,
+    "lowest": LowestState,
+    "roc": ROCState,
+    "volume_sma": VolumeSMAState,
+}
+
+
+class LiveIndicatorEngine:
+    """Latest bar, indicator values and a short bar history for a fixed symbol universe"""
+
+    def __init__(self, symbols, timeframe: str, history_bars: int = 500):
+        self.symbols = list(symbols)
+        self.timeframe = timeframe
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.universe = hashlib.sha1("\n".join([timeframe, *self.symbols]).encode()).hexdigest()[:16]
+        self.bar_time: Optional[np.datetime64] = None
+        self.bars_seen = 0
+
+        n = len(self.symbols)
+        self.bar = {name: np.full(n, np.nan) for name in indicators.PRICE_FIELDS}
+        self._states: Dict[Tuple, Any] = {}
+        self.values: Dict[Tuple, np.ndarray] = {}
+        self.previous: Dict[Tuple, np.ndarray] = {}
+        # Condition plan node -> result for the current bar, shared by every plan
+        self.memo: Dict[Tuple, Any] = {}
+
+        # Recent bars, so an indicator first requested mid-session starts warm
+        self._history = np.full((history_bars, len(indicators.PRICE_FIELDS), n), np.nan)
+        self._history_len = 0
+        self._history_pos = 0
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def shape(self):
+        return (len(self.symbols),)
+
+    def track(self, key: Tuple) -> Tuple:
+        """Start maintaining an operand (key from condition_compiler.operand_key) if new"""
+        if key in self.values or len(key) == 1:
+            return key
+
+        state = LIVE_INDICATORS[key[0]](len(self.symbols), **dict(key[1:]))
+        value = previous = np.full(len(self.symbols), np.nan)
+        for bar in self._replay():
+            previous = value
+            value = state.update(bar, ~np.isnan(bar["close"]))
+        self._states[key] = state
+        self.values[key] = value
+        self.previous[key] = previous
+        self.memo.clear()
+        return key
+
+    def untrack(self, key: Tuple):
+        self.memo.clear()
+        self._states.pop(key, None)
+        self.values.pop(key, None)
+        self.previous.pop(key, None)
+
+    def value(self, key: Tuple) -> np.ndarray:
+        if len(key) == 1:
+            return self.bar[key[0]]
+        return self.values[key]
+
+    def previous_value(self, key: Tuple) -> np.ndarray:
+        if len(key) == 1:
+            return self._history_bar(1)[key[0]]
+        return self.previous[key]
+
+    def on_bar(self, timestamp, open, high, low, close, volume):
+        """Advance every tracked indicator by one bar; arrays are aligned with self.symbols"""
+        bar = {
+            "open": np.asarray(open, dtype=np.float64),
+            "high": np.asarray(high, dtype=np.float64),
+            "low": np.asarray(low, dtype=np.float64),
+            "close": np.asarray(close, dtype=np.float64),
+            "volume": np.asarray(volume, dtype=np.float64),
+        }
+        valid = ~np.isnan(bar["close"])
+        self.memo.clear()
+        for key, state in self._states.items():
+            self.previous[key] = self.values[key]
+            self.values[key] = state.update(bar, valid)
+
+        for name, values in bar.items():
+            self.bar[name] = np.where(valid, values, self.bar[name])
+        self._remember(bar)
+        self.bar_time = np.datetime64(timestamp, "s")
+        self.bars_seen += 1
+
+    def on_bar_dict(self, timestamp, bars: Dict[str, Tuple[float, float, float, float, float]]):
+        """Convenience wrapper: {symbol: (open, high, low, close, volume)}; unknown symbols are ignored"""
+        columns = np.full((len(indicators.PRICE_FIELDS), len(self.symbols)), np.nan)
+        for symbol, values in bars.items():
+            i = self.index.get(symbol)
+            if i is not None:
+                columns[:, i] = values
+        self.on_bar(timestamp, *columns)
+
+    def warm_up(self, history: OHLCV):
+        """Replay stored bars (aligned to this universe) to seed states and history"""
+        rows = np.array([history.symbols.index(s) if s in history.symbols else -1 for s in self.symbols])
+        present = rows >= 0
+        for t, timestamp in enumerate(history.timestamps):
+            columns = np.full((len(indicators.PRICE_FIELDS), len(self.symbols)), np.nan)
+            for i, name in enumerate(indicators.PRICE_FIELDS):
+                columns[i, present] = getattr(history, name)[rows[present], t]
+            self.on_bar(timestamp, *columns)
+
+    def _remember(self, bar: Dict[str, np.ndarray]):
+        for i, name in enumerate(indicators.PRICE_FIELDS):
+            self._history[self._history_pos, i] = bar[name]
+        self._history_pos = (self._history_pos + 1) % len(self._history)
+        self._history_len = min(self._history_len + 1, len(self._history))
+
+    def _history_bar(self, age: int) -> Dict[str, np.ndarray]:
+        if age >= self._history_len:
+            return {name: np.full(len(self.symbols), np.nan) for name in indicators.PRICE_FIELDS}
+        row = (self._history_pos - 1 - age) % len(self._history)
+        return {name: self._history[row, i] for i, name in enumerate(indicators.PRICE_FIELDS)}
+
+    def _replay(self):
+        for age in range(self._history_len - 1, -1, -1):
+            yield self._history_bar(age)
+
+---
+
+# backend/app/services/scanner_service.py
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from app.cache.scan_cache import scan_result_cache
+from app.config import settings
+from app.database.models import Scan, Strategy
+from app.database.session import AsyncSessionLocal
+from app.services import indicators
+from app.services.condition_compiler import ConditionError, Plan, compile_conditions, evaluate, evict
+from app.services.live_indicators import LiveIndicatorEngine
+from app.services.market_data import OHLCV
+from app.services.ohlcv_store import ohlcv_store
+
+logger = logging.getLogger(__name__)
+
+# Scan conditions use the compact form {"indicator": "rsi_14", "operator": "<",
+# "value": 30} (see condition_compiler.parse_operand); strategies use the
+# StrategyCondition form. Both compile to plans that are evaluated against the
+# live engine with one memo per bar, so scans and strategies sharing an
+# indicator or a comparison compute it once.
+#
+# Public scans, active strategies and alerts are evaluated on every bar.
+# Private scans run on demand: the last SCANNER_ON_DEMAND_SCANS of them stay
+# compiled, with their indicators tracked, so a repeat run is cheap, but they
+# are not evaluated per bar, and the least recently run is dropped first.
+
+ScanConditionError = ConditionError
+
+scanner_engine: Optional[LiveIndicatorEngine] = None
+plan_registry: Optional["PlanRegistry"] = None
+_bar_listeners: List[Callable[[LiveIndicatorEngine], None]] = []
+
+Owner = Tuple[str, Any]  # ("scan", id), ("strategy", id) or ("alert", plan digest)
+
+
+class PlanRegistry:
+    """Compiled plans of the active scans and strategies on one engine.
+
+    Indicators are reference counted across plans: an indicator is tracked
+    once no matter how many plans use it, and dropped with the last of them.
+    On-demand owners (private scans) are skipped by evaluate_all and kept in
+    an LRU of at most `max_on_demand`.
+    """
+
+    def __init__(self, engine: LiveIndicatorEngine, max_on_demand: int = settings.SCANNER_ON_DEMAND_SCANS):
+        self.engine = engine
+        self.max_on_demand = max_on_demand
+        self._plans: Dict[Owner, Tuple[Plan, ...]] = {}
+        self._on_demand: "OrderedDict[Owner, None]" = OrderedDict()
+        self._operand_refs: Dict[Tuple, int] = {}
+        self._digest_refs: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def get(self, owner: Owner) -> Optional[Tuple[Plan, ...]]:
+        return self._plans.get(owner)
+
+    def register(self, owner: Owner, plans: Tuple[Plan, ...], on_demand: bool = False) -> Tuple[Plan, ...]:
+        if on_demand:
+            self._on_demand[owner] = None
+            self._on_demand.move_to_end(owner)
+        else:
+            self._on_demand.pop(owner, None)
+        current = self._plans.get(owner)
+        if current is None or [p.digest for p in current] != [p.digest for p in plans]:
+            self._add(owner, plans, current)
+        while len(self._on_demand) > self.max_on_demand:
+            self.unregister(next(iter(self._on_demand)))
+        return self._plans[owner]
+
+    def _add(self, owner: Owner, plans: Tuple[Plan, ...], current: Optional[Tuple[Plan, ...]]):
+        for plan in plans:
+            self._digest_refs[plan.digest] = self._digest_refs.get(plan.digest, 0) + 1
+            for key in plan.operands:
+                if key not in self._operand_refs:
+                    self.engine.track(key)
+                self._operand_refs[key] = self._operand_refs.get(key, 0) + 1
+        if current is not None:
+            self._release(current)
+        self._plans[owner] = plans
+
+    def unregister(self, owner: Owner):
+        self._on_demand.pop(owner, None)
+        plans = self._plans.pop(owner, None)
+        if plans is not None:
+            self._release(plans)
+
+    def _release(self, plans: Tuple[Plan, ...]):
+        for plan in plans:
+            self._digest_refs[plan.digest] -= 1
+            if not self._digest_refs[plan.digest]:
+                del self._digest_refs[plan.digest]
+                evict(plan.digest)
+            for key in plan.operands:
+                self._operand_refs[key] -= 1
+                if not self._operand_refs[key]:
+                    del self._operand_refs[key]
+                    self.engine.untrack(key)
+
+    def evaluate(self, owner: Owner) -> Tuple[np.ndarray, ...]:
+        return tuple(evaluate(plan, self.engine, self.engine.memo) for plan in self._plans[owner])
+
+    def evaluate_all(self) -> Dict[Owner, Tuple[np.ndarray, ...]]:
+        """Every plan evaluated on each bar; on-demand owners wait until they are run"""
+        return {owner: self.evaluate(owner) for owner in list(self._plans) if owner not in self._on_demand}
+
+
+def scan_plans(conditions: List[Dict[str, Any]]) -> Tuple[Plan, ...]:
+    return (compile_conditions(conditions or [], "count"),)
+
+
+def strategy_plans(entry_conditions, exit_conditions) -> Tuple[Plan, ...]:
+    return (compile_conditions(entry_conditions or [], "all"), compile_conditions(exit_conditions or [], "any"))
+
+
+def register_scan(scan) -> Tuple[Plan, ...]:
+    """Public scans are evaluated every bar; private ones on demand"""
+    return get_registry().register(("scan", scan.id), scan_plans(scan.conditions), on_demand=not scan.is_public)
+
+
+def register_strategy(strategy):
+    """Track an active strategy's indicators live; inactive strategies are dropped"""
+    if plan_registry is None:
+        return None
+    if not strategy.is_active:
+        get_registry().unregister(("strategy", strategy.id))
+        return None
+    return get_registry().register(("strategy", strategy.id), strategy_plans(strategy.entry_conditions, strategy.exit_conditions))
+
+
+def unregister(owner: Owner):
+    if plan_registry is not None:
+        plan_registry.unregister(owner)
+
+
+async def register_active():
+    """Compile public scans and active strategies so their indicators update every bar"""
+    async with AsyncSessionLocal() as db:
+        scans = (await db.scalars(select(Scan).where(Scan.is_public == True))).all()
+        strategies = (await db.scalars(select(Strategy).where(Strategy.is_active == True))).all()
+    for item, register in [(s, register_scan) for s in scans] + [(s, register_strategy) for s in strategies]:
+        try:
+            register(item)
+        except ConditionError as e:
+            logger.warning("Skipping %s %s: %s", type(item).__name__, item.id, e)
+
+
+def rank(engine: LiveIndicatorEngine, counts: np.ndarray, n_conditions: int, min_match: Optional[int] = None, limit: Optional[int] = None):
+    """Symbols ordered by matched conditions, then alphabetically"""
+    if not n_conditions or not len(engine):
+        return []
+    required = n_conditions if min_match is None else max(1, min(min_match, n_conditions))
+    hits = np.flatnonzero(counts >= required)
+    if len(hits):
+        hits = hits[np.lexsort((np.array(engine.symbols, dtype=object)[hits], -counts[hits]))]
+    close = engine.bar["close"]
+    return [
+        {
+            "symbol": engine.symbols[i],
+            "score": round(float(counts[i]) / n_conditions * 100, 1),
+            "match_count": int(counts[i]),
+            "close": None if np.isnan(close[i]) else float(close[i]),
+        }
+        for i in hits[:limit]
+    ]
+
+
+def run_scan(scan, min_match: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Evaluate a stored scan on the latest bar, (re)compiling it if its conditions changed"""
+    register_scan(scan)
+    (counts,) = get_registry().evaluate(("scan", scan.id))
+    return rank(get_scanner(), counts, len(scan.conditions or []), min_match, limit)
+
+
+async def run_scan_cached(scan, min_match: Optional[int] = None, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], str]:
+    """run_scan through the result cache; returns (results, cache source).
+
+    The cache holds every symbol matching at least one condition, so requests
+    with different min_match/limit share an entry.
+    """
+    engine = get_scanner()
+    if engine.bar_time is None:
+        return [], "miss"
+    (plan,) = register_scan(scan)
+    bar = int(engine.bar_time.astype(np.int64))
+
+    async def compute():
+        return int(engine.bar_time.astype(np.int64)), run_scan(scan, min_match=1)
+
+    ranked, source = await scan_result_cache.get_or_compute(plan.digest, engine.universe, bar, compute)
+    n_conditions = len(scan.conditions or [])
+    required = n_conditions if min_match is None else max(1, min(min_match, n_conditions))
+    return [r for r in ranked if r["match_count"] >= required][:limit], source
+
+
+def init_scanner(
+    timeframe: str = settings.SCANNER_TIMEFRAME,
+    warm: bool = True,
+    symbols: Optional[List[str]] = None,
+) -> LiveIndicatorEngine:
+    """Build the live engine over every symbol in the OHLCV store and warm it from recent history"""
+    global scanner_engine, plan_registry
+    symbols = symbols if symbols is not None else ohlcv_store.symbols(timeframe)
+    engine = LiveIndicatorEngine(symbols, timeframe, history_bars=settings.SCANNER_WARMUP_BARS)
+    if symbols and warm:
+        # Only the last SCANNER_WARMUP_BARS bars of each series are replayed
+        lookback = settings.SCANNER_WARMUP_BARS
+        starts = [bars.ts[max(len(bars) - lookback, 0)] for bars in (ohlcv_store.read(s, timeframe) for s in symbols) if len(bars)]
+        if starts:
+            history = ohlcv_store.load(timeframe, start=min(starts), symbols=symbols)
+            tail = slice(-lookback, None)
+            engine.warm_up(OHLCV(
+                symbols=history.symbols,
+                timeframe=timeframe,
+                timestamps=history.timestamps[tail],
+                **{name: getattr(history, name)[:, tail] for name in indicators.PRICE_FIELDS},
+            ))
+    scanner_engine = engine
+    plan_registry = PlanRegistry(engine)
+    logger.info("Scanner ready: %d symbols on %s bars", len(symbols), timeframe)
+    return engine
+
+
+def fresh_bars(engine: LiveIndicatorEngine) -> OHLCV:
+    """Bars written to the store after the engine's latest bar"""
+    start = None if engine.bar_time is None else int(engine.bar_time.astype(np.int64)) + 1
+    return ohlcv_store.load(engine.timeframe, start=start, symbols=engine.symbols)
+
+
+def catch_up(engine: LiveIndicatorEngine) -> int:
+    if not len(engine):
+        return 0
+    fresh = fresh_bars(engine)
+    engine.warm_up(fresh)
+    return len(fresh.timestamps)
+
+
+async def run_scanner_updates():
+    """Background task: advance the live engine as new bars land in the store.
+
+    Reading the store happens in the threadpool; the engine itself is only
+    touched on the event loop, so requests never see a half-applied bar.
+    """
+    while True:
+        await asyncio.sleep(settings.SCANNER_POLL_INTERVAL)
+        engine = scanner_engine
+        if engine is None or not len(engine):
+            continue
+        try:
+            fresh = await run_in_threadpool(fresh_bars, engine)
+            if len(fresh.timestamps):
+                engine.warm_up(fresh)
+                _after_bar(engine)
+        except Exception:
+            logger.exception("Scanner update failed")
+
+
+def add_bar_listener(callback: Callable[[LiveIndicatorEngine], None]):
+    """Call back after every bar the live engine applies, once plans are evaluated"""
+    _bar_listeners.append(callback)
+
+
+def remove_bar_listener(callback: Callable[[LiveIndicatorEngine], None]):
+    if callback in _bar_listeners:
+        _bar_listeners.remove(callback)
+
+
+def _after_bar(engine: LiveIndicatorEngine):
+    scan_result_cache.on_bar(int(engine.bar_time.astype(np.int64)))
+    plan_registry.evaluate_all()
+    for callback in _bar_listeners:
+        try:
+            callback(engine)
+        except Exception:
+            logger.exception("Bar listener failed")
+
+
+def apply_bar(timestamp, bars: Dict[str, Tuple[float, float, float, float, float]]):
+    """Advance the live engine by one bar pushed by a feed (e.g. a replay) instead of read from the store"""
+    engine = get_scanner()
+    engine.on_bar_dict(timestamp, bars)
+    _after_bar(engine)
+
+
+def get_scanner() -> LiveIndicatorEngine:
+    if scanner_engine is None:
+        raise RuntimeError("Scanner is not initialized; call init_scanner() first")
+    return scanner_engine
+
+
+def get_registry() -> PlanRegistry:
+    if plan_registry is None:
+        raise RuntimeError("Scanner is not initialized; call init_scanner() first")
+    return plan_registry
+
+---
+
+# backend/app/services/alert_engine.py
+import asyncio
+import json
+import logging
+import math
+import os
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, select, update
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import Alert
+from app.database.session import AsyncSessionLocal
+from app.services import scanner_service
+from app.services.condition_compiler import ConditionError, Plan, compile_conditions
+from app.services.live_indicators import LiveIndicatorEngine
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+# Active alerts are indexed in memory so that neither a tick nor a bar walks
+# all of them:
+#   - price alerts sit in two sorted threshold lists per symbol, one to fire on
+#     the way up and one on the way down. A tick compares its price with the
+#     nearest threshold of each list and only when that one is crossed bisects
+#     off the crossed slice, so the cost is O(log n + fired).
+#   - crosses_above / crosses_below alerts wait outside the lists until a tick
+#     has the price on the side they cross from, so one created with the
+#     price already past its threshold fires only after a move back through it.
+#   - indicator alerts compile like scans and are grouped by plan. Each plan is
+#     registered once in the scanner's PlanRegistry, so its indicators and
+#     comparisons are shared with scans, strategies and every other alert, and
+#     it is evaluated once per bar for all symbols.
+# Alerts are one-shot: a fired alert leaves the index and is deactivated.
+# Every worker holds the same index and sees the same ticks, so each pushes
+# fired alerts to its own "alerts" WebSocket connections; the batched
+# conditional UPDATE decides which worker hands an alert to the trigger
+# listeners. Creates and deletes are broadcast on ALERT_CHANNEL and a periodic
+# sync with the table catches anything missed.
+
+# Operator -> tie rank. Up-list entries (threshold, rank, id) with threshold
+# below the price, or equal to it with rank 0, have fired; down-list entries
+# above the price, or equal to it with rank 1, have fired.
+UP = {">": 1, ">=": 0, "crosses_above": 1, "above": 0}
+DOWN = {"<": 0, "<=": 1, "crosses_below": 0, "below": 1}
+CROSSING = ("crosses_above", "crosses_below")
+
+ALERT_TYPES = ("price", "indicator", "news")
+
+Entry = Tuple[float, int, int]
+
+
+def price_key(condition: Dict[str, Any]) -> Tuple[str, float, int]:
+    """{"operator": ">=", "value": 2500} -> ("up", 2500.0, 0)"""
+    operator = condition.get("operator")
+    if operator in UP:
+        side, rank = "up", UP[operator]
+    elif operator in DOWN:
+        side, rank = "down", DOWN[operator]
+    else:
+        raise ConditionError(f"Unknown operator: {operator}")
+    try:
+        threshold = float(condition["value"])
+    except (KeyError, TypeError, ValueError):
+        raise ConditionError("Price alert needs a numeric 'value'")
+    if math.isnan(threshold):
+        raise ConditionError("Price alert needs a numeric 'value'")
+    return side, threshold, rank
+
+
+def indicator_plan(condition: Dict[str, Any]) -> Plan:
+    """A compact scan condition, or {"conditions": [...], "combine": "all" | "any"}"""
+    if "conditions" in condition:
+        combine = condition.get("combine", "all")
+        if combine not in ("all", "any"):
+            raise ConditionError(f"Unknown combiner: {combine}")
+        return compile_conditions(condition["conditions"], combine)
+    return compile_conditions([condition], "all")
+
+
+def validate_alert(alert_type: str, symbol: Optional[str], condition: Dict[str, Any]):
+    if alert_type not in ALERT_TYPES:
+        raise ConditionError(f"Unknown alert type: {alert_type}")
+    if alert_type == "news":
+        return
+    if not symbol:
+        raise ConditionError(f"A {alert_type} alert needs a symbol")
+    if alert_type == "price":
+        price_key(condition)
+    else:
+        indicator_plan(condition)
+
+
+@dataclass
+class IndexedAlert:
+    id: int
+    user_id: int
+    alert_type: str
+    symbol: Optional[str]
+    condition: Dict[str, Any]
+    key: Optional[Tuple] = None  # ("up" | "down", threshold, rank) or (plan digest, symbol index) once indexed
+
+    @classmethod
+    def from_row(cls, a: Alert) -> "IndexedAlert":
+        return cls(
+            id=a.id,
+            user_id=a.user_id,
+            alert_type=a.alert_type,
+            symbol=a.symbol.upper() if a.symbol else None,
+            condition=a.condition or {},
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "alert_type": self.alert_type,
+            "symbol": self.symbol,
+            "condition": self.condition,
+        }
+
+
+class AlertEngine:
+    def __init__(self):
+        self.alerts: Dict[int, IndexedAlert] = {}
+        self._up: Dict[str, List[Entry]] = {}
+        self._down: Dict[str, List[Entry]] = {}
+        self._unarmed: Dict[str, Set[int]] = {}  # symbol -> crossing alerts waiting for the price on their start side
+        self._groups: Dict[str, Dict[int, Set[int]]] = {}  # plan digest -> symbol index -> alert ids
+        self._retired: Set[int] = set()  # fired here; kept out of sync until the table agrees
+        self._to_push: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        self._to_claim: List[Dict[str, Any]] = []
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._pubsub = None
+        self._worker_id = f"{os.getpid()}-{id(self)}"
+        self.ready = False
+        self.stats = {"ticks": 0, "crossings": 0, "bars": 0, "fired": 0, "claimed": 0, "pushes": 0, "remote_changes": 0}
+
+    # Index maintenance
+
+    def add(self, alert: IndexedAlert) -> bool:
+        """Index an active alert; False if it cannot be evaluated here (news, or a symbol the scanner does not track)"""
+        self.remove(alert.id)
+        if alert.alert_type == "price":
+            alert.key = price_key(alert.condition)
+            if alert.condition.get("operator") in CROSSING:
+                self._unarmed.setdefault(alert.symbol, set()).add(alert.id)
+            else:
+                self._index_price(alert)
+        elif alert.alert_type == "indicator":
+            self._index_indicator(alert)
+        self.alerts[alert.id] = alert
+        return alert.key is not None
+
+    def _index_price(self, alert: IndexedAlert):
+        side, threshold, rank = alert.key
+        book = self._up if side == "up" else self._down
+        insort(book.setdefault(alert.symbol, []), (threshold, rank, alert.id))
+
+    def _arm(self, symbol: str, waiting: Set[int], price: float):
+        """Index the crossing alerts the price is now strictly on the starting side of"""
+        for alert_id in list(waiting):
+            alert = self.alerts[alert_id]
+            side, threshold, _ = alert.key
+            if price < threshold if side == "up" else price > threshold:
+                waiting.discard(alert_id)
+                self._index_price(alert)
+        if not waiting:
+            del self._unarmed[symbol]
+
+    def _index_indicator(self, alert: IndexedAlert):
+        registry = scanner_service.plan_registry
+        i = None if registry is None else registry.engine.index.get(alert.symbol)
+        if i is None:
+            return
+        plan = indicator_plan(alert.condition)
+        group = self._groups.get(plan.digest)
+        if group is None:
+            registry.register(("alert", plan.digest), (plan,))
+            group = self._groups[plan.digest] = {}
+        group.setdefault(i, set()).add(alert.id)
+        alert.key = (plan.digest, i)
+
+    def remove(self, alert_id: int) -> Optional[IndexedAlert]:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is not None:
+            self._unindex(alert)
+        return alert
+
+    def _unindex(self, alert: IndexedAlert):
+        key, alert.key = alert.key, None
+        if key is None:
+            return
+        if alert.alert_type == "price":
+            waiting = self._unarmed.get(alert.symbol)
+            if waiting is not None and alert.id in waiting:
+                waiting.discard(alert.id)
+                if not waiting:
+                    del self._unarmed[alert.symbol]
+                return
+            side, threshold, rank = key
+            book = self._up if side == "up" else self._down
+            entries = book.get(alert.symbol)
+            if not entries:
+                return
+            entry = (threshold, rank, alert.id)
+            j = bisect_left(entries, entry)
+            if j < len(entries) and entries[j] == entry:
+                del entries[j]
+            if not entries:
+                del book[alert.symbol]
+            return
+        digest, i = key
+        group = self._groups.get(digest)
+        if group is None:
+            return
+        ids = group.get(i)
+        if ids is not None:
+            ids.discard(alert.id)
+            if not ids:
+                del group[i]
+        if not group:
+            del self._groups[digest]
+            scanner_service.unregister(("alert", digest))
+
+    async def sync(self):
+        """Reconcile with active alerts in the DB; only rows missing from the index are loaded"""
+        async with AsyncSessionLocal() as db:
+            active = set((await db.scalars(select(Alert.id).where(Alert.is_active == True))).all())
+            self._retired &= active
+            missing = active - set(self.alerts) - self._retired
+            rows = []
+            if missing:
+                rows = (await db.scalars(select(Alert).where(Alert.id.in_(missing)))).all()
+        for row in rows:
+            try:
+                self.add(IndexedAlert.from_row(row))
+            except ConditionError as e:
+                logger.warning("Skipping alert %s: %s", row.id, e)
+        for alert_id in set(self.alerts) - active:
+            self.remove(alert_id)
+
+    async def created(self, row: Alert):
+        """Index a new alert here and on every other worker"""
+        alert = IndexedAlert.from_row(row)
+        self.add(alert)
+        await self._broadcast({"op": "add", "alert": alert.as_dict()})
+
+    async def deleted(self, alert_id: int):
+        self.remove(alert_id)
+        await self._broadcast({"op": "remove", "id": alert_id})
+
+    async def _broadcast(self, change: Dict[str, Any]):
+        await get_redis().publish(settings.ALERT_CHANNEL, json.dumps({"worker": self._worker_id, **change}))
+
+    def apply_change(self, change: Dict[str, Any]):
+        if change["op"] == "add":
+            self.add(IndexedAlert(**change["alert"]))
+        else:
+            self.remove(change["id"])
+
+    # Evaluation
+
+    def on_tick(self, tick: Dict[str, Any]):
+        self.stats["ticks"] += 1
+        symbol = tick["symbol"]
+        up = self._up.get(symbol)
+        down = self._down.get(symbol)
+        waiting = self._unarmed.get(symbol)
+        if up is None and down is None and waiting is None:
+            return
+        price = tick.get("ltp", tick.get("price"))
+        if price is None:
+            return
+        price = float(price)
+        if waiting is not None:
+            # Armed strictly on the starting side, so nothing armed here fires on this tick
+            self._arm(symbol, waiting, price)
+            up = self._up.get(symbol)
+            down = self._down.get(symbol)
+        crossed: List[Entry] = []
+        if up is not None and price >= up[0][0]:
+            n = bisect_right(up, (price, 0, math.inf))
+            crossed += up[:n]
+            del up[:n]
+            if not up:
+                del self._up[symbol]
+        if down is not None and price <= down[-1][0]:
+            n = bisect_left(down, (price, 1, -math.inf))
+            crossed += down[n:]
+            del down[n:]
+            if not down:
+                del self._down[symbol]
+        if not crossed:
+            return
+        self.stats["crossings"] += 1
+        for _, _, alert_id in crossed:
+            alert = self.alerts[alert_id]
+            alert.key = None  # already out of the threshold list
+            self._fire(alert, price)
+
+    def on_bar(self, engine: LiveIndicatorEngine):
+        """Evaluate each indicator alert plan once, for the symbols that have alerts on it"""
+        if not self._groups:
+            return
+        self.stats["bars"] += 1
+        registry = scanner_service.get_registry()
+        close = engine.bar["close"]
+        fired: List[Tuple[int, int]] = []
+        for digest, group in self._groups.items():
+            (matches,) = registry.evaluate(("alert", digest))
+            rows = np.fromiter(group, dtype=np.int64, count=len(group))
+            for i in rows[matches[rows]]:
+                fired += [(alert_id, int(i)) for alert_id in group[int(i)]]
+        for alert_id, i in fired:
+            alert = self.alerts[alert_id]
+            self._unindex(alert)
+            self._fire(alert, None if np.isnan(close[i]) else float(close[i]))
+
+    def _fire(self, alert: IndexedAlert, price: Optional[float]):
+        del self.alerts[alert.id]
+        self._retired.add(alert.id)
+        event = {**alert.as_dict(), "triggered_price": price, "triggered_at": datetime.utcnow().isoformat()}
+        self._to_push[alert.user_id].append(event)
+        self._to_claim.append(event)
+        self.stats["fired"] += 1
+
+    # Delivery
+
+    def add_trigger_listener(self, callback: Callable[[List[Dict[str, Any]]], None]):
+        """Call back with the fired alerts this worker deactivated, once per flush"""
+        self._listeners.append(callback)
+
+    def remove_trigger_listener(self, callback: Callable[[List[Dict[str, Any]]], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def push(self) -> int:
+        """One frame per user with the alerts fired since the last push"""
+        if not self._to_push:
+            return 0
+        to_push, self._to_push = self._to_push, defaultdict(list)
+        frames = 0
+        for user_id, events in to_push.items():
+            if manager.has_listeners(user_id, "alerts"):
+                manager.send_to_user(user_id, "alerts", json.dumps({"type": "alerts", "data": events}))
+                frames += 1
+        self.stats["pushes"] += frames
+        return frames
+
+    async def flush(self) -> int:
+        """Deactivate fired alerts in one UPDATE; the rows it changed are this worker's to deliver"""
+        self.push()
+        if not self._to_claim:
+            return 0
+        events, self._to_claim = self._to_claim, []
+        try:
+            async with AsyncSessionLocal() as db:
+                claimed = set((await db.scalars(
+                    update(Alert)
+                    .where(Alert.id.in_([e["id"] for e in events]), Alert.is_active == True)
+                    .values(
+                        is_active=False,
+                        alert_count=func.coalesce(Alert.alert_count, 0) + 1,
+                        last_triggered=datetime.utcnow(),
+                    )
+                    .returning(Alert.id)
+                    .execution_options(synchronize_session=False)
+                )).all())
+                await db.commit()
+        except Exception:
+            self._to_claim = events + self._to_claim  # retried on the next flush
+            raise
+        won = [e for e in events if e["id"] in claimed]
+        self.stats["claimed"] += len(won)
+        if won:
+            for callback in self._listeners:
+                try:
+                    callback(won)
+                except Exception:
+                    logger.exception("Alert trigger listener failed")
+        return len(won)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "alerts": len(self.alerts),
+            "price_thresholds": sum(len(e) for e in self._up.values()) + sum(len(e) for e in self._down.values()),
+            "price_symbols": len(self._up.keys() | self._down.keys()),
+            "unarmed": sum(len(w) for w in self._unarmed.values()),
+            "indicator_plans": len(self._groups),
+            "pending": len(self._to_claim),
+            **self.stats,
+        }
+
+    # Lifecycle
+
+    async def start(self):
+        self._pubsub = get_redis().pubsub()
+        await self._pubsub.subscribe(settings.ALERT_CHANNEL)
+        await self.sync()
+        manager.add_tick_listener(self.on_tick)
+        scanner_service.add_bar_listener(self.on_bar)
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._sync_loop()),
+        ]
+        self.ready = True
+
+    async def stop(self):
+        manager.remove_tick_listener(self.on_tick)
+        scanner_service.remove_bar_listener(self.on_bar)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final alert flush failed")
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self.ready = False
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                change = json.loads(message["data"])
+                if change.get("worker") != self._worker_id:
+                    change.pop("worker", None)
+                    self.apply_change(change)
+                    self.stats["remote_changes"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Alert change listener: bad message")
+                await asyncio.sleep(0.1)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.ALERT_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Alert flush failed")
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(settings.ALERT_SYNC_INTERVAL)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Alert sync failed")
+
+
+alert_engine = AlertEngine()
+
+---
+
+# backend/app/services/notifications.py
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import aiosmtplib
+import httpx
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database.models import User
+from app.database.session import AsyncSessionLocal
+from app.services.alert_engine import alert_engine
+from app.services.broker_gateway import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Fired alerts reach users' Telegram, WhatsApp and email through a durable
+# outbox:
+#   - each alert becomes one row per enabled channel in a local SQLite outbox
+#     (WAL, shared by the workers on a host), so a restart loses nothing
+#   - a row is due NOTIFY_COALESCE_WINDOW after it was queued; a claim leases
+#     every due row of a channel and merges each recipient's rows into one
+#     message, so twenty alerts firing at the open become one message
+#   - each channel has a pool of sender tasks behind one rate limiter and one
+#     set of pooled connections: keep-alive HTTP clients for the Telegram Bot
+#     API and Twilio's WhatsApp API, logged-in SMTP connections for email
+#   - delivered rows are deleted and failed ones rescheduled with exponential
+#     backoff (or the server's retry-after), in batched outbox writes; after
+#     NOTIFY_MAX_ATTEMPTS or a permanent error rows stay behind as dead
+# Delivery is at least once: a worker dying between send and ack resends the
+# message after its lease runs out.
+
+Row = Tuple[str, str, Optional[int], str, float]  # channel, recipient, user_id, text, due
+
+RECIPIENT_CACHE_SIZE = 10000
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _rule(condition: Dict[str, Any]) -> str:
+    left = condition.get("indicator") or condition.get("field") or "price"
+    right = condition.get("compare", condition.get("value"))
+    if isinstance(right, dict):
+        right = right.get("indicator") or right.get("field")
+    return f"{left} {condition.get('operator')} {right}"
+
+
+def describe(event: Dict[str, Any]) -> str:
+    """One line for a fired alert, e.g. "TCS: price >= 3500 (at 3501.2)" """
+    condition = event.get("condition") or {}
+    if "conditions" in condition:
+        joiner = " and " if condition.get("combine", "all") == "all" else " or "
+        rule = joiner.join(_rule(c) for c in condition["conditions"])
+    else:
+        rule = _rule(condition)
+    price = event.get("triggered_price")
+    return f"{event.get('symbol')}: {rule}" + (f" (at {price:g})" if price is not None else "")
+
+
+class Outbox:
+    """SQLite queue of undelivered notifications; calls block, so run them in the threadpool"""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL commits survive a process crash
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " channel TEXT NOT NULL,"
+            " recipient TEXT NOT NULL,"
+            " user_id INTEGER,"
+            " text TEXT NOT NULL,"
+            " due REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " leased_until REAL NOT NULL DEFAULT 0,"
+            " dead INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (channel, dead, due)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _write(self, sql: str, params: Iterable) -> int:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                count = self._db.executemany(sql, params).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return count
+
+    def put(self, rows: List[Row]) -> int:
+        return self._write("INSERT INTO outbox (channel, recipient, user_id, text, due) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def claim(self, channel: str, limit: int, lease: float) -> List[Tuple[int, str, str, int]]:
+        """Lease every due row of up to `limit` recipients, longest waiting first: (id, recipient, text, attempts)"""
+        now = time.time()
+        ready = "channel = ? AND dead = 0 AND due <= ? AND leased_until <= ?"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    f"UPDATE outbox SET leased_until = ? WHERE {ready} AND recipient IN ("
+                    f" SELECT recipient FROM outbox WHERE {ready} GROUP BY recipient ORDER BY MIN(due) LIMIT ?)"
+                    " RETURNING id, recipient, text, attempts",
+                    (now + lease, channel, now, now, channel, now, now, limit),
+                ).fetchall()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return sorted(rows)
+
+    def next_due(self, channel: str) -> Optional[float]:
+        with self._lock:
+            (due,) = self._db.execute(
+                "SELECT MIN(MAX(due, leased_until)) FROM outbox WHERE channel = ? AND dead = 0", (channel,)
+            ).fetchone()
+        return due
+
+    def ack(self, done: List[int], retry: List[Tuple[float, str, int]], dead: List[Tuple[str, int]], release: List[int]):
+        """Apply a batch of delivery outcomes in one transaction"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in done])
+                self._db.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, due = ?, error = ?, leased_until = 0 WHERE id = ?", retry
+                )
+                self._db.executemany("UPDATE outbox SET attempts = attempts + 1, dead = 1, error = ? WHERE id = ?", dead)
+                self._db.executemany("UPDATE outbox SET leased_until = 0 WHERE id = ?", [(i,) for i in release])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self._db.execute("SELECT channel, dead, COUNT(*) FROM outbox GROUP BY channel, dead").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for channel, dead, count in rows:
+            counts.setdefault(channel, {"queued": 0, "dead": 0})["dead" if dead else "queued"] = count
+        return counts
+
+
+@dataclass
+class Message:
+    channel: str
+    recipient: str
+    ids: List[int]  # outbox rows merged into this message
+    attempts: int
+    subject: str
+    text: str
+
+
+class Channel:
+    """Transport for one notification channel"""
+
+    name = ""
+    max_lines = 20  # alerts listed in one message before "...and N more"
+
+    def __init__(self):
+        # Providers count messages per rolling second, so space them evenly
+        self.limiter = RateLimiter(settings.NOTIFY_RATE_LIMITS[self.name], burst=1)
+        self.stats = {"sent": 0, "failed": 0, "throttled": 0}
+
+    def configured(self) -> bool:
+        raise NotImplementedError
+
+    async def send(self, message: Message):
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def coalesce(self, rows: List[Tuple[int, str, str, int]]) -> List[Message]:
+        """One message per recipient from claimed rows, in claim order"""
+        by_recipient: Dict[str, List[Tuple[int, str, str, int]]] = {}
+        for row in rows:
+            by_recipient.setdefault(row[1], []).append(row)
+        messages = []
+        for recipient, group in by_recipient.items():
+            lines = [text for _, _, text, _ in group]
+            text = "\n".join(lines[:self.max_lines])
+            if len(lines) > self.max_lines:
+                text += f"\n...and {len(lines) - self.max_lines} more"
+            subject = "Alert triggered" if len(lines) == 1 else f"{len(lines)} alerts triggered"
+            messages.append(Message(
+                self.name, recipient, [i for i, _, _, _ in group], max(a for _, _, _, a in group), subject, text,
+            ))
+        return messages
+
+
+class HTTPChannel(Channel):
+    def __init__(self, base_url: str):
+        super().__init__()
+        workers = settings.NOTIFY_WORKERS[self.name]
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=workers, max_keepalive_connections=workers, keepalive_expiry=60),
+            timeout=settings.NOTIFY_TIMEOUT,
+        )
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def _post(self, path: str, **kwargs) -> httpx.Response:
+        try:
+            response = await self.http.post(path, **kwargs)
+        except httpx.TransportError as e:
+            raise DeliveryError(type(e).__name__, retryable=True)
+        if response.status_code == 429:
+            self.stats["throttled"] += 1
+            raise DeliveryError("HTTP 429", retryable=True, retry_after=self.retry_after(response))
+        if response.status_code >= 500:
+            raise DeliveryError(f"HTTP {response.status_code}", retryable=True)
+        if response.status_code >= 400:
+            raise DeliveryError(self.error_message(response))
+        return response
+
+    def retry_after(self, response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        return float(value) if value else None
+
+    def error_message(self, response: httpx.Response) -> str:
+        return f"HTTP {response.status_code}"
+
+
+class TelegramChannel(HTTPChannel):
+    name = "telegram"
+    max_lines = 40  # 4096 characters per message
+
+    def __init__(self):
+        super().__init__(settings.TELEGRAM_API_URL)
+
+    def configured(self) -> bool:
+        return bool(settings.TELEGRAM_BOT_TOKEN)
+
+    async def send(self, message: Message):
+        await self._post(f"/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage", json={"chat_id": message.recipient, "text": message.text})
+
+    def retry_after(self, response: httpx.Response) -> Optional[float]:
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return super().retry_after(response)
+
+    def error_message(self, response: httpx.Response) -> str:
+        try:
+            return response.json()["description"]
+        except (ValueError, KeyError):
+            return super().error_message(response)
+
+
+class WhatsAppChannel(HTTPChannel):
+    """WhatsApp through Twilio's Messages API; WHATSAPP_API_KEY is the account's auth token"""
+
+    name = "whatsapp"
+    max_lines = 15  # 1600 characters per message
+
+    def __init__(self):
+        super().__init__(settings.WHATSAPP_API_URL)
+
+    def configured(self) -> bool:
+        return bool(settings.WHATSAPP_API_KEY and settings.WHATSAPP_ACCOUNT_SID and settings.WHATSAPP_FROM)
+
+    async def send(self, message: Message):
+        await self._post(
+            f"/2010-04-01/Accounts/{settings.WHATSAPP_ACCOUNT_SID}/Messages.json",
+            data={"From": f"whatsapp:{settings.WHATSAPP_FROM}", "To": f"whatsapp:{message.recipient}", "Body": message.text},
+            auth=(settings.WHATSAPP_ACCOUNT_SID, settings.WHATSAPP_API_KEY),
+        )
+
+    def error_message(self, response: httpx.Response) -> str:
+        try:
+            return response.json()["message"]
+        except (ValueError, KeyError):
+            return super().error_message(response)
+
+
+class EmailChannel(Channel):
+    """Up to NOTIFY_SMTP_POOL_SIZE logged-in SMTP connections, opened on demand and reused"""
+
+    name = "email"
+    max_lines = 200
+
+    def __init__(self):
+        super().__init__()
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._open = 0
+        self.stats["connects"] = 0
+
+    def configured(self) -> bool:
+        return bool(settings.SMTP_SERVER and settings.SMTP_EMAIL)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_SERVER,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_EMAIL if settings.SMTP_PASSWORD else None,
+            password=settings.SMTP_PASSWORD or None,
+            timeout=settings.NOTIFY_TIMEOUT,
+        )
+        await smtp.connect()
+        self.stats["connects"] += 1
+        return smtp
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        if self._idle.empty() and self._open < settings.NOTIFY_SMTP_POOL_SIZE:
+            self._open += 1
+            try:
+                return await self._connect()
+            except Exception:
+                self._open -= 1
+                raise
+        return await self._idle.get()
+
+    def _discard(self, smtp: aiosmtplib.SMTP):
+        self._open -= 1
+        smtp.close()
+
+    async def _reset(self, smtp: aiosmtplib.SMTP):
+        """Return a connection to the pool after a refused message"""
+        try:
+            await smtp.rset()
+        except (aiosmtplib.SMTPException, OSError):
+            self._discard(smtp)
+        else:
+            self._idle.put_nowait(smtp)
+
+    async def send(self, message: Message):
+        email = EmailMessage()
+        email["From"] = settings.SMTP_EMAIL
+        email["To"] = message.recipient
+        email["Subject"] = message.subject
+        email.set_content(message.text)
+        for attempt in range(2):
+            try:
+                smtp = await self._acquire()
+            except (aiosmtplib.SMTPException, OSError) as e:
+                raise DeliveryError(type(e).__name__, retryable=True)
+            try:
+                await smtp.send_message(email)
+            except aiosmtplib.SMTPServerDisconnected:
+                # Servers drop idle connections; try once more on another
+                self._discard(smtp)
+                if attempt:
+                    raise DeliveryError("SMTPServerDisconnected", retryable=True)
+                continue
+            except aiosmtplib.SMTPRecipientsRefused as e:
+                await self._reset(smtp)
+                raise DeliveryError(str(e))
+            except aiosmtplib.SMTPResponseException as e:
+                await self._reset(smtp)
+                raise DeliveryError(f"SMTP {e.code}: {e.message}", retryable=400 <= e.code < 500)
+            except (aiosmtplib.SMTPException, OSError) as e:
+                self._discard(smtp)
+                raise DeliveryError(type(e).__name__, retryable=True)
+            except BaseException:
+                self._discard(smtp)
+                raise
+            self._idle.put_nowait(smtp)
+            return
+
+    async def aclose(self):
+        while not self._idle.empty():
+            smtp = self._idle.get_nowait()
+            self._open -= 1
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+
+CHANNELS = {
+    "telegram": TelegramChannel,
+    "whatsapp": WhatsAppChannel,
+    "email": EmailChannel,
+}
+
+
+class NotificationDispatcher:
+    def __init__(self, outbox_path: Optional[str] = None):
+        self.outbox_path = outbox_path or settings.NOTIFY_QUEUE_PATH
+        self.outbox: Optional[Outbox] = None
+        self.channels: Dict[str, Channel] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._recipients: "OrderedDict[int, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self._done: List[int] = []
+        self._retry: List[Tuple[float, str, int]] = []
+        self._dead: List[Tuple[str, int]] = []
+        self._unsent: List[int] = []
+        self._claimers: List[asyncio.Task] = []
+        self._senders: List[asyncio.Task] = []
+        self._tasks: List[asyncio.Task] = []
+        self._intake: set = set()
+        self.stats = {"queued": 0, "messages": 0, "coalesced": 0, "delivered": 0, "retried": 0, "dead": 0}
+
+    # Intake
+
+    def on_alerts(self, events: List[Dict[str, Any]]):
+        """alert_engine trigger listener: queue notifications for alerts this worker deactivated"""
+        task = asyncio.create_task(self.notify_alerts(events))
+        self._intake.add(task)
+        task.add_done_callback(self._intake_done)
+
+    def _intake_done(self, task: asyncio.Task):
+        self._intake.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Queueing alert notifications failed", exc_info=task.exception())
+
+    async def notify_alerts(self, events: List[Dict[str, Any]]) -> int:
+        by_user: Dict[int, List[str]] = {}
+        for event in events:
+            by_user.setdefault(event["user_id"], []).append(describe(event))
+        addresses = await self.recipients(list(by_user))
+        due = time.time() + settings.NOTIFY_COALESCE_WINDOW
+        rows = [
+            (channel, address, user_id, text, due)
+            for user_id, texts in by_user.items()
+            for channel, address in addresses.get(user_id, {}).items()
+            if channel in self.channels
+            for text in texts
+        ]
+        return await self.enqueue(rows)
+
+    async def enqueue(self, rows: List[Row]) -> int:
+        if not rows:
+            return 0
+        await run_in_threadpool(self.outbox.put, rows)
+        self.stats["queued"] += len(rows)
+        for channel in {row[0] for row in rows}:
+            if channel in self._wake:
+                self._wake[channel].set()
+        return len(rows)
+
+    async def recipients(self, user_ids: List[int]) -> Dict[int, Dict[str, str]]:
+        """channel -> address for each user's enabled channels, cached for NOTIFY_RECIPIENT_TTL"""
+        now = time.monotonic()
+        found: Dict[int, Dict[str, str]] = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self._recipients.get(user_id)
+            if cached is not None and cached[0] > now:
+                found[user_id] = cached[1]
+            else:
+                missing.append(user_id)
+        if missing:
+            async with AsyncSessionLocal() as db:
+                users = (await db.scalars(select(User).where(User.id.in_(missing)))).all()
+            for user in users:
+                contacts = {"email": user.email, "whatsapp": user.phone_number, "telegram": user.telegram_chat_id}
+                enabled = user.notification_channels or []
+                found[user.id] = {channel: contacts[channel] for channel in enabled if contacts.get(channel)}
+                self._recipients[user.id] = (now + settings.NOTIFY_RECIPIENT_TTL, found[user.id])
+                self._recipients.move_to_end(user.id)
+            while len(self._recipients) > RECIPIENT_CACHE_SIZE:
+                self._recipients.popitem(last=False)
+        return found
+
+    def forget(self, user_id: int):
+        """Drop a cached recipient after the user changes contact details"""
+        self._recipients.pop(user_id, None)
+
+    # Delivery
+
+    async def _claim_loop(self, channel: Channel):
+        queue, wake = self._queues[channel.name], self._wake[channel.name]
+        # One message per recipient; never lease more than the channel can send well within the lease
+        limit = max(1, min(settings.NOTIFY_BATCH_SIZE, int(settings.NOTIFY_RATE_LIMITS[channel.name] * settings.NOTIFY_LEASE / 2)))
+        while True:
+            try:
+                wake.clear()
+                rows = await run_in_threadpool(self.outbox.claim, channel.name, limit, settings.NOTIFY_LEASE)
+                if rows:
+                    messages = channel.coalesce(rows)
+                    self.stats["coalesced"] += len(rows) - len(messages)
+                    for message in messages:
+                        await queue.put(message)  # bounded: waits for the senders
+                    continue
+                # Rows queued by other workers on the host are picked up within NOTIFY_POLL_INTERVAL
+                due = await run_in_threadpool(self.outbox.next_due, channel.name)
+                timeout = settings.NOTIFY_POLL_INTERVAL if due is None else min(max(due - time.time(), 0.01), settings.NOTIFY_POLL_INTERVAL)
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification claim failed for %s", channel.name)
+                await asyncio.sleep(1)
+
+    async def _send_loop(self, channel: Channel):
+        queue = self._queues[channel.name]
+        while True:
+            message = await queue.get()
+            try:
+                await channel.limiter.acquire()
+                await channel.send(message)
+            except DeliveryError as e:
+                channel.stats["failed"] += 1
+                self._failed(message, e)
+            except asyncio.CancelledError:
+                self._unsent.extend(message.ids)  # released on stop
+                raise
+            except Exception as e:
+                logger.exception("Notification send failed for %s", channel.name)
+                channel.stats["failed"] += 1
+                self._failed(message, DeliveryError(str(e), retryable=True))
+            else:
+                channel.stats["sent"] += 1
+                self.stats["messages"] += 1
+                self.stats["delivered"] += len(message.ids)
+                self._done.extend(message.ids)
+
+    def _failed(self, message: Message, error: DeliveryError):
+        attempts = message.attempts + 1
+        if not error.retryable or attempts >= settings.NOTIFY_MAX_ATTEMPTS:
+            logger.warning("Dropping %s notification to %s: %s", message.channel, message.recipient, error)
+            self._dead.extend((str(error), i) for i in message.ids)
+            self.stats["dead"] += len(message.ids)
+            return
+        delay = error.retry_after or min(2.0 ** attempts, settings.NOTIFY_MAX_BACKOFF) * (1 + random.random() * 0.2)
+        self._retry.extend((time.time() + delay, str(error), i) for i in message.ids)
+        self.stats["retried"] += len(message.ids)
+
+    async def flush(self, release: Iterable[int] = ()) -> int:
+        """Write delivery outcomes to the outbox in one transaction"""
+        done, retry, dead, release = self._done, self._retry, self._dead, list(release)
+        if not (done or retry or dead or release):
+            return 0
+        self._done, self._retry, self._dead = [], [], []
+        try:
+            await run_in_threadpool(self.outbox.ack, done, retry, dead, release)
+        except Exception:
+            self._done, self._retry, self._dead = done + self._done, retry + self._retry, dead + self._dead
+            raise
+        if retry:
+            for channel in self._wake.values():
+                channel.set()
+        return len(done) + len(retry) + len(dead)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.NOTIFY_ACK_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Notification outbox write failed")
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "channels": {name: {**channel.stats, "in_memory": self._queues[name].qsize()} for name, channel in self.channels.items()},
+            "outbox": self.outbox.counts() if self.outbox is not None else {},
+        }
+
+    # Lifecycle
+
+    async def start(self):
+        self.outbox = await run_in_threadpool(Outbox, self.outbox_path)
+        for name, factory in CHANNELS.items():
+            channel = factory()
+            if not channel.configured():
+                await channel.aclose()
+                continue
+            workers = settings.NOTIFY_WORKERS[name]
+            self.channels[name] = channel
+            self._queues[name] = asyncio.Queue(maxsize=workers * 2)
+            self._wake[name] = asyncio.Event()
+            self._claimers.append(asyncio.create_task(self._claim_loop(channel)))
+            self._senders += [asyncio.create_task(self._send_loop(channel)) for _ in range(workers)]
+        self._tasks = [asyncio.create_task(self._flush_loop())]
+        alert_engine.add_trigger_listener(self.on_alerts)
+        logger.info("Notifications enabled for: %s", ", ".join(self.channels) or "none")
+
+    async def stop(self):
+        alert_engine.remove_trigger_listener(self.on_alerts)
+        if self._intake:
+            await asyncio.gather(*self._intake, return_exceptions=True)
+        for task in self._claimers:
+            task.cancel()
+        await asyncio.gather(*self._claimers, return_exceptions=True)
+        # Give senders a moment to finish what is already claimed
+        deadline = time.monotonic() + settings.NOTIFY_DRAIN_TIMEOUT
+        while any(not q.empty() for q in self._queues.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._senders + self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._senders, *self._tasks, return_exceptions=True)
+        # Whatever is still claimed goes back to the outbox for the next start
+        release, self._unsent = self._unsent, []
+        for queue in self._queues.values():
+            while not queue.empty():
+                release.extend(queue.get_nowait().ids)
+        try:
+            await self.flush(release)
+        except Exception:
+            logger.exception("Final notification outbox write failed")
+        for channel in self.channels.values():
+            await channel.aclose()
+        self.outbox.close()
+        self._claimers, self._senders, self._tasks = [], [], []
+        self.channels.clear()
+        self._queues.clear()
+        self._wake.clear()
+
+
+notification_dispatcher = NotificationDispatcher()
+
+---
+
+# backend/benchmarks/bench_scanner.py
+# Usage: python -m benchmarks.bench_scanner [--symbols 2000] [--scans 200] [--bars 200]
+#
+# Times a full-universe update (every tracked indicator advanced by one bar)
+# plus evaluation of every registered scan, as happens on each 1-minute close.
+# Scans are random combinations of a small condition pool, like user scans
+# built from the same few templates, so most indicators and comparisons are
+# shared between them. First checks that every live indicator matches its
+# batch function bar for bar on series with late starts and missing bars.
+import argparse
+import time
+
+import numpy as np
+
+from app.services import indicators
+from app.services.condition_compiler import compile_conditions
+from app.services.live_indicators import LIVE_INDICATORS, LiveIndicatorEngine
+from app.services.scanner_service import PlanRegistry
+
+CONDITION_POOL = [
+    {"indicator": "rsi_14", "operator": "<", "value": 30},
+    {"indicator": "rsi_14", "operator": ">", "value": 70},
+    {"indicator": "rsi_7", "operator": ">", "value": 60},
+    {"indicator": "close", "operator": ">", "value": 100},
+    {"indicator": "atr_14", "operator": ">", "value": 1},
+    {"indicator": "ema_9", "operator": ">", "value": 100},
+    {"indicator": "ema_21", "operator": "<", "value": 100},
+    {"indicator": "ema_50", "operator": ">", "value": 100},
+    {"indicator": "ema_200", "operator": ">", "value": 100},
+    {"indicator": "vwap_20", "operator": "<", "value": 101},
+    {"indicator": "volume", "operator": ">", "value": 50000},
+    {"indicator": "macd", "operator": "crosses_above", "value": 0},
+    {"indicator": "bb_lower_20_2", "operator": ">", "value": 98},
+    {"indicator": "sma_50", "operator": ">", "value": 99},
+    {"indicator": "highest_20", "operator": ">", "value": 105},
+    {"indicator": "change_percent", "operator": ">", "value": 0.5},
+]
+
+
+def check_parity(rng, n: int = 40, bars: int = 400) -> int:
+    """Every live indicator against its batch function; returns how many were compared"""
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, (n, bars)), axis=1))
+    spread = np.abs(rng.normal(0, 0.005, (n, bars))) * close
+    data = {
+        "open": close.copy(), "high": close + spread, "low": close - spread, "close": close,
+        "volume": rng.integers(1000, 100000, (n, bars)).astype(float),
+    }
+    missing = np.zeros((n, bars), dtype=bool)
+    for i in range(n):
+        missing[i, :rng.integers(0, 40)] = True  # listed late
+        for _ in range(rng.integers(0, 4)):
+            start = rng.integers(0, bars - 15)
+            missing[i, start:start + rng.integers(1, 15)] = True
+    for values in data.values():
+        values[missing] = np.nan
+
+    compared = 0
+    for name, (function, inputs, defaults) in indicators.INDICATORS.items():
+        for params in (defaults, {k: max(2, v // 2) if isinstance(v, int) else v for k, v in defaults.items()}):
+            batch = function(*(data[field] for field in inputs), **params)
+            state = LIVE_INDICATORS[name](n, **params)
+            live = np.column_stack([
+                state.update({field: values[:, t] for field, values in data.items()}, ~missing[:, t])
+                for t in range(bars)
+            ])
+            np.testing.assert_allclose(live, batch, rtol=1e-6, atol=1e-6, equal_nan=True,
+                                       err_msg=f"{name} {params}: live and batch differ")
+            compared += 1
+    return compared
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--bars", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    print(f"live/batch parity with missing bars: {check_parity(rng)} indicator settings match")
+    n = args.symbols
+    engine = LiveIndicatorEngine([f"SYM{i}" for i in range(n)], "1m")
+    registry = PlanRegistry(engine)
+    n_conditions = 0
+    for scan_id in range(args.scans):
+        picks = rng.choice(len(CONDITION_POOL), size=rng.integers(1, 5), replace=False)
+        conditions = [CONDITION_POOL[i] for i in picks]
+        n_conditions += len(conditions)
+        registry.register(("scan", scan_id), (compile_conditions(conditions, "count"),))
+
+    close = np.full(n, 100.0)
+
+    def next_bar(t):
+        nonlocal close
+        close = close * np.exp(rng.normal(0, 0.002, n))
+        spread = np.abs(rng.normal(0, 0.001, n)) * close
+        volume = rng.integers(1000, 100000, n).astype(float)
+        engine.on_bar(np.datetime64("2024-01-01T09:15") + np.timedelta64(t, "m"), close, close + spread, close - spread, close, volume)
+
+    for t in range(250):
+        next_bar(t)
+
+    timings = []
+    for t in range(250, 250 + args.bars):
+        start = time.perf_counter()
+        next_bar(t)
+        registry.evaluate_all()
+        timings.append(time.perf_counter() - start)
+
+    timings = np.array(timings) * 1000
+    print(f"{n} symbols, {args.scans} scans, {n_conditions} conditions")
+    print(f"distinct indicators {len(engine.values)}, distinct plan nodes per bar {len(engine.memo)}")
+    print(f"bar update + rescan: p50 {np.percentile(timings, 50):.2f} ms, p99 {np.percentile(timings, 99):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/bench_alerts.py
+# Usage: python -m benchmarks.bench_alerts [--symbols 500] [--alerts 50000] [--ticks 200000] [--indicator-alerts 10000]
+#
+# Tick cost of the price alert index against scanning every alert of the
+# ticked symbol, on the same random-walk tick stream (both must fire the same
+# alerts), and bar cost of indicator alerts grouped by plan against
+# evaluating each alert's condition on its own. Indicator alerts are drawn
+# from a small condition pool, like alerts made from the same few templates;
+# fired ones are re-armed so every bar sees the full population.
+import argparse
+import operator
+import time
+
+import numpy as np
+
+from app.services import scanner_service
+from app.services.alert_engine import AlertEngine, IndexedAlert, indicator_plan
+from app.services.condition_compiler import evaluate
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+CONDITION_POOL = [
+    {"indicator": "rsi_14", "operator": "<", "value": 30},
+    {"indicator": "rsi_14", "operator": ">", "value": 70},
+    {"indicator": "close", "operator": "crosses_above", "compare": "ema_20"},
+    {"indicator": "close", "operator": "crosses_below", "compare": "ema_20"},
+    {"indicator": "macd", "operator": "crosses_above", "value": 0},
+    {"indicator": "close", "operator": ">", "compare": "bb_upper_20_2"},
+    {"indicator": "volume", "operator": ">", "compare": "volume_sma_20"},
+    {"conditions": [{"indicator": "rsi_14", "operator": "<", "value": 35}, {"indicator": "close", "operator": ">", "compare": "sma_50"}]},
+]
+
+
+def drain(engine: AlertEngine):
+    """Fired alerts without the DB: return them and clear the delivery queues"""
+    events = engine._to_claim
+    engine._to_claim = []
+    engine._to_push.clear()
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--alerts", type=int, default=50000)
+    parser.add_argument("--ticks", type=int, default=200000)
+    parser.add_argument("--indicator-alerts", type=int, default=10000)
+    parser.add_argument("--bars", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    base = rng.uniform(50, 5000, args.symbols)
+
+    # Price alerts: thresholds 0.2-5% away from the starting price, either side
+    engine = AlertEngine()
+    naive = {symbol: [] for symbol in symbols}
+    for alert_id in range(args.alerts):
+        i = int(rng.integers(args.symbols))
+        op = str(rng.choice(list(OPERATORS)))
+        sign = 1 if op.startswith(">") else -1
+        threshold = round(float(base[i] * (1 + sign * rng.uniform(0.002, 0.05))), 2)
+        condition = {"operator": op, "value": threshold}
+        engine.add(IndexedAlert(alert_id, alert_id % 1000, "price", symbols[i], condition))
+        naive[symbols[i]].append((alert_id, OPERATORS[op], threshold))
+
+    walk = rng.integers(args.symbols, size=args.ticks)
+    steps = rng.normal(0, 0.002, args.ticks)
+    prices = base.copy()
+    ticks = []
+    for i, step in zip(walk, steps):
+        prices[i] = round(prices[i] * np.exp(step), 2)
+        ticks.append({"symbol": symbols[i], "ltp": float(prices[i])})
+
+    start = time.perf_counter()
+    for tick in ticks:
+        engine.on_tick(tick)
+    indexed = time.perf_counter() - start
+    indexed_fired = {e["id"] for e in drain(engine)}
+
+    naive_fired = set()
+    start = time.perf_counter()
+    for tick in ticks:
+        alerts = naive[tick["symbol"]]
+        price = tick["ltp"]
+        hits = [a for a in alerts if a[1](price, a[2])]
+        if hits:
+            naive_fired.update(a[0] for a in hits)
+            naive[tick["symbol"]] = [a for a in alerts if not a[1](price, a[2])]
+    scan = time.perf_counter() - start
+
+    assert indexed_fired == naive_fired, "index and scan fired different alerts"
+    print(f"{args.alerts} price alerts on {args.symbols} symbols, {args.ticks} ticks, {len(indexed_fired)} fired")
+    print(f"indexed: {indexed / args.ticks * 1e6:.2f} us/tick ({args.ticks / indexed:,.0f} ticks/s)")
+    print(f"scan:    {scan / args.ticks * 1e6:.2f} us/tick ({args.ticks / scan:,.0f} ticks/s)")
+
+    # Indicator alerts on the scanner's engine
+    live = scanner_service.init_scanner(symbols=symbols, warm=False)
+    engine = AlertEngine()
+    conditions = {}
+    for alert_id in range(args.indicator_alerts):
+        condition = CONDITION_POOL[int(rng.integers(len(CONDITION_POOL)))]
+        symbol = symbols[int(rng.integers(args.symbols))]
+        engine.add(IndexedAlert(alert_id, alert_id % 1000, "indicator", symbol, condition))
+        conditions[alert_id] = (indicator_plan(condition), live.index[symbol])
+
+    close = base.copy()
+
+    def next_bar(t):
+        nonlocal close
+        close = close * np.exp(rng.normal(0, 0.004, args.symbols))
+        spread = np.abs(rng.normal(0, 0.002, args.symbols)) * close
+        volume = rng.integers(1000, 100000, args.symbols).astype(float)
+        live.on_bar(np.datetime64("2024-01-01T09:15") + np.timedelta64(t, "m"), close, close + spread, close - spread, close, volume)
+
+    for t in range(100):
+        next_bar(t)
+
+    grouped, separate, fired = [], [], 0
+    for t in range(100, 100 + args.bars):
+        next_bar(t)
+        start = time.perf_counter()
+        engine.on_bar(live)
+        grouped.append(time.perf_counter() - start)
+        events = drain(engine)
+        fired += len(events)
+        for e in events:
+            engine.add(IndexedAlert(e["id"], e["user_id"], e["alert_type"], e["symbol"], e["condition"]))
+
+        start = time.perf_counter()
+        for plan, i in conditions.values():
+            evaluate(plan, live)[i]
+        separate.append(time.perf_counter() - start)
+
+    grouped = np.array(grouped) * 1000
+    separate = np.array(separate) * 1000
+    print(f"{args.indicator_alerts} indicator alerts, {len(CONDITION_POOL)} distinct plans, {fired / args.bars:.0f} fired per bar")
+    print(f"grouped:  p50 {np.percentile(grouped, 50):.2f} ms/bar, p99 {np.percentile(grouped, 99):.2f} ms/bar")
+    print(f"separate: p50 {np.percentile(separate, 50):.2f} ms/bar, p99 {np.percentile(separate, 99):.2f} ms/bar")
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/notify_stubs.py
+# Usage: python -m benchmarks.notify_stubs [--port 8910] [--latency-ms 30] [--rate 100] [--fail-percent 0]
+#
+# Local stand-ins for the notification providers, for throughput tests of
+# the dispatcher without sending anything:
+#   - Telegram Bot API: POST /bot<token>/sendMessage
+#   - Twilio Messages API (WhatsApp): POST /2010-04-01/Accounts/<sid>/Messages.json
+#   - SMTP on --port + 1: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT
+# Each applies --latency-ms per request (per DATA for SMTP), a --rate
+# messages/second limit per HTTP provider answered with 429s the way the real
+# API does, and --fail-percent transient failures (5xx, SMTP 451). GET /stats
+# reports counts per channel and how many messages each recipient got.
+import argparse
+import asyncio
+import base64
+import os
+import random
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PORT = int(os.getenv("NOTIFY_STUB_PORT", 8910))
+LATENCY = float(os.getenv("NOTIFY_STUB_LATENCY_MS", 30)) / 1000
+RATE = int(os.getenv("NOTIFY_STUB_RATE", 100))
+FAIL_PERCENT = float(os.getenv("NOTIFY_STUB_FAIL_PERCENT", 0))
+
+counters = Counter()
+recipients = defaultdict(Counter)  # channel -> recipient -> messages
+windows = defaultdict(deque)
+
+
+def _throttled(channel: str) -> bool:
+    window = windows[channel]
+    now = time.monotonic()
+    while window and now - window[0] >= 1.0:
+        window.popleft()
+    if len(window) >= RATE:
+        counters[f"{channel}_throttled"] += 1
+        return True
+    window.append(now)
+    return False
+
+
+def _failed(channel: str) -> bool:
+    if random.random() * 100 < FAIL_PERCENT:
+        counters[f"{channel}_failed"] += 1
+        return True
+    return False
+
+
+class SMTPStub(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = b""
+        self.data = None  # message lines while in DATA
+        self.auth_pending = False
+        self.recipients = []
+        counters["email_connections"] += 1
+        self.reply("220 stub ESMTP ready")
+
+    def reply(self, line: str):
+        self.transport.write(line.encode() + b"\r\n")
+
+    def data_received(self, chunk: bytes):
+        self.buffer += chunk
+        while b"\r\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\r\n", 1)
+            self.line(line)
+
+    def line(self, line: bytes):
+        if self.data is not None:
+            if line == b".":
+                self.data = None
+                asyncio.get_running_loop().create_task(self.accept())
+            else:
+                self.data.append(line)
+            return
+        if self.auth_pending:
+            self.auth_pending = False
+            self.reply("235 2.7.0 Authentication successful")
+            return
+        command = line.decode(errors="replace").strip()
+        verb = command.split(" ", 1)[0].upper()
+        if verb == "EHLO":
+            self.reply("250-stub")
+            self.reply("250-AUTH PLAIN")
+            self.reply("250 8BITMIME")
+        elif verb == "HELO":
+            self.reply("250 stub")
+        elif verb == "AUTH":
+            parts = command.split()
+            if len(parts) > 2:
+                base64.b64decode(parts[2])
+                self.reply("235 2.7.0 Authentication successful")
+            else:
+                self.auth_pending = True
+                self.reply("334 ")
+        elif verb == "MAIL":
+            self.recipients = []
+            self.reply("250 2.1.0 OK")
+        elif verb == "RCPT":
+            self.recipients.append(command.split(":", 1)[1].strip(" <>"))
+            self.reply("250 2.1.5 OK")
+        elif verb == "DATA":
+            self.data = []
+            self.reply("354 End data with <CR><LF>.<CR><LF>")
+        elif verb in ("RSET", "NOOP"):
+            self.recipients = [] if verb == "RSET" else self.recipients
+            self.reply("250 2.0.0 OK")
+        elif verb == "QUIT":
+            self.reply("221 2.0.0 Bye")
+            self.transport.close()
+        else:
+            self.reply("502 5.5.2 Command not recognized")
+
+    async def accept(self):
+        await asyncio.sleep(LATENCY)
+        if _failed("email"):
+            self.reply("451 4.3.0 Temporary failure")
+            return
+        for recipient in self.recipients:
+            recipients["email"][recipient] += 1
+        counters["email_sent"] += 1
+        self.reply("250 2.0.0 Queued")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    server = await asyncio.get_running_loop().create_server(SMTPStub, "127.0.0.1", PORT + 1)
+    yield
+    server.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.post("/bot{token}/sendMessage")
+async def telegram_send(token: str, request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+    if _throttled("telegram"):
+        return JSONResponse(
+            {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1}},
+            status_code=429,
+        )
+    if _failed("telegram"):
+        return JSONResponse({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status_code=502)
+    recipients["telegram"][str(body["chat_id"])] += 1
+    counters["telegram_sent"] += 1
+    return {"ok": True, "result": {"message_id": counters["telegram_sent"], "chat": {"id": body["chat_id"]}, "text": body["text"]}}
+
+
+@app.post("/2010-04-01/Accounts/{sid}/Messages.json")
+async def twilio_send(sid: str, request: Request):
+    form = await request.form()
+    await asyncio.sleep(LATENCY)
+    if _throttled("whatsapp"):
+        return JSONResponse({"code": 20429, "message": "Too Many Requests", "status": 429}, status_code=429, headers={"Retry-After": "1"})
+    if _failed("whatsapp"):
+        return JSONResponse({"code": 20500, "message": "Internal Server Error", "status": 500}, status_code=500)
+    recipients["whatsapp"][form["To"]] += 1
+    counters["whatsapp_sent"] += 1
+    return JSONResponse({"sid": f"SM{counters['whatsapp_sent']:032d}", "status": "queued", "to": form["To"]}, status_code=201)
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        **counters,
+        "recipients": {channel: len(counts) for channel, counts in recipients.items()},
+        "max_per_recipient": {channel: max(counts.values()) for channel, counts in recipients.items() if counts},
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8910)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--rate", type=int, default=100)
+    parser.add_argument("--fail-percent", type=float, default=0)
+    args = parser.parse_args()
+    global PORT, LATENCY, RATE, FAIL_PERCENT
+    PORT, LATENCY, RATE, FAIL_PERCENT = args.port, args.latency_ms / 1000, args.rate, args.fail_percent
+    uvicorn.run(app, port=args.port, log_level="critical")
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/bench_notify.py
+# Usage: python -m benchmarks.bench_notify [--alerts 5000] [--users 500] [--rate 100] [--window 0.5] [--naive]
+#
+# Starts the provider stubs in a subprocess and queues a market-open burst:
+# --alerts fired alerts spread over --users users, each with Telegram,
+# WhatsApp and email enabled. Prints the time until the outbox is empty, the
+# messages each channel sent after per-user coalescing, and what the stubs
+# saw (429s, SMTP connections). --naive also sends every alert as its own
+# message over a fresh connection, without pacing, for comparison.
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from email.message import EmailMessage
+
+import aiosmtplib
+import httpx
+
+from app.config import settings
+from app.services.notifications import NotificationDispatcher
+
+
+@contextmanager
+def serve(args):
+    env = {
+        **os.environ,
+        "NOTIFY_STUB_PORT": str(args.port),
+        "NOTIFY_STUB_LATENCY_MS": str(args.latency_ms),
+        "NOTIFY_STUB_RATE": str(args.rate),
+        "NOTIFY_STUB_FAIL_PERCENT": str(args.fail_percent),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.notify_stubs:app", "--port", str(args.port), "--log-level", "critical"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        for _ in range(100):
+            if server.poll() is not None:
+                break
+            try:
+                httpx.get(f"{base_url}/health", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        if server.poll() is not None:
+            raise SystemExit(f"Notification stubs exited; are ports {args.port}-{args.port + 1} in use?")
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def configure(args, base_url):
+    settings.TELEGRAM_BOT_TOKEN = "stub-token"
+    settings.TELEGRAM_API_URL = base_url
+    settings.WHATSAPP_API_KEY = "stub-key"
+    settings.WHATSAPP_ACCOUNT_SID = "ACstub"
+    settings.WHATSAPP_FROM = "+10000000000"
+    settings.WHATSAPP_API_URL = base_url
+    settings.SMTP_SERVER = "127.0.0.1"
+    settings.SMTP_PORT = args.port + 1
+    settings.SMTP_EMAIL = "alerts@example.com"
+    settings.SMTP_PASSWORD = "stub"
+    settings.NOTIFY_RATE_LIMITS = {channel: float(args.rate) for channel in settings.NOTIFY_RATE_LIMITS}
+    settings.NOTIFY_COALESCE_WINDOW = args.window
+
+
+def burst(args):
+    """(channel, recipient, user_id, text) for every alert on every channel"""
+    items = []
+    for i in range(args.alerts):
+        user_id = i % args.users
+        text = f"SYM{i % 200}: price >= {100 + i % 50} (at {100.5 + i % 50:g})"
+        items += [
+            ("telegram", str(100000 + user_id), user_id, text),
+            ("whatsapp", f"+9199{user_id:08d}", user_id, text),
+            ("email", f"user{user_id}@example.com", user_id, text),
+        ]
+    return items
+
+
+async def run_dispatcher(args, base_url):
+    path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    dispatcher = NotificationDispatcher(outbox_path=path)
+    await dispatcher.start()
+    started = time.perf_counter()
+    due = time.time() + settings.NOTIFY_COALESCE_WINDOW
+    await dispatcher.enqueue([(*item, due) for item in burst(args)])
+    queued_in = time.perf_counter() - started
+    while True:
+        await asyncio.sleep(0.05)
+        counts = dispatcher.outbox.counts()
+        if not any(c["queued"] for c in counts.values()):
+            break
+    elapsed = time.perf_counter() - started
+    summary = dispatcher.summary()
+    await dispatcher.stop()
+    rows = summary["queued"]
+    print(f"dispatcher: {args.alerts} alerts x 3 channels = {rows} rows, queued in {queued_in * 1000:.0f} ms")
+    print(f"  outbox empty after {elapsed:.2f}s (coalescing window {args.window}s), "
+          f"{summary['messages']} messages for {summary['delivered']} rows, {summary['retried']} retried, {summary['dead']} dead")
+    for name, stats in summary["channels"].items():
+        print(f"  {name}: {stats}")
+
+
+async def run_naive(args, base_url):
+    semaphore = asyncio.Semaphore(sum(settings.NOTIFY_WORKERS.values()))
+    failed = 0
+
+    async def one(channel, recipient, user_id, text):
+        nonlocal failed
+        async with semaphore:
+            try:
+                if channel == "email":
+                    email = EmailMessage()
+                    email["From"], email["To"], email["Subject"] = settings.SMTP_EMAIL, recipient, "Alert triggered"
+                    email.set_content(text)
+                    await aiosmtplib.send(email, hostname=settings.SMTP_SERVER, port=settings.SMTP_PORT,
+                                          username=settings.SMTP_EMAIL, password=settings.SMTP_PASSWORD)
+                    return
+                async with httpx.AsyncClient(base_url=base_url) as client:
+                    if channel == "telegram":
+                        response = await client.post(f"/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage", json={"chat_id": recipient, "text": text})
+                    else:
+                        response = await client.post(f"/2010-04-01/Accounts/{settings.WHATSAPP_ACCOUNT_SID}/Messages.json",
+                                                     data={"From": "whatsapp:+10000000000", "To": f"whatsapp:{recipient}", "Body": text})
+                if response.status_code >= 400:
+                    failed += 1
+            except (aiosmtplib.SMTPException, httpx.HTTPError, OSError):
+                failed += 1
+
+    items = burst(args)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*item) for item in items))
+    elapsed = time.perf_counter() - started
+    print(f"naive: {len(items)} messages in {elapsed:.2f}s, {failed} rejected or failed (not retried)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alerts", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rate", type=int, default=100, help="Provider messages/second per channel")
+    parser.add_argument("--window", type=float, default=0.5, help="Coalescing window in seconds")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--fail-percent", type=float, default=1)
+    parser.add_argument("--port", type=int, default=8910)
+    parser.add_argument("--naive", action="store_true")
+    args = parser.parse_args()
+
+    with serve(args) as base_url:
+        configure(args, base_url)
+        asyncio.run(run_dispatcher(args, base_url))
+        print("stubs:", httpx.get(f"{base_url}/stats").json())
+        if args.naive:
+            asyncio.run(run_naive(args, base_url))
+            print("stubs:", httpx.get(f"{base_url}/stats").json())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2443 @@
+# backend/app/services/position_book.py
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import select, update
+
+from app.cache.redis_client import get_redis
+from app.cache.response_cache import response_cache
+from app.config import settings
+from app.database.models import Position
+from app.database.session import AsyncSessionLocal
+from app.services.portfolio_summary import portfolio_maintainer
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+# Open positions live in memory, indexed by symbol, and are marked to market
+# on every tick the WebSocket hub receives. A tick touches only the positions
+# in its symbol. Users with a "positions" channel open get the changed rows
+# once per WS_SEND_INTERVAL, and the positions table is written in one bulk
+# UPDATE per POSITION_FLUSH_INTERVAL instead of once per tick. Every worker
+# keeps its own book (the hub bridges ticks to all of them) so pushes stay
+# local; only the worker holding the Redis writer lease flushes to the DB,
+# and only to rows still open.
+# Fills change a position's quantity and entry through fill_position(), called
+# by the order gateway when the broker reports an order complete; the row it
+# commits is published on POSITION_FILL_CHANNEL so every worker's book
+# (the writer's included) takes it before the next tick.
+
+WRITER_LOCK = "positions:writer"
+
+
+@dataclass
+class LivePosition:
+    id: int
+    user_id: int
+    symbol: str
+    quantity: int
+    entry_price: float
+    current_price: Optional[float]
+    pnl: float
+    pnl_percent: float
+    stop_loss: Optional[float] = None
+    target: Optional[float] = None
+    strategy_id: Optional[int] = None
+    stored_pnl: float = 0.0  # pnl as last read from or written to the positions table
+
+    @classmethod
+    def from_row(cls, p: Position) -> "LivePosition":
+        return cls(
+            id=p.id,
+            user_id=p.user_id,
+            symbol=p.symbol,
+            quantity=p.quantity or 0,
+            entry_price=p.entry_price or 0.0,
+            current_price=p.current_price,
+            pnl=p.pnl or 0.0,
+            pnl_percent=p.pnl_percent or 0.0,
+            stop_loss=p.stop_loss,
+            target=p.target,
+            strategy_id=p.strategy_id,
+            stored_pnl=p.pnl or 0.0,
+        )
+
+    def mark(self, price: float):
+        """Negative quantity is a short"""
+        self.current_price = price
+        self.pnl = (price - self.entry_price) * self.quantity
+        if self.entry_price:
+            direction = 1 if self.quantity >= 0 else -1
+            self.pnl_percent = (price / self.entry_price - 1.0) * 100.0 * direction
+
+    def delta(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "current_price": self.current_price,
+            "pnl": round(self.pnl, 2),
+            "pnl_percent": round(self.pnl_percent, 4),
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "quantity": self.quantity,
+            "entry_price": self.entry_price,
+            "current_price": self.current_price,
+            "pnl": self.pnl,
+            "pnl_percent": self.pnl_percent,
+            "stop_loss": self.stop_loss,
+            "target": self.target,
+        }
+
+
+def fill_position(row: Position, signed: int, price: float, when: datetime) -> Optional[float]:
+    """Apply a fill to an open position row at average cost; returns the P&L it realizes, None if it only adds"""
+    held = row.quantity or 0
+    entry = row.entry_price or 0.0
+    if held == 0 or (held > 0) == (signed > 0):
+        row.quantity = held + signed
+        row.entry_price = (entry * abs(held) + price * abs(signed)) / abs(row.quantity)
+        realized = None
+    else:
+        closed = min(abs(signed), abs(held))
+        direction = 1 if held > 0 else -1
+        realized = (price - entry) * closed * direction
+        row.quantity = held + signed
+        if row.quantity == 0:
+            row.status = "closed"
+            row.closed_price = price
+            row.closed_time = when
+            row.current_price = price
+            row.pnl = realized
+            row.pnl_percent = (price / entry - 1.0) * 100.0 * direction if entry else 0.0
+            return realized
+        if (row.quantity > 0) != (held > 0):
+            row.entry_price = price  # flipped through zero
+            row.entry_time = when
+    live = LivePosition.from_row(row)
+    live.mark(price)
+    row.current_price, row.pnl, row.pnl_percent = live.current_price, live.pnl, live.pnl_percent
+    return realized
+
+
+class PositionBook:
+    def __init__(self):
+        self.positions: Dict[int, LivePosition] = {}
+        self._by_symbol: Dict[str, Dict[int, LivePosition]] = defaultdict(dict)
+        self._by_user: Dict[int, Set[int]] = defaultdict(set)
+        self._to_push: Dict[int, Set[int]] = defaultdict(set)  # user -> position ids
+        self._dirty: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._pubsub = None
+        self._worker_id = f"{os.getpid()}-{id(self)}"
+        self.ready = False
+        self.stats = {"ticks": 0, "marks": 0, "pushes": 0, "db_flushes": 0, "rows_written": 0,
+                      "fills": 0, "remote_fills": 0}
+
+    # Lifecycle
+
+    async def start(self):
+        await self.sync()
+        manager.add_tick_listener(self.on_tick)
+        self._pubsub = get_redis().pubsub()
+        await self._pubsub.subscribe(settings.POSITION_FILL_CHANNEL)
+        self._tasks = [
+            asyncio.create_task(self._push_loop()),
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._sync_loop()),
+            asyncio.create_task(self._listen()),
+        ]
+        self.ready = True
+
+    async def stop(self):
+        manager.remove_tick_listener(self.on_tick)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        try:
+            if await self._is_writer():
+                await self.flush()
+                await get_redis().delete(WRITER_LOCK)
+        except Exception:
+            logger.exception("Final position flush failed")
+        self.ready = False
+
+    # Book maintenance
+
+    def add(self, position: LivePosition):
+        self.remove(position.id)
+        self.positions[position.id] = position
+        self._by_symbol[position.symbol][position.id] = position
+        self._by_user[position.user_id].add(position.id)
+
+    def remove(self, position_id: int) -> Optional[LivePosition]:
+        position = self.positions.pop(position_id, None)
+        if position is None:
+            return None
+        symbol_positions = self._by_symbol[position.symbol]
+        symbol_positions.pop(position_id, None)
+        if not symbol_positions:
+            del self._by_symbol[position.symbol]
+        self._by_user[position.user_id].discard(position_id)
+        if not self._by_user[position.user_id]:
+            del self._by_user[position.user_id]
+        self._dirty.discard(position_id)
+        return position
+
+    async def sync(self):
+        """Reconcile with open positions in the DB; live prices are kept for known rows"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(select(Position).where(Position.status == "open"))).all()
+        seen = set()
+        changed = set()  # users with positions opened or closed since the last sync
+        for row in rows:
+            seen.add(row.id)
+            live = self.positions.get(row.id)
+            if live is None:
+                changed.add(row.user_id)
+            fresh = LivePosition.from_row(row)
+            dirty = row.id in self._dirty
+            if live is not None and live.current_price is not None:
+                fresh.mark(live.current_price)
+            self.add(fresh)
+            if dirty:
+                self._dirty.add(row.id)
+        for position_id in set(self.positions) - seen:
+            changed.add(self.remove(position_id).user_id)
+        if self.ready:  # the first sync fills an empty book
+            await response_cache.invalidate(*(f"positions:{user_id}" for user_id in changed))
+
+    async def apply_fill(self, row: Position):
+        """A fill committed this row: take it here and publish it to every other worker's book"""
+        change = {"worker": self._worker_id, "status": row.status, "position": asdict(LivePosition.from_row(row))}
+        self._apply_change(change)
+        self.stats["fills"] += 1
+        if self._pubsub is not None:
+            try:
+                await get_redis().publish(settings.POSITION_FILL_CHANNEL, json.dumps(change))
+            except Exception:
+                logger.exception("Publishing position fill to other workers failed")
+
+    def _apply_change(self, change: Dict[str, Any]):
+        fresh = LivePosition(**change["position"])
+        if change["status"] != "open":
+            self.remove(fresh.id)
+            return
+        live = self.positions.get(fresh.id)
+        self.add(fresh)  # drops a stale copy, and any unwritten marks made with it
+        if live is not None and live.current_price is not None and live.current_price != fresh.current_price:
+            fresh.mark(live.current_price)
+            self._dirty.add(fresh.id)
+        self._to_push[fresh.user_id].add(fresh.id)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                change = json.loads(message["data"])
+                if change.get("worker") != self._worker_id:
+                    self._apply_change(change)
+                    self.stats["remote_fills"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Position fill listener: bad message")
+                await asyncio.sleep(0.1)
+
+    def user_positions(self, user_id: int) -> List[LivePosition]:
+        return [self.positions[i] for i in sorted(self._by_user.get(user_id, ()))]
+
+    # Ticks
+
+    def on_tick(self, tick: Dict[str, Any]):
+        self.stats["ticks"] += 1
+        positions = self._by_symbol.get(tick["symbol"])
+        if not positions:
+            return
+        price = tick.get("ltp", tick.get("price"))
+        if price is None:
+            return
+        price = float(price)
+        for position in positions.values():
+            if position.current_price == price:
+                continue
+            position.mark(price)
+            self._dirty.add(position.id)
+            self._to_push[position.user_id].add(position.id)
+            self.stats["marks"] += 1
+
+    def push(self) -> int:
+        """One frame per user with the positions that changed since the last push"""
+        if not self._to_push:
+            return 0
+        to_push, self._to_push = self._to_push, defaultdict(set)
+        frames = 0
+        for user_id, ids in to_push.items():
+            if not manager.has_listeners(user_id, "positions"):
+                continue
+            rows = [self.positions[i].delta() for i in ids if i in self.positions]
+            if not rows:
+                continue
+            total = sum(self.positions[i].pnl for i in self._by_user.get(user_id, ()))
+            frame = json.dumps({"type": "positions", "data": rows, "total_pnl": round(total, 2)})
+            manager.send_to_user(user_id, "positions", frame)
+            frames += 1
+        self.stats["pushes"] += frames
+        return frames
+
+    async def _push_loop(self):
+        while True:
+            await asyncio.sleep(settings.WS_SEND_INTERVAL)
+            try:
+                self.push()
+            except Exception:
+                logger.exception("Position push failed")
+
+    # Write-back
+
+    async def _is_writer(self) -> bool:
+        """Hold or take the writer lease; the lease outlives a few flush intervals"""
+        redis = get_redis()
+        ttl = int(settings.POSITION_FLUSH_INTERVAL * 5) + 1
+        if await redis.set(WRITER_LOCK, self._worker_id, nx=True, ex=ttl):
+            return True
+        holder = await redis.get(WRITER_LOCK)
+        if holder == self._worker_id.encode():
+            await redis.expire(WRITER_LOCK, ttl)
+            return True
+        return False
+
+    async def flush(self) -> int:
+        """Write every position changed since the last flush in one bulk UPDATE"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        written = [p for p in (self.positions.get(i) for i in dirty) if p is not None]
+        rows = [
+            {
+                "id": p.id,
+                "current_price": p.current_price,
+                "pnl": p.pnl,
+                "pnl_percent": p.pnl_percent,
+            }
+            for p in written
+        ]
+        if not rows:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                # A row a fill closed since the last sync keeps the P&L it closed at
+                await db.execute(update(Position).where(Position.status == "open")
+                                 .execution_options(synchronize_session=None), rows)
+                await db.commit()
+        except Exception:
+            self._dirty |= dirty  # retried on the next flush
+            raise
+        # portfolio_summary follows the table, so it gets the change as written
+        marks: Dict[int, float] = defaultdict(float)
+        for p, row in zip(written, rows):
+            marks[p.user_id] += row["pnl"] - p.stored_pnl
+            p.stored_pnl = row["pnl"]
+        portfolio_maintainer.record_marks(marks)
+        self.stats["db_flushes"] += 1
+        self.stats["rows_written"] += len(rows)
+        return len(rows)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.POSITION_FLUSH_INTERVAL)
+            try:
+                if await self._is_writer():
+                    await self.flush()
+                else:
+                    self._dirty.clear()
+            except Exception:
+                logger.exception("Position flush failed")
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(settings.POSITION_SYNC_INTERVAL)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Position sync failed")
+
+
+position_book = PositionBook()
+
+---
+
+# backend/app/services/trade_stats.py
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, case, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import Trade, TradeDailyStats
+from app.database.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Trade statistics come from grouped SQL over trades, never from rows loaded
+# into Python. Past days are read from trade_daily_stats, one row per user
+# per day, so the cost of a request grows with the reporting window and not
+# with trade history; today is aggregated live from trades (user_id and
+# created_at are indexed). A background task rebuilds the rollup for the
+# window touched by new trades plus the last few days.
+#
+# Realized P&L is booked on completed fills that reduce a position: a sell
+# against a long, or a buy against a short, at (price - entry) * quantity
+# with the sign of the position. The order gateway computes it against the
+# position as it stood at the fill and stores it in trades.realized_pnl
+# (NULL for fills that open or add), so later fills never rewrite it.
+
+ROLLUP_LOCK = "trade_stats:rollup"
+
+
+def _utc_today() -> date:
+    # Trade.created_at defaults to utcnow, so days are UTC days
+    return datetime.utcnow().date()
+
+
+_day = func.date(Trade.created_at)
+_completed = Trade.status == "completed"
+closing_fill = and_(_completed, Trade.realized_pnl.isnot(None))
+realized_pnl = case((closing_fill, Trade.realized_pnl), else_=0.0)
+
+
+def _aggregates():
+    """Column expressions shared by the rollup and the live query, in TradeDailyStats order"""
+    return [
+        func.count(Trade.id).label("trades"),
+        func.coalesce(func.sum(case((_completed, 1), else_=0)), 0).label("completed_trades"),
+        func.coalesce(func.sum(case((closing_fill, 1), else_=0)), 0).label("closing_trades"),
+        func.coalesce(func.sum(case((and_(closing_fill, realized_pnl > 0), 1), else_=0)), 0).label("winning_trades"),
+        func.coalesce(func.sum(case((_completed, Trade.price * Trade.quantity), else_=0.0)), 0.0).label("traded_value"),
+        func.coalesce(func.sum(realized_pnl), 0.0).label("realized_pnl"),
+    ]
+
+
+async def refresh_rollup(db: AsyncSession, since: date) -> int:
+    """Rebuild trade_daily_stats for every day from `since` on; returns rows written"""
+    start = datetime.combine(since, datetime.min.time())
+    source = (
+        select(Trade.user_id, _day.label("day"), *_aggregates(), func.max(Trade.id).label("last_trade_id"))
+        .where(Trade.created_at >= start)
+        .group_by(Trade.user_id, _day)
+    )
+    await db.execute(delete(TradeDailyStats).where(TradeDailyStats.day >= since))
+    result = await db.execute(
+        insert(TradeDailyStats).from_select(
+            ["user_id", "day", "trades", "completed_trades", "closing_trades", "winning_trades",
+             "traded_value", "realized_pnl", "last_trade_id"],
+            source,
+        )
+    )
+    await db.commit()
+    return result.rowcount
+
+
+class TradeRollup:
+    def __init__(self):
+        self.watermark: Optional[int] = None  # highest trade id already rolled up
+
+    async def run_once(self) -> int:
+        async with AsyncSessionLocal() as db:
+            if self.watermark is None:
+                self.watermark = await db.scalar(select(func.max(TradeDailyStats.last_trade_id))) or 0
+            since = _utc_today() - timedelta(days=settings.TRADE_ROLLUP_RECONCILE_DAYS)
+            # Trades inserted with an older created_at (imports, late fills) widen the window
+            oldest_new = await db.scalar(select(func.min(Trade.created_at)).where(Trade.id > self.watermark))
+            if oldest_new is not None:
+                since = min(since, oldest_new.date() if isinstance(oldest_new, datetime) else date.fromisoformat(str(oldest_new)[:10]))
+            newest = await db.scalar(select(func.max(Trade.id)))
+            rows = await refresh_rollup(db, since)
+            self.watermark = max(self.watermark, newest or 0)
+            return rows
+
+    async def run(self):
+        """Background task; with several workers only the lock holder refreshes"""
+        while True:
+            try:
+                lease = int(settings.TRADE_ROLLUP_INTERVAL)
+                if await get_redis().set(ROLLUP_LOCK, 1, nx=True, ex=max(lease, 1)):
+                    await self.run_once()
+            except Exception:
+                logger.exception("Trade rollup failed")
+            await asyncio.sleep(settings.TRADE_ROLLUP_INTERVAL)
+
+
+trade_rollup = TradeRollup()
+
+
+async def _today(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    start = datetime.combine(_utc_today(), datetime.min.time())
+    row = (await db.execute(
+        select(*_aggregates())
+        .where((Trade.user_id == user_id) & (Trade.created_at >= start))
+    )).one()
+    return dict(row._mapping)
+
+
+async def performance_metrics(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    today = _utc_today()
+    month_start = today.replace(day=1)
+    year_start = today.replace(month=1, day=1)
+
+    past = (await db.execute(
+        select(
+            func.coalesce(func.sum(TradeDailyStats.trades), 0),
+            func.coalesce(func.sum(TradeDailyStats.completed_trades), 0),
+            func.coalesce(func.sum(TradeDailyStats.closing_trades), 0),
+            func.coalesce(func.sum(TradeDailyStats.winning_trades), 0),
+            func.coalesce(func.sum(TradeDailyStats.traded_value), 0.0),
+            func.coalesce(func.sum(case((TradeDailyStats.day >= month_start, TradeDailyStats.realized_pnl), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((TradeDailyStats.day >= year_start, TradeDailyStats.realized_pnl), else_=0.0)), 0.0),
+        ).where((TradeDailyStats.user_id == user_id) & (TradeDailyStats.day < today))
+    )).one()
+    live = await _today(db, user_id)
+
+    total_trades = past[0] + live["trades"]
+    completed = past[1] + live["completed_trades"]
+    closing = past[2] + live["closing_trades"]
+    wins = past[3] + live["winning_trades"]
+    traded_value = past[4] + live["traded_value"]
+    return {
+        "win_rate": (wins / closing * 100) if closing else 0,
+        "total_trades": total_trades,
+        "completed_trades": completed,
+        "avg_trade_value": traded_value / completed if completed else 0,
+        "pnl_today": live["realized_pnl"],
+        "pnl_ytd": past[6] + live["realized_pnl"],
+        "pnl_mtd": past[5] + live["realized_pnl"],
+    }
+
+
+async def daily_pnl(db: AsyncSession, user_id: int, days: int) -> List[Dict[str, Any]]:
+    """Realized P&L per day, oldest first, with a running total over the window"""
+    today = _utc_today()
+    start = today - timedelta(days=days - 1)
+    rows = (await db.execute(
+        select(TradeDailyStats.day, TradeDailyStats.realized_pnl)
+        .where((TradeDailyStats.user_id == user_id) & (TradeDailyStats.day >= start) & (TradeDailyStats.day < today))
+    )).all()
+    by_day = {row.day: row.realized_pnl for row in rows}
+    by_day[today] = (await _today(db, user_id))["realized_pnl"]
+
+    series, cumulative = [], 0.0
+    for i in range(days):
+        day = start + timedelta(days=i)
+        pnl = by_day.get(day) or 0.0
+        cumulative += pnl
+        series.append({"date": day.strftime("%Y-%m-%d"), "pnl": round(pnl, 2), "cumulative": round(cumulative, 2)})
+    return series
+
+---
+
+# backend/app/services/portfolio_summary.py
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import PortfolioSummary, Position, Trade
+from app.database.session import AsyncSessionLocal
+from app.services.trade_stats import realized_pnl
+
+logger = logging.getLogger(__name__)
+
+# portfolio_summary holds one row per user so the portfolio endpoint reads a
+# single row instead of scanning positions and trades. Writers never
+# recompute it: fills and mark-to-market changes are recorded here as
+# deltas (realized P&L, unrealized P&L, invested capital), summed per user
+# in memory and applied every PORTFOLIO_FLUSH_INTERVAL in one
+# INSERT .. ON CONFLICT DO UPDATE that adds them to the stored values.
+# Deltas are additive, so every worker can flush its own. A user's first
+# flush seeds the row with rebuild(), which already counts the deltas
+# recorded up to then.
+#
+#   invested_capital  sum(|quantity| * entry_price) over open positions
+#   unrealized_pnl    sum(pnl) over open positions
+#   realized_pnl      realized P&L of all closing fills (see trade_stats)
+#   total_capital     PORTFOLIO_INITIAL_CAPITAL + realized + unrealized
+#   cash_available    PORTFOLIO_INITIAL_CAPITAL + realized - invested
+#   today/mtd/ytd     realized P&L in the UTC day, month and year of as_of
+#
+# rebuild() recomputes rows from scratch with grouped SQL; it runs as a
+# periodic consistency check and from the command line.
+
+RECONCILE_LOCK = "portfolio_summary:reconcile"
+TOLERANCE = 0.01
+_COLUMNS = ("total_capital", "cash_available", "invested_capital", "realized_pnl",
+            "unrealized_pnl", "today_pnl", "mtd_pnl", "ytd_pnl")
+
+
+def _utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+def _invested(position) -> float:
+    if position is None:
+        return 0.0
+    return abs(position.quantity or 0) * (position.entry_price or 0.0)
+
+
+def _pnl(position) -> float:
+    return (position.pnl or 0.0) if position is not None else 0.0
+
+
+def _percent(today_pnl, total_capital):
+    opening = total_capital - today_pnl
+    return case((opening != 0, today_pnl / opening * 100.0), else_=0.0)
+
+
+def _row(user_id: int, realized: float, unrealized: float, invested: float,
+         today: float, mtd: float, ytd: float, as_of: date) -> Dict[str, Any]:
+    initial = settings.PORTFOLIO_INITIAL_CAPITAL
+    total = initial + realized + unrealized
+    opening = total - today
+    return {
+        "user_id": user_id,
+        "total_capital": total,
+        "cash_available": initial + realized - invested,
+        "invested_capital": invested,
+        "realized_pnl": realized,
+        "unrealized_pnl": unrealized,
+        "today_pnl": today,
+        "today_pnl_percent": today / opening * 100.0 if opening else 0.0,
+        "mtd_pnl": mtd,
+        "ytd_pnl": ytd,
+        "as_of": as_of,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def summary_view(row: PortfolioSummary, today: Optional[date] = None) -> Dict[str, Any]:
+    """Row as returned by the API; period P&L from an earlier day, month or year reads as 0"""
+    today = today or _utc_today()
+    as_of = row.as_of or today
+    same_day = as_of == today
+    same_month = same_day or (as_of.year, as_of.month) == (today.year, today.month)
+    same_year = same_month or as_of.year == today.year
+    return {
+        "total_capital": row.total_capital,
+        "cash_available": row.cash_available,
+        "invested_capital": row.invested_capital,
+        "realized_pnl": row.realized_pnl,
+        "unrealized_pnl": row.unrealized_pnl,
+        "today_pnl": row.today_pnl if same_day else 0.0,
+        "today_pnl_percent": row.today_pnl_percent if same_day else 0.0,
+        "mtd_pnl": row.mtd_pnl if same_month else 0.0,
+        "ytd_pnl": row.ytd_pnl if same_year else 0.0,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+    }
+
+
+class PortfolioMaintainer:
+    def __init__(self):
+        # user -> [realized, unrealized, invested] not yet written
+        self._pending: Dict[int, List[float]] = defaultdict(lambda: [0.0, 0.0, 0.0])
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"deltas": 0, "flushes": 0, "rows_upserted": 0, "reconciles": 0, "drifted": 0}
+
+    # Recording deltas
+
+    def apply(self, user_id: int, realized: float = 0.0, unrealized: float = 0.0, invested: float = 0.0):
+        pending = self._pending[user_id]
+        pending[0] += realized
+        pending[1] += unrealized
+        pending[2] += invested
+        self.stats["deltas"] += 1
+
+    def record_fill(self, user_id: int, realized: float, before=None, after=None):
+        """A completed fill as written; `before`/`after` are the open position (row or LivePosition) around it"""
+        self.apply(
+            user_id,
+            realized=realized,
+            unrealized=_pnl(after) - _pnl(before),
+            invested=_invested(after) - _invested(before),
+        )
+
+    def record_marks(self, deltas: Dict[int, float]):
+        """Unrealized P&L change per user, as written to the positions table"""
+        for user_id, delta in deltas.items():
+            if delta:
+                self.apply(user_id, unrealized=delta)
+
+    # Write-back
+
+    async def _seed(self):
+        """Build missing rows from positions and trades, which already hold the deltas recorded so far"""
+        users = list(self._pending)
+        async with AsyncSessionLocal() as db:
+            stored = set((await db.scalars(
+                select(PortfolioSummary.user_id).where(PortfolioSummary.user_id.in_(users))
+            )).all())
+            missing = {u: tuple(self._pending[u]) for u in users if u not in stored}
+            if not missing:
+                return
+            await self.rebuild(db, list(missing))
+        for user_id, seen in missing.items():
+            pending = self._pending.get(user_id)
+            if pending is None:
+                continue
+            for i, value in enumerate(seen):
+                pending[i] -= value
+            if not any(pending):
+                del self._pending[user_id]
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        await self._seed()
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, defaultdict(lambda: [0.0, 0.0, 0.0])
+        today = _utc_today()
+        rows = [
+            _row(user_id, realized, unrealized, invested, realized, realized, realized, today)
+            for user_id, (realized, unrealized, invested) in pending.items()
+        ]
+        table = PortfolioSummary.__table__
+        c = table.c
+        stmt = pg_insert(table)
+        delta = stmt.excluded  # a new row's values are the deltas themselves
+        today_pnl = case((c.as_of == today, c.today_pnl), else_=0.0) + delta.today_pnl
+        total = c.total_capital + delta.realized_pnl + delta.unrealized_pnl
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.user_id],
+            set_={
+                "total_capital": total,
+                "cash_available": c.cash_available + delta.realized_pnl - delta.invested_capital,
+                "invested_capital": c.invested_capital + delta.invested_capital,
+                "realized_pnl": c.realized_pnl + delta.realized_pnl,
+                "unrealized_pnl": c.unrealized_pnl + delta.unrealized_pnl,
+                "today_pnl": today_pnl,
+                "today_pnl_percent": _percent(today_pnl, total),
+                "mtd_pnl": case((c.as_of >= today.replace(day=1), c.mtd_pnl), else_=0.0) + delta.mtd_pnl,
+                "ytd_pnl": case((c.as_of >= today.replace(month=1, day=1), c.ytd_pnl), else_=0.0) + delta.ytd_pnl,
+                "as_of": delta.as_of,
+                "updated_at": delta.updated_at,
+            },
+        )
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(stmt, rows)
+                await db.commit()
+        except Exception:
+            for user_id, (realized, unrealized, invested) in pending.items():
+                self.apply(user_id, realized, unrealized, invested)  # retried on the next flush
+            raise
+        self.stats["flushes"] += 1
+        self.stats["rows_upserted"] += len(rows)
+        return len(rows)
+
+    # Consistency check
+
+    async def rebuild(self, db: AsyncSession, user_ids: Optional[Iterable[int]] = None,
+                      fix: bool = True) -> Dict[str, Any]:
+        """Recompute rows from positions and trades; rewrites drifted rows (all when fix and user_ids is None)"""
+        today = _utc_today()
+        day_start = datetime.combine(today, datetime.min.time())
+        month_start = day_start.replace(day=1)
+        year_start = month_start.replace(month=1)
+        ids = None if user_ids is None else list(user_ids)
+
+        realized_q = select(
+            Trade.user_id,
+            func.sum(realized_pnl),
+            func.sum(case((Trade.created_at >= day_start, realized_pnl), else_=0.0)),
+            func.sum(case((Trade.created_at >= month_start, realized_pnl), else_=0.0)),
+            func.sum(case((Trade.created_at >= year_start, realized_pnl), else_=0.0)),
+        ).group_by(Trade.user_id)
+        open_q = select(
+            Position.user_id,
+            func.sum(func.abs(Position.quantity) * Position.entry_price),
+            func.sum(Position.pnl),
+        ).where(Position.status == "open").group_by(Position.user_id)
+        stored_q = select(PortfolioSummary)
+        if ids is not None:
+            realized_q = realized_q.where(Trade.user_id.in_(ids))
+            open_q = open_q.where(Position.user_id.in_(ids))
+            stored_q = stored_q.where(PortfolioSummary.user_id.in_(ids))
+
+        realized = {r[0]: r[1:] for r in (await db.execute(realized_q)).all()}
+        opened = {r[0]: r[1:] for r in (await db.execute(open_q)).all()}
+        stored = {r.user_id: r for r in (await db.scalars(stored_q)).all()}
+
+        expected = {}
+        for user_id in set(realized) | set(opened) | set(stored) | set(ids or ()):
+            total, day, mtd, ytd = (v or 0.0 for v in realized.get(user_id, (0, 0, 0, 0)))
+            invested, unrealized = (v or 0.0 for v in opened.get(user_id, (0, 0)))
+            expected[user_id] = _row(user_id, total, unrealized, invested, day, mtd, ytd, today)
+
+        drifted = []
+        for user_id, row in expected.items():
+            current = stored.get(user_id)
+            if current is None:
+                drifted.append(user_id)
+                continue
+            view = summary_view(current, today)
+            if any(abs((view[col] or 0.0) - row[col]) > TOLERANCE for col in _COLUMNS):
+                drifted.append(user_id)
+
+        rewrite = sorted(expected) if fix and ids is None else sorted(drifted)
+        if fix and rewrite:
+            # An upsert, so a concurrent delta flush or first read never finds the row missing
+            stmt = pg_insert(PortfolioSummary)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[PortfolioSummary.user_id],
+                set_={col: stmt.excluded[col] for col in expected[rewrite[0]] if col != "user_id"},
+            )
+            await db.execute(stmt, [expected[u] for u in rewrite])
+            await db.commit()
+        return {"users": len(expected), "drifted": sorted(drifted), "rewritten": len(rewrite) if fix else 0}
+
+    async def get(self, db: AsyncSession, user_id: int) -> Dict[str, Any]:
+        row = await db.scalar(select(PortfolioSummary).where(PortfolioSummary.user_id == user_id))
+        if row is None:
+            # First read for a user without activity since the last rebuild
+            await self.rebuild(db, [user_id])
+            row = await db.scalar(select(PortfolioSummary).where(PortfolioSummary.user_id == user_id))
+        return summary_view(row)
+
+    # Lifecycle
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._flush_loop())]
+        if settings.PORTFOLIO_RECONCILE_INTERVAL > 0:
+            self._tasks.append(asyncio.create_task(self._reconcile_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final portfolio summary flush failed")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.PORTFOLIO_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Portfolio summary flush failed")
+
+    async def _reconcile_loop(self):
+        # Deltas still in flight on other workers can make a row look drifted
+        # for one round; the next pass converges.
+        interval = settings.PORTFOLIO_RECONCILE_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await get_redis().set(RECONCILE_LOCK, 1, nx=True, ex=max(int(interval), 1)):
+                    await self.flush()
+                    async with AsyncSessionLocal() as db:
+                        report = await self.rebuild(db, fix=False)
+                        if report["drifted"]:
+                            logger.warning("portfolio_summary drift for %d users, rebuilding", len(report["drifted"]))
+                            await self.rebuild(db, report["drifted"])
+                    self.stats["reconciles"] += 1
+                    self.stats["drifted"] += len(report["drifted"])
+            except Exception:
+                logger.exception("Portfolio summary reconcile failed")
+
+
+portfolio_maintainer = PortfolioMaintainer()
+
+
+async def _main(args):
+    async with AsyncSessionLocal() as db:
+        report = await portfolio_maintainer.rebuild(db, args.user_id or None, fix=not args.check)
+    print(f"users: {report['users']}  drifted: {len(report['drifted'])}  rewritten: {report['rewritten']}")
+    for user_id in report["drifted"][:50]:
+        print(f"  drift: user {user_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild portfolio_summary from positions and trades")
+    parser.add_argument("--check", action="store_true", help="report drift without writing")
+    parser.add_argument("--user-id", type=int, action="append", help="limit to these users (repeatable)")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
+
+# Usage: python -m app.services.portfolio_summary [--check] [--user-id 42]
+
+---
+
+# backend/app/services/risk_engine.py
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import PortfolioSummary, Position
+from app.database.session import AsyncSessionLocal
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+# Pre-trade limit checks run on every order before it reaches the broker, so
+# they read only in-memory state: net holdings per user and symbol, gross
+# value per strategy, realized P&L today and the unrealized P&L of open
+# holdings. The state is built from open positions and portfolio_summary at
+# startup and then kept current without I/O:
+#   - orders that pass are counted as working until the broker settles them,
+#     so a concurrent batch cannot overshoot a limit
+#   - fills are applied locally and published on RISK_FILL_CHANNEL, so every
+#     worker's state follows every worker's fills
+#   - ticks re-mark unrealized P&L, touching only the users holding the symbol
+# Orders that reduce a holding skip every limit but the order quantity cap,
+# so a user over a limit can always trade out of it.
+#
+#   RISK_MAX_ORDER_QUANTITY     shares in one order
+#   RISK_MAX_POSITION_QUANTITY  shares held in one symbol after the order
+#   RISK_MAX_SYMBOL_EXPOSURE    value held in one symbol, fraction of capital
+#   RISK_MAX_STRATEGY_EXPOSURE  value held by one strategy, fraction of capital
+#   RISK_DAILY_LOSS_LIMIT       realized today + unrealized, fraction of capital
+#   RISK_MAX_STOP_DISTANCE      stop_loss distance from the entry, fraction of price
+
+
+def _utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+@dataclass(frozen=True)
+class RiskLimits:
+    max_order_quantity: int
+    max_position_quantity: int
+    max_symbol_exposure: float
+    max_strategy_exposure: float
+    daily_loss_limit: float
+    max_stop_distance: float
+    require_stop_loss: bool
+
+    @classmethod
+    def from_settings(cls) -> "RiskLimits":
+        return cls(
+            max_order_quantity=settings.RISK_MAX_ORDER_QUANTITY,
+            max_position_quantity=settings.RISK_MAX_POSITION_QUANTITY,
+            max_symbol_exposure=settings.RISK_MAX_SYMBOL_EXPOSURE,
+            max_strategy_exposure=settings.RISK_MAX_STRATEGY_EXPOSURE,
+            daily_loss_limit=settings.RISK_DAILY_LOSS_LIMIT,
+            max_stop_distance=settings.RISK_MAX_STOP_DISTANCE,
+            require_stop_loss=settings.RISK_REQUIRE_STOP_LOSS,
+        )
+
+
+@dataclass
+class Holding:
+    quantity: int = 0  # negative is short
+    avg_price: float = 0.0
+
+    def fill(self, signed: int, price: float) -> float:
+        """Apply a fill at average cost; returns the P&L it realizes"""
+        held = self.quantity
+        if held == 0 or (held > 0) == (signed > 0):
+            self.quantity = held + signed
+            self.avg_price = (self.avg_price * abs(held) + price * abs(signed)) / abs(self.quantity)
+            return 0.0
+        closed = min(abs(signed), abs(held))
+        realized = (price - self.avg_price) * closed * (1 if held > 0 else -1)
+        self.quantity = held + signed
+        if self.quantity == 0:
+            self.avg_price = 0.0
+        elif (self.quantity > 0) != (held > 0):
+            self.avg_price = price  # flipped through zero
+        return realized
+
+    @property
+    def value(self) -> float:
+        return abs(self.quantity) * self.avg_price
+
+
+@dataclass
+class AccountRisk:
+    capital: float
+    realized_today: float = 0.0
+    unrealized: float = 0.0
+    holdings: Dict[str, Holding] = field(default_factory=dict)
+    strategy_holdings: Dict[Tuple[int, str], Holding] = field(default_factory=dict)
+    strategy_value: Dict[int, float] = field(default_factory=dict)  # sum of holding values at cost
+    working_buys: Dict[str, int] = field(default_factory=dict)
+    working_sells: Dict[str, int] = field(default_factory=dict)
+    working_value: Dict[int, float] = field(default_factory=dict)  # per strategy
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "capital": self.capital,
+            "realized_today": round(self.realized_today, 2),
+            "unrealized": round(self.unrealized, 2),
+            "holdings": {s: {"quantity": h.quantity, "avg_price": h.avg_price} for s, h in self.holdings.items()},
+            "strategy_value": {str(k): round(v, 2) for k, v in self.strategy_value.items()},
+            "working_buys": dict(self.working_buys),
+            "working_sells": dict(self.working_sells),
+        }
+
+
+class RiskEngine:
+    def __init__(self, limits: Optional[RiskLimits] = None):
+        self.limits = limits or RiskLimits.from_settings()
+        self.accounts: Dict[int, AccountRisk] = {}
+        self.prices: Dict[str, float] = {}  # last traded price per symbol
+        self._holders: Dict[str, Set[int]] = defaultdict(set)
+        self._working: Dict[Tuple[int, str], Tuple[str, int, Optional[int], float]] = {}  # (user_id, order_id) -> reservation
+        self._tasks: List[asyncio.Task] = []
+        self._pubsub = None
+        self._worker_id = f"{os.getpid()}-{id(self)}"
+        self._day = _utc_today()
+        self.ready = False
+        self.stats = {"checks": 0, "rejected": 0, "fills": 0, "remote_fills": 0}
+
+    def account(self, user_id: int) -> AccountRisk:
+        account = self.accounts.get(user_id)
+        if account is None:
+            account = self.accounts[user_id] = AccountRisk(settings.PORTFOLIO_INITIAL_CAPITAL)
+        return account
+
+    # State
+
+    def load(self, positions: Iterable[Any], summaries: Iterable[Any] = ()):
+        """Replace holdings and capital with open positions and portfolio_summary rows"""
+        today = _utc_today()
+        accounts: Dict[int, AccountRisk] = {}
+        for row in summaries:
+            account = accounts[row.user_id] = AccountRisk(row.total_capital or 0.0)
+            if row.as_of == today:
+                account.realized_today = row.today_pnl or 0.0
+        holders: Dict[str, Set[int]] = defaultdict(set)
+        for p in positions:
+            if not p.quantity:
+                continue
+            account = accounts.get(p.user_id)
+            if account is None:
+                account = accounts[p.user_id] = AccountRisk(settings.PORTFOLIO_INITIAL_CAPITAL)
+            entry = p.entry_price or 0.0
+            account.holdings.setdefault(p.symbol, Holding()).fill(p.quantity, entry)
+            if p.strategy_id is not None:
+                account.strategy_holdings.setdefault((p.strategy_id, p.symbol), Holding()).fill(p.quantity, entry)
+            if p.current_price and p.symbol not in self.prices:
+                self.prices[p.symbol] = p.current_price
+        for user_id, account in accounts.items():
+            for symbol, holding in list(account.holdings.items()):
+                if not holding.quantity:
+                    del account.holdings[symbol]  # offsetting positions
+                    continue
+                holders[symbol].add(user_id)
+                mark = self.prices.get(symbol, holding.avg_price)
+                account.unrealized += holding.quantity * (mark - holding.avg_price)
+            for (strategy_id, _), holding in account.strategy_holdings.items():
+                account.strategy_value[strategy_id] = account.strategy_value.get(strategy_id, 0.0) + holding.value
+        self.accounts, self._holders, self._day = accounts, holders, today
+        working, self._working = self._working, {}
+        for (user_id, order_id), (symbol, signed, strategy_id, value) in working.items():
+            self._reserve(order_id, user_id, symbol, signed, strategy_id, value)
+
+    async def sync(self):
+        async with AsyncSessionLocal() as db:
+            positions = (await db.execute(
+                select(Position.user_id, Position.strategy_id, Position.symbol, Position.quantity,
+                       Position.entry_price, Position.current_price).where(Position.status == "open")
+            )).all()
+            summaries = (await db.execute(
+                select(PortfolioSummary.user_id, PortfolioSummary.total_capital,
+                       PortfolioSummary.today_pnl, PortfolioSummary.as_of)
+            )).all()
+        self.load(positions, summaries)
+
+    # Checks
+
+    def check(self, order) -> Optional[str]:
+        """Reason the order breaks a limit, or None; reads memory only"""
+        self.stats["checks"] += 1
+        reason = self._check(order)
+        if reason is not None:
+            self.stats["rejected"] += 1
+        return reason
+
+    def _check(self, order) -> Optional[str]:
+        limits = self.limits
+        if order.quantity > limits.max_order_quantity:
+            return f"Order quantity {order.quantity} exceeds {limits.max_order_quantity}"
+        account = self.accounts.get(order.user_id) or self.account(order.user_id)
+        symbol = order.symbol
+        holding = account.holdings.get(symbol)
+        held = holding.quantity if holding is not None else 0
+        # Working orders on the same side count as filled
+        if order.side == "buy":
+            held += account.working_buys.get(symbol, 0)
+            after = held + order.quantity
+        else:
+            held -= account.working_sells.get(symbol, 0)
+            after = held - order.quantity
+        if abs(after) <= abs(held):
+            return None
+
+        price = order.price or self.prices.get(symbol) or (holding.avg_price if holding is not None else None)
+        if not price:
+            return f"No reference price for {symbol}"
+        capital = account.capital
+        if abs(after) > limits.max_position_quantity:
+            return f"Position in {symbol} would be {abs(after)} shares, limit {limits.max_position_quantity}"
+        if abs(after) * price > limits.max_symbol_exposure * capital:
+            return f"Exposure to {symbol} would exceed {limits.max_symbol_exposure:.0%} of capital"
+        strategy_id = order.strategy_id
+        if strategy_id is not None:
+            value = (account.strategy_value.get(strategy_id, 0.0) + account.working_value.get(strategy_id, 0.0)
+                     + (abs(after) - abs(held)) * price)
+            if value > limits.max_strategy_exposure * capital:
+                return f"Strategy {strategy_id} exposure would exceed {limits.max_strategy_exposure:.0%} of capital"
+        if account.realized_today + account.unrealized <= -limits.daily_loss_limit * capital:
+            return "Daily loss limit reached"
+        return self._check_exits(order, price, after > 0)
+
+    def _check_exits(self, order, price: float, long: bool) -> Optional[str]:
+        stop, target = order.stop_loss, order.target
+        direction = 1 if long else -1
+        if stop is None:
+            if self.limits.require_stop_loss:
+                return "stop_loss is required"
+        else:
+            if (price - stop) * direction <= 0:
+                return f"stop_loss {stop} must be {'below' if long else 'above'} the entry price {price}"
+            if abs(price - stop) > self.limits.max_stop_distance * price:
+                return f"stop_loss {stop} is more than {self.limits.max_stop_distance:.0%} from the entry price {price}"
+        if target is not None and (target - price) * direction <= 0:
+            return f"target {target} must be {'above' if long else 'below'} the entry price {price}"
+        return None
+
+    def admit(self, order) -> Optional[str]:
+        """check() and, if it passes, count the order as working until settle() or release()"""
+        reason = self.check(order)
+        if reason is None:
+            self.hold(order)
+        return reason
+
+    def hold(self, order):
+        """Count an order already at the broker as working, without checking it"""
+        if (order.user_id, order.order_id) in self._working:
+            return
+        signed = order.quantity if order.side == "buy" else -order.quantity
+        price = order.price or self.prices.get(order.symbol, 0.0)
+        self._reserve(order.order_id, order.user_id, order.symbol, signed, order.strategy_id,
+                      order.quantity * price)
+
+    def _reserve(self, order_id: str, user_id: int, symbol: str, signed: int,
+                 strategy_id: Optional[int], value: float):
+        account = self.account(user_id)
+        working = account.working_buys if signed > 0 else account.working_sells
+        working[symbol] = working.get(symbol, 0) + abs(signed)
+        if strategy_id is not None:
+            account.working_value[strategy_id] = account.working_value.get(strategy_id, 0.0) + value
+        self._working[(user_id, order_id)] = (symbol, signed, strategy_id, value)
+
+    def release(self, user_id: int, order_id: str):
+        reservation = self._working.pop((user_id, order_id), None)
+        if reservation is None:
+            return
+        symbol, signed, strategy_id, value = reservation
+        account = self.account(user_id)
+        working = account.working_buys if signed > 0 else account.working_sells
+        left = working.get(symbol, 0) - abs(signed)
+        if left > 0:
+            working[symbol] = left
+        else:
+            working.pop(symbol, None)
+        if strategy_id is not None:
+            left_value = account.working_value.get(strategy_id, 0.0) - value
+            if left_value > 1e-9:
+                account.working_value[strategy_id] = left_value
+            else:
+                account.working_value.pop(strategy_id, None)
+
+    # Updates
+
+    async def settle(self, order, status: str, price: Optional[float] = None):
+        """The broker finished an order: drop its reservation and apply the fill if it completed"""
+        self.release(order.user_id, order.order_id)
+        if status != "completed":
+            return
+        price = price or order.price or self.prices.get(order.symbol)
+        if not price:
+            logger.warning("Fill for %s without a price; risk state misses it until restart", order.order_id)
+            return
+        fill = {
+            "worker": self._worker_id,
+            "user_id": order.user_id,
+            "symbol": order.symbol,
+            "side": order.side,
+            "quantity": order.quantity,
+            "price": price,
+            "strategy_id": order.strategy_id,
+        }
+        self.apply_fill(fill)
+        if self._pubsub is not None:
+            try:
+                await get_redis().publish(settings.RISK_FILL_CHANNEL, json.dumps(fill))
+            except Exception:
+                logger.exception("Publishing fill to other workers failed")
+
+    def apply_fill(self, fill: Dict[str, Any]):
+        account = self.account(fill["user_id"])
+        symbol, price = fill["symbol"], float(fill["price"])
+        signed = fill["quantity"] if fill["side"] == "buy" else -fill["quantity"]
+        mark = self.prices.setdefault(symbol, price)
+
+        holding = account.holdings.setdefault(symbol, Holding())
+        account.unrealized -= holding.quantity * (mark - holding.avg_price)
+        account.realized_today += holding.fill(signed, price)
+        account.unrealized += holding.quantity * (mark - holding.avg_price)
+        if holding.quantity:
+            self._holders[symbol].add(fill["user_id"])
+        else:
+            del account.holdings[symbol]
+            self._holders[symbol].discard(fill["user_id"])
+
+        strategy_id = fill.get("strategy_id")
+        if strategy_id is not None:
+            holding = account.strategy_holdings.setdefault((strategy_id, symbol), Holding())
+            before = holding.value
+            holding.fill(signed, price)
+            account.strategy_value[strategy_id] = account.strategy_value.get(strategy_id, 0.0) + holding.value - before
+            if not holding.quantity:
+                del account.strategy_holdings[(strategy_id, symbol)]
+        self.stats["fills"] += 1
+
+    def on_tick(self, tick: Dict[str, Any]):
+        symbol = tick["symbol"]
+        price = tick.get("ltp", tick.get("price"))
+        if price is None:
+            return
+        price = float(price)
+        previous = self.prices.get(symbol)
+        self.prices[symbol] = price
+        for user_id in self._holders.get(symbol, ()):
+            holding = self.accounts[user_id].holdings[symbol]
+            mark = previous if previous is not None else holding.avg_price
+            self.accounts[user_id].unrealized += holding.quantity * (price - mark)
+
+    def snapshot(self, user_id: int) -> Dict[str, Any]:
+        account = self.accounts.get(user_id)
+        if account is None:
+            account = AccountRisk(settings.PORTFOLIO_INITIAL_CAPITAL)
+        limits = self.limits
+        return {
+            **account.as_dict(),
+            "daily_loss_limit": limits.daily_loss_limit * account.capital,
+            "loss_limit_reached": account.realized_today + account.unrealized <= -limits.daily_loss_limit * account.capital,
+        }
+
+    # Lifecycle
+
+    async def start(self):
+        await self.sync()
+        manager.add_tick_listener(self.on_tick)
+        self._pubsub = get_redis().pubsub()
+        await self._pubsub.subscribe(settings.RISK_FILL_CHANNEL)
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._day_loop()),
+        ]
+        self.ready = True
+
+    async def stop(self):
+        manager.remove_tick_listener(self.on_tick)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self.ready = False
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                fill = json.loads(message["data"])
+                if fill.get("worker") != self._worker_id:
+                    self.apply_fill(fill)
+                    self.stats["remote_fills"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Risk fill listener: bad message")
+                await asyncio.sleep(0.1)
+
+    async def _day_loop(self):
+        # Realized P&L counts toward the loss limit for the UTC day it happened
+        while True:
+            await asyncio.sleep(60)
+            today = _utc_today()
+            if today != self._day:
+                self._day = today
+                for account in self.accounts.values():
+                    account.realized_today = 0.0
+
+
+risk_engine = RiskEngine()
+
+---
+
+# backend/app/services/broker_gateway.py
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+from app.database.models import APICredentials, Position, Trade
+from app.cache.response_cache import response_cache
+from app.database.session import AsyncSessionLocal, async_engine
+from app.services.audit import audit_sink
+from app.services.portfolio_summary import portfolio_maintainer
+from app.services.position_book import LivePosition, fill_position, position_book
+from app.services.risk_engine import risk_engine
+
+logger = logging.getLogger(__name__)
+
+# Orders go out through one pooled keep-alive HTTP client per broker account,
+# paced by a token bucket at the broker's order rate so bursts queue here
+# instead of coming back as 429s. A batch is placed concurrently over the
+# pool. Every order carries a client order_id, sent to the broker as the
+# order tag:
+#   - order:{user_id}:{order_id} in Redis is claimed (SET NX) before
+#     sending, so a resubmitted order_id returns the first attempt's state;
+#     client ids are scoped to their user
+#   - after an ambiguous failure (timeout, dropped connection) the broker's
+#     order book is searched for the tag before retrying, so a retry never
+#     places the order twice
+#   - risk_engine checks it in memory after the claim; a rejection is
+#     stored like any other order state
+#   - every state an order reaches is recorded in the audit log
+#   - the final state is claimed once (order-settled:{user_id}:{order_id},
+#     SET NX), so only one worker applies a fill
+#   - a fill updates (or opens) the user's position and writes its trades
+#     row in one transaction, then feeds portfolio_summary and the position
+#     book
+# Order states are written to trades in batched upserts keyed by order_id
+# and the order's created_at (fixed across its states); a row that reached a
+# final state keeps it, whatever order the writes land in. Open orders are
+# resolved by polling each account's order book, one request per account
+# however many orders are open. At start a worker also picks up orders
+# still pending in trades, left by a restart or by another worker.
+
+PENDING, COMPLETED, REJECTED, CANCELLED = "pending", "completed", "rejected", "cancelled"
+TERMINAL = (COMPLETED, REJECTED, CANCELLED)
+AUDIT_ACTIONS = {PENDING: "order_placed", COMPLETED: "order_filled", REJECTED: "order_rejected", CANCELLED: "order_cancelled"}
+
+
+ORDER_ID_MAX = 20  # Kite tags are at most 20 characters
+IST = timezone(timedelta(hours=5, minutes=30))  # brokers report exchange time in IST without an offset
+EXCHANGE_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%d-%b-%Y %H:%M:%S")  # Kite, Angel One
+
+
+def new_order_id() -> str:
+    return uuid.uuid4().hex[:ORDER_ID_MAX]
+
+
+def order_key(user_id: int, order_id: str) -> str:
+    return f"order:{user_id}:{order_id}"
+
+
+def settled_key(user_id: int, order_id: str) -> str:
+    return f"order-settled:{user_id}:{order_id}"
+
+
+def trades_upsert():
+    stmt = pg_insert(Trade)
+    new = stmt.excluded
+    settled = Trade.status != PENDING  # a queued earlier state may commit after the fill
+    return stmt.on_conflict_do_update(
+        # trades is partitioned by created_at, so its unique key includes it
+        index_elements=[Trade.order_id, Trade.created_at],
+        set_={
+            "status": case((settled, Trade.status), else_=new.status),
+            "price": case((settled, Trade.price), else_=new.price),
+            "position_id": func.coalesce(Trade.position_id, new.position_id),
+            "realized_pnl": func.coalesce(Trade.realized_pnl, new.realized_pnl),
+            "broker_order_id": func.coalesce(new.broker_order_id, Trade.broker_order_id),
+            "executed_at": func.coalesce(new.executed_at, Trade.executed_at),
+        },
+    )
+
+
+def exchange_time(value: Optional[str]) -> Optional[datetime]:
+    """A broker's exchange timestamp as naive UTC, like the other trades columns"""
+    if not value:
+        return None
+    for fmt in EXCHANGE_TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.replace(tzinfo=IST).astimezone(timezone.utc).replace(tzinfo=None)
+    return None
+
+
+class BrokerError(Exception):
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None,
+                 ambiguous: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.ambiguous = ambiguous  # the broker may have placed the order
+
+
+@dataclass
+class Order:
+    user_id: int
+    symbol: str
+    side: str  # buy, sell
+    quantity: int
+    price: Optional[float] = None  # None places a market order
+    order_id: str = field(default_factory=new_order_id)
+    exchange: str = "NSE"
+    product: str = "MIS"
+    position_id: Optional[int] = None
+    instrument_token: Optional[str] = None  # Angel One symboltoken
+    strategy_id: Optional[int] = None
+    stop_loss: Optional[float] = None  # Checked pre-trade, not sent to the broker
+    target: Optional[float] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)  # trades partition key; fixed for every state
+
+    @property
+    def order_type(self) -> str:
+        return "MARKET" if self.price is None else "LIMIT"
+
+
+@dataclass
+class OrderState:
+    order_id: str
+    status: str
+    broker_order_id: Optional[str] = None
+    average_price: Optional[float] = None
+    error: Optional[str] = None
+    executed_at: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class BrokerAccount:
+    broker: str
+    api_key: str
+    access_token: str
+
+
+class RateLimiter:
+    """Token bucket; acquire() waits for a token so callers are paced, not rejected"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BrokerAdapter:
+    """Request and response mapping for one broker API"""
+
+    name = ""
+    place_path = ""
+    book_path = ""
+
+    def base_url(self) -> str:
+        raise NotImplementedError
+
+    def rate(self) -> float:
+        raise NotImplementedError
+
+    def headers(self, account: BrokerAccount) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def place_request(self, order: Order) -> Dict[str, Any]:
+        """httpx request kwargs"""
+        raise NotImplementedError
+
+    def placed_id(self, body: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def book(self, body: Dict[str, Any]) -> Dict[str, OrderState]:
+        """Orders in the book that carry one of our tags, keyed by tag"""
+        raise NotImplementedError
+
+
+class ZerodhaAdapter(BrokerAdapter):
+    name = "zerodha"
+    place_path = "/orders/regular"
+    book_path = "/orders"
+    STATUS = {"COMPLETE": COMPLETED, "REJECTED": REJECTED, "CANCELLED": CANCELLED}
+
+    def base_url(self) -> str:
+        return settings.ZERODHA_BASE_URL
+
+    def rate(self) -> float:
+        return settings.ZERODHA_ORDERS_PER_SECOND
+
+    def headers(self, account: BrokerAccount) -> Dict[str, str]:
+        return {"X-Kite-Version": "3", "Authorization": f"token {account.api_key}:{account.access_token}"}
+
+    def place_request(self, order: Order) -> Dict[str, Any]:
+        data = {
+            "tradingsymbol": order.symbol,
+            "exchange": order.exchange,
+            "transaction_type": order.side.upper(),
+            "order_type": order.order_type,
+            "quantity": order.quantity,
+            "product": order.product,
+            "validity": "DAY",
+            "tag": order.order_id,
+        }
+        if order.price is not None:
+            data["price"] = order.price
+        return {"data": data}
+
+    def placed_id(self, body: Dict[str, Any]) -> str:
+        return str(body["data"]["order_id"])
+
+    def book(self, body: Dict[str, Any]) -> Dict[str, OrderState]:
+        states = {}
+        for row in body.get("data") or []:
+            tag = row.get("tag")
+            if tag:
+                states[tag] = OrderState(
+                    order_id=tag,
+                    status=self.STATUS.get(row.get("status"), PENDING),
+                    broker_order_id=str(row.get("order_id")),
+                    average_price=row.get("average_price") or None,
+                    error=row.get("status_message"),
+                    executed_at=row.get("exchange_timestamp"),
+                )
+        return states
+
+
+class AngelOneAdapter(BrokerAdapter):
+    name = "angel_one"
+    place_path = "/rest/secure/angelbroking/order/v1/placeOrder"
+    book_path = "/rest/secure/angelbroking/order/v1/getOrderBook"
+    STATUS = {"complete": COMPLETED, "rejected": REJECTED, "cancelled": CANCELLED}
+    PRODUCTS = {"MIS": "INTRADAY", "CNC": "DELIVERY"}
+
+    def base_url(self) -> str:
+        return settings.ANGEL_ONE_BASE_URL
+
+    def rate(self) -> float:
+        return settings.ANGEL_ONE_ORDERS_PER_SECOND
+
+    def headers(self, account: BrokerAccount) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {account.access_token}",
+            "X-PrivateKey": account.api_key,
+            "X-UserType": "USER",
+            "X-SourceID": "WEB",
+            "Accept": "application/json",
+        }
+
+    def place_request(self, order: Order) -> Dict[str, Any]:
+        return {"json": {
+            "variety": "NORMAL",
+            "tradingsymbol": order.symbol,
+            "symboltoken": order.instrument_token or "",
+            "transactiontype": order.side.upper(),
+            "exchange": order.exchange,
+            "ordertype": order.order_type,
+            "producttype": self.PRODUCTS.get(order.product, order.product),
+            "duration": "DAY",
+            "price": str(order.price or 0),
+            "quantity": str(order.quantity),
+            "ordertag": order.order_id,
+        }}
+
+    def placed_id(self, body: Dict[str, Any]) -> str:
+        if not body.get("status"):
+            raise BrokerError(body.get("message") or "Order rejected")
+        return str(body["data"]["orderid"])
+
+    def book(self, body: Dict[str, Any]) -> Dict[str, OrderState]:
+        states = {}
+        for row in body.get("data") or []:
+            tag = row.get("ordertag")
+            if tag:
+                states[tag] = OrderState(
+                    order_id=tag,
+                    status=self.STATUS.get(row.get("orderstatus"), PENDING),
+                    broker_order_id=str(row.get("orderid")),
+                    average_price=float(row["averageprice"]) if row.get("averageprice") else None,
+                    error=row.get("text") or None,
+                    executed_at=row.get("exchtime") or None,
+                )
+        return states
+
+
+BROKERS: Dict[str, BrokerAdapter] = {
+    "zerodha": ZerodhaAdapter(),
+    "angel_one": AngelOneAdapter(),
+}
+
+
+class BrokerClient:
+    """Pooled keep-alive client and rate limiter for one broker account"""
+
+    def __init__(self, adapter: BrokerAdapter, account: BrokerAccount, base_url: Optional[str] = None):
+        self.adapter = adapter
+        self.account = account
+        # Brokers count orders in a rolling second, so space them evenly
+        # rather than letting a full bucket burst on top of the refill
+        self.limiter = RateLimiter(adapter.rate(), burst=1)
+        limits = httpx.Limits(
+            max_connections=settings.BROKER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.BROKER_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        )
+        self.http = httpx.AsyncClient(
+            base_url=base_url or adapter.base_url(),
+            headers=adapter.headers(account),
+            limits=limits,
+            timeout=settings.BROKER_TIMEOUT,
+        )
+        self.stats = {"placed": 0, "rejected": 0, "retries": 0, "throttled": 0, "recovered": 0}
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def order_book(self) -> Dict[str, OrderState]:
+        response = await self.http.get(self.adapter.book_path)
+        response.raise_for_status()
+        return self.adapter.book(response.json())
+
+    async def _send(self, order: Order) -> str:
+        await self.limiter.acquire()
+        try:
+            response = await self.http.post(self.adapter.place_path, **self.adapter.place_request(order))
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            raise BrokerError(type(e).__name__, retryable=True)  # never reached the broker
+        except httpx.TransportError as e:
+            raise BrokerError(type(e).__name__, retryable=True, ambiguous=True)
+        status = response.status_code
+        if status in (429, 503):
+            retry_after = response.headers.get("Retry-After")
+            raise BrokerError(f"HTTP {status}", retryable=True, retry_after=float(retry_after) if retry_after else None)
+        if status >= 500:
+            # A gateway error can come back after the broker accepted the order
+            raise BrokerError(f"HTTP {status}", retryable=True, ambiguous=True)
+        try:
+            body = response.json()
+        except ValueError:
+            raise BrokerError(f"HTTP {status}: invalid response")
+        if status >= 400:
+            raise BrokerError(body.get("message") or f"HTTP {status}")
+        return self.adapter.placed_id(body)
+
+    async def _lookup(self, order: Order) -> Optional[OrderState]:
+        try:
+            return (await self.order_book()).get(order.order_id)
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    async def place(self, order: Order) -> OrderState:
+        """Place once; retries are safe because an ambiguous attempt is looked up by tag first"""
+        backoff = 0.2
+        for attempt in range(settings.BROKER_MAX_RETRIES + 1):
+            try:
+                broker_order_id = await self._send(order)
+                self.stats["placed"] += 1
+                return OrderState(order.order_id, PENDING, broker_order_id)
+            except BrokerError as e:
+                if e.ambiguous:
+                    existing = await self._lookup(order)
+                    if existing is not None:
+                        self.stats["recovered"] += 1
+                        return existing
+                if not e.retryable or attempt == settings.BROKER_MAX_RETRIES:
+                    self.stats["rejected"] += 1
+                    return OrderState(order.order_id, REJECTED, error=str(e))
+                self.stats["retries"] += 1
+                if str(e) == "HTTP 429":
+                    self.stats["throttled"] += 1
+                await asyncio.sleep((e.retry_after or backoff) * (1 + random.random() * 0.2))
+                backoff *= 2
+
+
+class OrderGateway:
+    def __init__(self, record: bool = True, check_risk: bool = True):
+        self.record = record  # write order states to trades
+        self.check_risk = check_risk  # pre-trade limits from risk_engine
+        self.clients: Dict[BrokerAccount, BrokerClient] = {}
+        self._orders: Dict[Tuple[int, str], Tuple[Order, BrokerAccount]] = {}  # open orders placed by this worker
+        self._rows: Dict[Tuple[int, str], Dict[str, Any]] = {}  # trades rows waiting for the next write
+        self._tasks: List[asyncio.Task] = []
+        self.base_urls: Dict[str, str] = {}  # broker -> URL override (mock broker, sandboxes)
+        self.stats = {"submitted": 0, "duplicates": 0, "risk_rejected": 0, "fills": 0, "writes": 0, "rows_written": 0}
+
+    # Accounts
+
+    def client(self, account: BrokerAccount) -> BrokerClient:
+        client = self.clients.get(account)
+        if client is None:
+            adapter = BROKERS.get(account.broker)
+            if adapter is None:
+                raise ValueError(f"Unsupported broker: {account.broker}")
+            client = self.clients[account] = BrokerClient(adapter, account, self.base_urls.get(account.broker))
+        return client
+
+    async def account_for(self, user_id: int, broker: Optional[str] = None) -> Optional[BrokerAccount]:
+        async with AsyncSessionLocal() as db:
+            query = select(APICredentials).where(
+                (APICredentials.user_id == user_id) & (APICredentials.is_active.is_(True))
+            )
+            if broker:
+                query = query.where(APICredentials.broker == broker)
+            credentials = (await db.scalars(query)).first()
+        if credentials is None or not credentials.api_token:
+            return None
+        return BrokerAccount(credentials.broker, credentials.api_key, credentials.api_token)
+
+    # Placement
+
+    async def submit(self, account: BrokerAccount, orders: List[Order]) -> List[OrderState]:
+        """Place a batch concurrently; results keep input order"""
+        client = self.client(account)
+        return list(await asyncio.gather(*(self._submit_one(client, account, o) for o in orders)))
+
+    async def _submit_one(self, client: BrokerClient, account: BrokerAccount, order: Order) -> OrderState:
+        redis = get_redis()
+        claim = OrderState(order.order_id, PENDING)
+        if not await redis.set(order_key(order.user_id, order.order_id), json.dumps(claim.as_dict()), nx=True,
+                               ex=settings.ORDER_IDEMPOTENCY_TTL):
+            self.stats["duplicates"] += 1
+            return await self.state(order.user_id, order.order_id) or claim
+        self.stats["submitted"] += 1
+        reason = risk_engine.admit(order) if self.check_risk else None
+        if reason is not None:
+            self.stats["risk_rejected"] += 1
+            state = OrderState(order.order_id, REJECTED, error=reason)
+            await self._update(order, state)
+            return state
+        self._queue(order, claim)
+        state = await client.place(order)
+        await self._update(order, state)
+        if state.status == PENDING:
+            self._orders[(order.user_id, order.order_id)] = (order, account)
+        return state
+
+    async def state(self, user_id: int, order_id: str) -> Optional[OrderState]:
+        raw = await get_redis().get(order_key(user_id, order_id))
+        return OrderState(**json.loads(raw)) if raw else None
+
+    async def _update(self, order: Order, state: OrderState):
+        redis = get_redis()
+        if state.status in TERMINAL and not await redis.set(
+            settled_key(order.user_id, order.order_id), state.status, nx=True, ex=settings.ORDER_IDEMPOTENCY_TTL
+        ):
+            # Another worker polling the same order settled it first
+            if self.check_risk:
+                risk_engine.release(order.user_id, order.order_id)
+            return
+        await redis.set(order_key(order.user_id, order.order_id), json.dumps(state.as_dict()),
+                        ex=settings.ORDER_IDEMPOTENCY_TTL)
+        row = self._queue(order, state)
+        if state.status == COMPLETED and row is not None:
+            try:
+                await self._settle_fill(order, row)
+            except Exception:
+                logger.exception("Applying fill %s to positions failed; trade row left for the next write",
+                                 order.order_id)
+            else:
+                if self._rows.get((order.user_id, order.order_id)) is row:
+                    del self._rows[(order.user_id, order.order_id)]
+        if self.record:
+            await audit_sink.log(AUDIT_ACTIONS.get(state.status, f"order_{state.status}"), order.user_id, "order",
+                                 details={"order_id": order.order_id, "symbol": order.symbol, "side": order.side,
+                                          "quantity": order.quantity, "price": state.average_price or order.price,
+                                          "broker_order_id": state.broker_order_id, "error": state.error})
+        if state.status == COMPLETED:
+            self.stats["fills"] += 1
+        if self.check_risk and state.status in TERMINAL:
+            await risk_engine.settle(order, state.status, state.average_price)
+
+    # Fills
+
+    async def poll(self) -> int:
+        """Resolve open orders from one order book request per account"""
+        by_account: Dict[BrokerAccount, List[Order]] = {}
+        for order, account in self._orders.values():
+            by_account.setdefault(account, []).append(order)
+        resolved = 0
+        for account, orders in by_account.items():
+            try:
+                book = await self.client(account).order_book()
+            except (httpx.HTTPError, ValueError):
+                logger.warning("Order book poll failed for %s", account.broker)
+                continue
+            for order in orders:
+                state = book.get(order.order_id)
+                if state is not None and state.status in TERMINAL:
+                    await self._update(order, state)
+                    self._orders.pop((order.user_id, order.order_id), None)
+                    resolved += 1
+        return resolved
+
+    async def _open_position(self, db: AsyncSession, order: Order) -> Optional[Position]:
+        """The open position a fill applies to: order.position_id if it is this symbol and strategy"""
+        same_strategy = (Position.strategy_id.is_(None) if order.strategy_id is None
+                         else Position.strategy_id == order.strategy_id)
+        query = select(Position).where(
+            (Position.user_id == order.user_id) & (Position.status == "open")
+            & (Position.symbol == order.symbol) & same_strategy
+        ).order_by(Position.id).limit(1).with_for_update()
+        if order.position_id is not None:
+            position = (await db.scalars(query.where(Position.id == order.position_id))).first()
+            if position is not None:
+                return position
+        return (await db.scalars(query)).first()
+
+    async def _settle_fill(self, order: Order, row: Dict[str, Any]):
+        """Apply a completed order to its position and write its trades row in one transaction"""
+        price, when = row["price"], row["executed_at"]
+        if not price:
+            logger.warning("Fill %s has no price; position not updated", order.order_id)
+            return
+        signed = order.quantity if order.side == "buy" else -order.quantity
+        async with AsyncSessionLocal() as db:
+            if async_engine.dialect.name == "postgresql":
+                # Fills for one user and symbol can settle on different workers at once
+                await db.execute(select(func.pg_advisory_xact_lock(
+                    func.hashtext(f"position:{order.user_id}:{order.symbol}"))))
+            position = await self._open_position(db, order)
+            if position is None:
+                before, realized = None, None
+                position = Position(user_id=order.user_id, strategy_id=order.strategy_id, symbol=order.symbol,
+                                    quantity=signed, entry_price=price, current_price=price, entry_time=when,
+                                    stop_loss=order.stop_loss, target=order.target, pnl=0.0, pnl_percent=0.0,
+                                    status="open")
+                db.add(position)
+            else:
+                before = LivePosition.from_row(position)
+                realized = fill_position(position, signed, price, when)
+            await db.flush()  # assigns a new position its id
+            row["position_id"] = position.id
+            row["realized_pnl"] = realized
+            await db.execute(trades_upsert(), [row])
+            await db.commit()
+        portfolio_maintainer.record_fill(order.user_id, realized or 0.0, before,
+                                         position if position.status == "open" else None)
+        await position_book.apply_fill(position)
+        await response_cache.invalidate(f"positions:{order.user_id}", f"trades:{order.user_id}")
+
+    # Write-back
+
+    def _queue(self, order: Order, state: OrderState) -> Optional[Dict[str, Any]]:
+        if not self.record:
+            return None
+        executed_at = None
+        if state.status == COMPLETED:
+            executed_at = exchange_time(state.executed_at) or datetime.utcnow()
+        row = self._rows[(order.user_id, order.order_id)] = {
+            "order_id": order.order_id,
+            "user_id": order.user_id,
+            "position_id": order.position_id,
+            "strategy_id": order.strategy_id,
+            "symbol": order.symbol,
+            "side": order.side,
+            "quantity": order.quantity,
+            "price": state.average_price or order.price or 0.0,
+            "status": state.status,
+            "broker_order_id": state.broker_order_id,
+            "created_at": order.created_at,
+            "executed_at": executed_at,
+            "realized_pnl": None,  # set when the fill is applied to its position
+            "stop_loss": order.stop_loss,
+            "target": order.target,
+        }
+        return row
+
+    async def flush(self) -> int:
+        """Upsert every queued order state into trades in one statement"""
+        if not self._rows:
+            return 0
+        rows, self._rows = self._rows, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(trades_upsert(), list(rows.values()))
+                await db.commit()
+        except Exception:
+            for key, row in rows.items():
+                self._rows.setdefault(key, row)  # newer states queued meanwhile win
+            raise
+        self.stats["writes"] += 1
+        self.stats["rows_written"] += len(rows)
+        # After the commit, so a recompute cannot cache the rows' previous state
+        await response_cache.invalidate(*{f"trades:{row['user_id']}" for row in rows.values()})
+        return len(rows)
+
+    async def recover(self) -> int:
+        """Poll orders still pending in trades that this worker is not tracking"""
+        # Day orders cannot stay open past the idempotency window
+        since = datetime.utcnow() - timedelta(seconds=settings.ORDER_IDEMPOTENCY_TTL)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(select(Trade).where(
+                (Trade.status == PENDING) & (Trade.created_at >= since)
+            ))).all()
+        accounts: Dict[int, Optional[BrokerAccount]] = {}
+        recovered = 0
+        for row in rows:
+            if (row.user_id, row.order_id) in self._orders:
+                continue
+            if row.user_id not in accounts:
+                accounts[row.user_id] = await self.account_for(row.user_id)
+            account = accounts[row.user_id]
+            if account is None:
+                logger.warning("Pending order %s has no active broker credentials; not polled", row.order_id)
+                continue
+            order = Order(user_id=row.user_id, symbol=row.symbol, side=row.side, quantity=row.quantity,
+                          price=row.price or None, order_id=row.order_id, position_id=row.position_id,
+                          strategy_id=row.strategy_id, stop_loss=row.stop_loss, target=row.target,
+                          created_at=row.created_at)
+            self._orders[(order.user_id, order.order_id)] = (order, account)
+            if self.check_risk:
+                risk_engine.hold(order)
+            recovered += 1
+        if recovered:
+            logger.info("Polling %d pending orders from trades", recovered)
+        return recovered
+
+    # Lifecycle
+
+    async def start(self):
+        if self.record:
+            try:
+                await self.recover()
+            except Exception:
+                logger.exception("Recovering pending orders failed")
+        self._tasks = [asyncio.create_task(self._poll_loop())]
+        if self.record:
+            self._tasks.append(asyncio.create_task(self._flush_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.record:
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Final trades flush failed")
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(settings.ORDER_POLL_INTERVAL)
+            if not self._orders:
+                continue
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Order poll failed")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.ORDER_WRITE_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Trades flush failed")
+
+    def summary(self) -> Dict[str, Any]:
+        brokers: Dict[str, Dict[str, int]] = {}
+        for account, client in self.clients.items():
+            totals = brokers.setdefault(account.broker, dict.fromkeys(client.stats, 0))
+            for key, value in client.stats.items():
+                totals[key] += value
+        return {**self.stats, "open_orders": len(self._orders), "queued_rows": len(self._rows), "brokers": brokers}
+
+
+order_gateway = OrderGateway()
+
+---
+
+# backend/benchmarks/mock_broker.py
+# Usage: python -m benchmarks.mock_broker [--port 8900] [--latency-ms 20] [--rate 10] [--fail-percent 2] [--fill-ms 200]
+#
+# A Kite-compatible subset (POST /orders/regular, GET /orders) for latency
+# and throughput tests of the order gateway, without touching a real broker.
+# It enforces a per-API-key orders/second limit with 429s, and with
+# --fail-percent it fails some requests: half with a 503 before placing the
+# order, half with a 502 after placing it, the ambiguous case idempotent
+# retries must survive. GET /stats reports tags that were placed more than
+# once (should stay 0).
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+IST = timezone(timedelta(hours=5, minutes=30))
+LATENCY = float(os.getenv("MOCK_BROKER_LATENCY_MS", 20)) / 1000
+RATE = int(os.getenv("MOCK_BROKER_RATE", 10))
+FAIL_PERCENT = float(os.getenv("MOCK_BROKER_FAIL_PERCENT", 0))
+FILL_DELAY = float(os.getenv("MOCK_BROKER_FILL_MS", 200)) / 1000
+
+app = FastAPI()
+orders = {}
+tags = Counter()
+windows = defaultdict(deque)
+counters = Counter()
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse({"status": "error", "message": message, "error_type": "NetworkException"}, status_code=status)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.post("/orders/regular")
+async def place(request: Request):
+    form = await request.form()
+    await asyncio.sleep(LATENCY)
+    key = request.headers.get("authorization", "")
+    window = windows[key]
+    now = time.monotonic()
+    while window and now - window[0] >= 1.0:
+        window.popleft()
+    if len(window) >= RATE:
+        counters["throttled"] += 1
+        return _error(429, "Too many requests")
+    window.append(now)
+
+    roll = random.random() * 100
+    if roll < FAIL_PERCENT / 2:
+        counters["failed_before"] += 1
+        return _error(503, "Service unavailable")
+
+    broker_order_id = str(250000000000000 + len(orders))
+    price = float(form.get("price") or 0) or round(random.uniform(100, 3000), 2)
+    orders[broker_order_id] = {
+        "order_id": broker_order_id,
+        "tag": form.get("tag"),
+        "tradingsymbol": form.get("tradingsymbol"),
+        "transaction_type": form.get("transaction_type"),
+        "quantity": int(form.get("quantity") or 0),
+        "price": price,
+        "placed": now,
+        "placed_at": datetime.now(IST),
+        "key": key,
+    }
+    tags[form.get("tag")] += 1
+    counters["placed"] += 1
+    if roll < FAIL_PERCENT:
+        counters["failed_after"] += 1
+        return _error(502, "Bad gateway")
+    return {"status": "success", "data": {"order_id": broker_order_id}}
+
+
+@app.get("/orders")
+async def order_book(request: Request):
+    await asyncio.sleep(LATENCY)
+    key = request.headers.get("authorization", "")
+    now = time.monotonic()
+    data = []
+    for order in orders.values():
+        if order["key"] != key:
+            continue
+        filled = now - order["placed"] >= FILL_DELAY
+        data.append({
+            "order_id": order["order_id"],
+            "tag": order["tag"],
+            "tradingsymbol": order["tradingsymbol"],
+            "transaction_type": order["transaction_type"],
+            "quantity": order["quantity"],
+            "status": "COMPLETE" if filled else "OPEN",
+            "average_price": order["price"] if filled else 0,
+            "filled_quantity": order["quantity"] if filled else 0,
+            # Kite reports exchange time in IST without an offset
+            "exchange_timestamp": (order["placed_at"] + timedelta(seconds=FILL_DELAY)).strftime("%Y-%m-%d %H:%M:%S")
+            if filled else None,
+        })
+    return {"status": "success", "data": data}
+
+
+@app.get("/stats")
+async def stats():
+    return {**counters, "duplicate_tags": sum(1 for n in tags.values() if n > 1)}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--rate", type=int, default=10)
+    parser.add_argument("--fail-percent", type=float, default=0)
+    parser.add_argument("--fill-ms", type=float, default=200)
+    args = parser.parse_args()
+    global LATENCY, RATE, FAIL_PERCENT, FILL_DELAY
+    LATENCY, RATE, FAIL_PERCENT, FILL_DELAY = args.latency_ms / 1000, args.rate, args.fail_percent, args.fill_ms / 1000
+    uvicorn.run(app, port=args.port, log_level="critical")
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/bench_orders.py
+# Usage: python -m benchmarks.bench_orders [--orders 500] [--accounts 5] [--batch 50] [--fail-percent 2]
+#
+# Starts the mock broker in a subprocess and places orders through the
+# gateway: one pooled client and rate limiter per account, batches placed
+# concurrently. Prints placement and fill latency percentiles, throughput
+# against the mock's rate limit, retries, and duplicate placements seen by
+# the broker. --naive runs the same load with a fresh connection per order
+# and no client-side pacing, for comparison. Trades are not written unless
+# --record is given (needs a Postgres DATABASE_URL). Pre-trade risk checks
+# are off here; bench_risk measures them.
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+import numpy as np
+
+from app.cache.redis_client import close_redis, init_redis
+from app.config import settings
+from app.services.broker_gateway import COMPLETED, BrokerAccount, Order, OrderGateway, ZerodhaAdapter
+
+
+@contextmanager
+def serve(args):
+    env = {
+        **os.environ,
+        "MOCK_BROKER_LATENCY_MS": str(args.latency_ms),
+        "MOCK_BROKER_RATE": str(args.rate),
+        "MOCK_BROKER_FAIL_PERCENT": str(args.fail_percent),
+        "MOCK_BROKER_FILL_MS": str(args.fill_ms),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.mock_broker:app", "--port", str(args.port), "--log-level", "critical"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        for _ in range(100):
+            if server.poll() is not None:
+                break
+            try:
+                httpx.get(f"{base_url}/health", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        if server.poll() is not None:
+            raise SystemExit(f"Mock broker exited; is port {args.port} in use?")
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def pct(values) -> str:
+    if not len(values):
+        return "n/a"
+    ms = np.array(values) * 1000
+    return f"p50 {np.percentile(ms, 50):.1f} ms, p99 {np.percentile(ms, 99):.1f} ms, max {ms.max():.1f} ms"
+
+
+async def run_gateway(args, base_url):
+    settings.ZERODHA_ORDERS_PER_SECOND = args.rate
+    settings.ORDER_POLL_INTERVAL = 0.1
+    await init_redis()
+    gateway = OrderGateway(record=args.record, check_risk=False)
+    gateway.base_urls["zerodha"] = base_url
+    await gateway.start()
+
+    accounts = [BrokerAccount("zerodha", f"key{i}", f"token{i}") for i in range(args.accounts)]
+    placed_at, placement, fills = {}, [], []
+
+    async def account_load(account, count):
+        for start in range(0, count, args.batch):
+            batch = [Order(user_id=1, symbol="RELIANCE", side="buy", quantity=1) for _ in range(min(args.batch, count - start))]
+            began = time.perf_counter()
+            for order in batch:
+                placed_at[order.order_id] = began
+            states = await gateway.submit(account, batch)
+            done = time.perf_counter()
+            placement.extend(done - began for s in states if s.status != "rejected")
+
+    per_account = args.orders // args.accounts
+    started = time.perf_counter()
+    await asyncio.gather(*(account_load(a, per_account) for a in accounts))
+    placed_in = time.perf_counter() - started
+
+    deadline = time.perf_counter() + 30
+    pending = set(placed_at)
+    while pending and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+        for order_id in list(pending):
+            state = await gateway.state(1, order_id)
+            if state is not None and state.status in (COMPLETED, "rejected"):
+                pending.discard(order_id)
+                if state.status == COMPLETED:
+                    fills.append(time.perf_counter() - placed_at[order_id])
+
+    # Resubmitting the same order_ids must not reach the broker again
+    again = [Order(user_id=1, symbol="RELIANCE", side="buy", quantity=1, order_id=o) for o in list(placed_at)[:args.batch]]
+    await gateway.submit(accounts[0], again)
+
+    summary = gateway.summary()
+    await gateway.stop()
+    await close_redis()
+    total = per_account * args.accounts
+    print(f"gateway: {total} orders over {args.accounts} accounts in {placed_in:.2f}s "
+          f"({total / placed_in:.1f} orders/s, limit {args.rate * args.accounts}/s)")
+    print(f"  batch placement latency: {pct(placement)}")
+    print(f"  submit -> fill recorded: {pct(fills)} ({len(fills)} filled)")
+    print(f"  {summary['brokers'].get('zerodha')}; resubmitted {len(again)}, deduplicated {summary['duplicates']}")
+
+
+async def run_naive(args, base_url):
+    adapter = ZerodhaAdapter()
+    latencies, rejected = [], 0
+
+    async def one(i):
+        nonlocal rejected
+        order = Order(user_id=1, symbol="RELIANCE", side="buy", quantity=1)
+        account = BrokerAccount("zerodha", f"naive{i % args.accounts}", "t")
+        began = time.perf_counter()
+        async with httpx.AsyncClient(base_url=base_url, headers=adapter.headers(account)) as client:
+            response = await client.post(adapter.place_path, **adapter.place_request(order))
+        if response.status_code != 200:
+            rejected += 1
+        else:
+            latencies.append(time.perf_counter() - began)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.orders)))
+    elapsed = time.perf_counter() - started
+    print(f"naive: {args.orders} orders in {elapsed:.2f}s, {rejected} rejected or failed")
+    print(f"  placement latency: {pct(latencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--rate", type=int, default=10, help="Broker orders/second per account")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--fill-ms", type=float, default=200)
+    parser.add_argument("--fail-percent", type=float, default=2)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--naive", action="store_true")
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    with serve(args) as base_url:
+        asyncio.run(run_gateway(args, base_url))
+        if args.naive:
+            asyncio.run(run_naive(args, base_url))
+        print("broker:", httpx.get(f"{base_url}/stats").json())
+
+
+if __name__ == "__main__":
+    main()
+
+---
+
+# backend/benchmarks/bench_risk.py
+# Usage: python -m benchmarks.bench_risk [--users 1000] [--symbols 500] [--positions 20] [--orders 200000] [--capital 200000]
+#
+# Builds risk_engine state for synthetic users and open positions, then
+# times pre-trade checks: bulk throughput of check(), admit() followed by
+# release() as the gateway does for each order, per-call latency
+# percentiles, and re-marking on ticks. No database or Redis is needed.
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.risk_engine import RiskEngine
+
+
+def build(args) -> RiskEngine:
+    rng = random.Random(args.seed)
+    symbols = [f"SYM{i:04d}" for i in range(args.symbols)]
+    engine = RiskEngine()
+    engine.prices.update({s: round(rng.uniform(50, 3000), 2) for s in symbols})
+    positions = [
+        SimpleNamespace(
+            user_id=user_id,
+            strategy_id=rng.choice((None, user_id * 10, user_id * 10 + 1)),
+            symbol=symbol,
+            quantity=rng.choice((-1, 1)) * rng.randint(1, 20),
+            entry_price=engine.prices[symbol] * rng.uniform(0.95, 1.05),
+            current_price=engine.prices[symbol],
+        )
+        for user_id in range(args.users)
+        for symbol in rng.sample(symbols, args.positions)
+    ]
+    summaries = [
+        SimpleNamespace(user_id=u, total_capital=args.capital, today_pnl=0.0, as_of=None) for u in range(args.users)
+    ]
+    started = time.perf_counter()
+    engine.load(positions, summaries)
+    print(f"load: {len(positions)} positions for {args.users} users in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return engine
+
+
+def orders(args, engine: RiskEngine):
+    rng = random.Random(args.seed + 1)
+    symbols = list(engine.prices)
+    result = []
+    for i in range(args.orders):
+        symbol = rng.choice(symbols)
+        price = engine.prices[symbol]
+        side = rng.choice(("buy", "sell"))
+        long = side == "buy"
+        user_id = rng.randrange(args.users)
+        result.append(SimpleNamespace(
+            order_id=str(i),
+            user_id=user_id,
+            symbol=symbol,
+            side=side,
+            quantity=rng.randint(1, 50),
+            price=None if rng.random() < 0.5 else price,
+            strategy_id=rng.choice((None, user_id * 10)),
+            stop_loss=price * (0.97 if long else 1.03),
+            target=price * (1.06 if long else 0.94),
+        ))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--positions", type=int, default=20, help="Open positions per user")
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--capital", type=float, default=200000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    engine = build(args)
+    batch = orders(args, engine)
+
+    check = engine.check
+    started = time.perf_counter()
+    rejected = sum(1 for order in batch if check(order) is not None)
+    elapsed = time.perf_counter() - started
+    print(f"check: {len(batch) / elapsed:,.0f} checks/s ({elapsed / len(batch) * 1e6:.2f} us each), "
+          f"{rejected / len(batch):.1%} rejected")
+
+    started = time.perf_counter()
+    for order in batch:
+        if engine.admit(order) is None:
+            engine.release(order.user_id, order.order_id)
+    elapsed = time.perf_counter() - started
+    print(f"admit + release: {len(batch) / elapsed:,.0f} orders/s ({elapsed / len(batch) * 1e6:.2f} us each)")
+
+    timings = np.empty(min(len(batch), 50000))
+    clock = time.perf_counter_ns
+    for i in range(len(timings)):
+        began = clock()
+        check(batch[i])
+        timings[i] = clock() - began
+    print(f"check latency: p50 {np.percentile(timings, 50) / 1000:.2f} us, "
+          f"p99 {np.percentile(timings, 99) / 1000:.2f} us, max {timings.max() / 1000:.1f} us")
+
+    symbols = list(engine.prices)
+    ticks = [{"symbol": s, "ltp": engine.prices[s] * 1.001} for s in symbols] * 20
+    started = time.perf_counter()
+    for tick in ticks:
+        engine.on_tick(tick)
+    elapsed = time.perf_counter() - started
+    holders = args.users * args.positions / args.symbols
+    print(f"on_tick: {len(ticks) / elapsed:,.0f} ticks/s with ~{holders:.0f} holders per symbol")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+# backend/app/websocket/manager.py
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from app.cache.redis_client import get_redis
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Market data fan-out.
+#
+# Producers call publish_tick(); with the Redis bridge on, ticks go through a
+# pub/sub channel so every uvicorn worker sees every tick. Each worker keeps
+# only the latest tick per symbol until the next flush (every
+# WS_SEND_INTERVAL), so bursts collapse into one update per symbol.
+#
+# On flush each updated tick is serialized once, and connections with the
+# same subscription set share one frame built from those fragments; the
+# frame string is handed to every member as-is. A connection sends from its
+# own bounded queue, and a slow client loses its oldest frames instead of
+# holding up the rest.
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, user_id: Optional[int] = None, queue_size: int = settings.WS_QUEUE_SIZE):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.symbols: FrozenSet[str] = frozenset()
+        self.channels: Set[str] = set()
+        self.queue: Deque[str] = deque(maxlen=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self._waiter: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def enqueue(self, frame: str):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(frame)
+        # A bare future rather than an Event: enqueue runs once per subscriber per flush
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            waiter.set_result(None)
+
+    async def run_sender(self, on_error):
+        try:
+            loop = asyncio.get_running_loop()
+            while True:
+                if not self.queue:
+                    self._waiter = loop.create_future()
+                    await self._waiter
+                while self.queue:
+                    await self.websocket.send_text(self.queue.popleft())
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await on_error(self)
+
+
+class _Group:
+    """Connections with an identical subscription set share frames"""
+
+    def __init__(self, symbols: FrozenSet[str]):
+        self.symbols = symbols
+        self.members: Set[Connection] = set()
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.connections: Set[Connection] = set()
+        self._user_channels: Dict[Tuple[int, str], Set[Connection]] = defaultdict(set)
+        self._tick_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._groups: Dict[FrozenSet[str], _Group] = {}
+        self._symbol_groups: Dict[str, Set[_Group]] = defaultdict(set)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._pubsub = None
+        self.bridged = False
+        self.stats = {"ticks_in": 0, "ticks_coalesced": 0, "frames_built": 0, "frames_queued": 0, "flushes": 0}
+
+    # Lifecycle
+
+    async def start(self, bridge: bool = True):
+        """Start the flush loop and, if bridged, the Redis listener"""
+        self._flusher = asyncio.create_task(self._flush_loop())
+        if bridge:
+            self._pubsub = get_redis().pubsub()
+            await self._pubsub.subscribe(settings.WS_TICK_CHANNEL)
+            self._listener = asyncio.create_task(self._listen())
+            self.bridged = True
+
+    async def stop(self):
+        for task in (self._flusher, self._listener, *(c.task for c in self.connections)):
+            if task:
+                task.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self.bridged = False
+        self.connections.clear()
+        self._user_channels.clear()
+        self._groups.clear()
+        self._symbol_groups.clear()
+
+    # Connections
+
+    async def connect(self, websocket: WebSocket, user_id: Optional[int] = None) -> Connection:
+        await websocket.accept()
+        return self.register(websocket, user_id)
+
+    def register(self, websocket, user_id: Optional[int] = None) -> Connection:
+        """Track an already accepted socket"""
+        connection = Connection(websocket, user_id)
+        self.connections.add(connection)
+        connection.task = asyncio.create_task(connection.run_sender(self._on_send_error))
+        return connection
+
+    def disconnect(self, connection: Connection):
+        if connection not in self.connections:
+            return
+        self.connections.discard(connection)
+        self._leave_group(connection)
+        for channel in list(connection.channels):
+            self.leave_channel(connection, channel)
+        if connection.task and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+
+    async def _on_send_error(self, connection: Connection):
+        self.disconnect(connection)
+
+    def subscribe(self, connection: Connection, symbols: Iterable[str]):
+        self._set_symbols(connection, connection.symbols | {s.upper() for s in symbols})
+
+    def unsubscribe(self, connection: Connection, symbols: Iterable[str]):
+        self._set_symbols(connection, connection.symbols - {s.upper() for s in symbols})
+
+    def _set_symbols(self, connection: Connection, symbols: FrozenSet[str]):
+        if len(symbols) > settings.WS_MAX_SYMBOLS_PER_CONNECTION:
+            raise ValueError(f"At most {settings.WS_MAX_SYMBOLS_PER_CONNECTION} symbols per connection")
+        self._leave_group(connection)
+        connection.symbols = frozenset(symbols)
+        if not symbols:
+            return
+        group = self._groups.get(connection.symbols)
+        if group is None:
+            group = self._groups[connection.symbols] = _Group(connection.symbols)
+            for symbol in group.symbols:
+                self._symbol_groups[symbol].add(group)
+        group.members.add(connection)
+
+    def join_channel(self, connection: Connection, channel: str):
+        """Per-user streams such as "positions"; needs an authenticated connection"""
+        if connection.user_id is None:
+            raise ValueError(f"Channel {channel} needs an authenticated connection")
+        connection.channels.add(channel)
+        self._user_channels[(connection.user_id, channel)].add(connection)
+
+    def leave_channel(self, connection: Connection, channel: str):
+        connection.channels.discard(channel)
+        members = self._user_channels.get((connection.user_id, channel))
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self._user_channels[(connection.user_id, channel)]
+
+    def has_listeners(self, user_id: int, channel: str) -> bool:
+        return (user_id, channel) in self._user_channels
+
+    def send_to_user(self, user_id: int, channel: str, frame: str) -> int:
+        """Queue a serialized frame to this worker's connections of a user on a channel"""
+        members = self._user_channels.get((user_id, channel), ())
+        for connection in members:
+            connection.enqueue(frame)
+        return len(members)
+
+    def _leave_group(self, connection: Connection):
+        group = self._groups.get(connection.symbols)
+        if group is None:
+            return
+        group.members.discard(connection)
+        if not group.members:
+            del self._groups[group.symbols]
+            for symbol in group.symbols:
+                self._symbol_groups[symbol].discard(group)
+                if not self._symbol_groups[symbol]:
+                    del self._symbol_groups[symbol]
+
+    # Ticks
+
+    async def publish_tick(self, symbol: str, tick: Dict[str, Any]):
+        """Entry point for producers; reaches subscribers on every worker"""
+        tick = {"symbol": symbol.upper(), **tick}
+        if self.bridged:
+            await get_redis().publish(settings.WS_TICK_CHANNEL, json.dumps(tick))
+        else:
+            self.ingest(tick)
+
+    async def publish_ticks(self, ticks: Iterable[Dict[str, Any]]):
+        """Batch form of publish_tick; each tick carries its own "symbol" """
+        ticks = [{**tick, "symbol": tick["symbol"].upper()} for tick in ticks]
+        if self.bridged:
+            await get_redis().publish(settings.WS_TICK_CHANNEL, json.dumps(ticks))
+        else:
+            for tick in ticks:
+                self.ingest(tick)
+
+    def add_tick_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """Call back on every tick this worker receives, before coalescing"""
+        self._tick_listeners.append(callback)
+
+    def remove_tick_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        if callback in self._tick_listeners:
+            self._tick_listeners.remove(callback)
+
+    def ingest(self, tick: Dict[str, Any]):
+        """Latest tick per symbol wins until the next flush"""
+        symbol = tick["symbol"]
+        self.stats["ticks_in"] += 1
+        for callback in self._tick_listeners:
+            try:
+                callback(tick)
+            except Exception:
+                logger.exception("Tick listener failed")
+        if symbol in self._pending:
+            self.stats["ticks_coalesced"] += 1
+        if symbol in self._symbol_groups:
+            self._pending[symbol] = tick
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                data = message["data"]
+                if isinstance(data, bytes) and data.startswith(b"["):
+                    for tick in json.loads(data):
+                        self.ingest(tick)
+                else:
+                    self.ingest(json.loads(data))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("WebSocket bridge: bad message")
+                await asyncio.sleep(0.1)
+
+    async def _flush_loop(self):
+        interval = settings.WS_SEND_INTERVAL
+        while True:
+            started = time.monotonic()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("WebSocket flush failed")
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+
+    def flush(self) -> int:
+        """Build one frame per affected subscription group and queue it to every member"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        self.stats["flushes"] += 1
+
+        fragments = {symbol: json.dumps(tick, separators=(",", ":")) for symbol, tick in pending.items()}
+        groups: Set[_Group] = set()
+        for symbol in fragments:
+            groups.update(self._symbol_groups.get(symbol, ()))
+
+        queued = 0
+        for group in groups:
+            if len(group.symbols) < len(fragments):
+                symbols = [s for s in group.symbols if s in fragments]
+            else:
+                symbols = [s for s in fragments if s in group.symbols]
+            frame = '{"type":"ticks","data":[' + ",".join(fragments[s] for s in symbols) + "]}"
+            self.stats["frames_built"] += 1
+            for connection in group.members:
+                connection.enqueue(frame)
+            queued += len(group.members)
+        self.stats["frames_queued"] += queued
+        return queued
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """Send a message to every local connection"""
+        frame = json.dumps(message)
+        for connection in self.connections:
+            connection.enqueue(frame)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "connections": len(self.connections),
+            "subscription_groups": len(self._groups),
+            "user_channels": len(self._user_channels),
+            "symbols": len(self._symbol_groups),
+            "dropped_frames": sum(c.dropped for c in self.connections),
+            "bridged": self.bridged,
+        }
+
+
+manager = ConnectionManager()
+
+---
+
+# backend/app/websocket/handlers.py
+import json
+
+from typing import Optional
+
+import jwt
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+
+from app.security import verify_token
+from app.websocket.manager import manager
+
+router = APIRouter()
+
+# Client protocol, one JSON object per message:
+#   {"action": "subscribe", "symbols": ["RELIANCE", "TCS"]}
+#   {"action": "unsubscribe", "symbols": ["TCS"]}
+#   {"action": "join", "channel": "positions"}     (or "alerts"; needs ?token=<access token> on connect)
+#   {"action": "leave", "channel": "positions"}
+# Server frames:
+#   {"type": "ticks", "data": [{"symbol": "RELIANCE", "ltp": 2850.5, ...}, ...]}
+#   {"type": "positions", "data": [{"id": 1, "pnl": 120.5, ...}, ...]}
+#   {"type": "alerts", "data": [{"id": 7, "symbol": "TCS", "triggered_price": 3500.0, ...}, ...]}
+#   {"type": "subscribed", "symbols": [...], "channels": [...]} / {"type": "error", "message": "..."}
+
+CHANNELS = ("positions", "alerts")
+
+
+@router.websocket("/ws/market")
+async def market_stream(websocket: WebSocket, token: Optional[str] = Query(None)):
+    # Browsers cannot set headers on a WebSocket, so the access token comes in
+    # the query string; without one the socket gets public ticks only
+    user_id = None
+    if token is not None:
+        try:
+            user_id = int((await verify_token(token))["sub"])
+        except jwt.InvalidTokenError:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid or expired token")
+            return
+    connection = await manager.connect(websocket, user_id)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                action = message.get("action")
+                symbols = message.get("symbols") or []
+                if action == "subscribe":
+                    manager.subscribe(connection, symbols)
+                elif action == "unsubscribe":
+                    manager.unsubscribe(connection, symbols)
+                elif action in ("join", "leave"):
+                    channel = message.get("channel")
+                    if channel not in CHANNELS:
+                        raise ValueError(f"Unknown channel: {channel}")
+                    if action == "join":
+                        manager.join_channel(connection, channel)
+                    else:
+                        manager.leave_channel(connection, channel)
+                else:
+                    raise ValueError(f"Unknown action: {action}")
+                reply = {"type": "subscribed", "symbols": sorted(connection.symbols), "channels": sorted(connection.channels)}
+            except (ValueError, AttributeError) as e:
+                reply = {"type": "error", "message": str(e)}
+            connection.enqueue(json.dumps(reply))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(connection)
+
+
+@router.get("/api/v1/ws/stats")
+async def websocket_stats():
+    """Fan-out hub counters for this worker"""
+    return manager.summary()
+
+---
+
+# backend/benchmarks/bench_ws_fanout.py
+# Usage: python -m benchmarks.bench_ws_fanout [--clients 10000] [--symbols 2000] [--ticks-per-sec 20000] [--seconds 10]
+#        python -m benchmarks.bench_ws_fanout --url ws://localhost:8000/ws/market --clients 2000
+#
+# In-process mode drives the hub with fake sockets, so 10k clients fit on one
+# machine and what is measured is the hub itself: tick -> frame queued ->
+# "sent". --slow-percent makes a share of the clients slow consumers to show
+# drop-oldest keeping everyone else on time. With --url, real WebSocket
+# clients connect to a running server and ticks are injected through Redis
+# (--redis), which also exercises the cross-worker bridge.
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+WATCHLIST_SIZES = (5, 20, 50)
+
+
+class FakeSocket:
+    """Records receive latency from the tick's own send timestamp.
+
+    Frames are shared strings, so each distinct frame is parsed once and the
+    harness stays cheap next to the hub it measures.
+    """
+
+    parsed = {}
+
+    def __init__(self, latencies, delay: float = 0.0):
+        self.latencies = latencies
+        self.delay = delay
+
+    async def send_text(self, frame: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        now = time.perf_counter()
+        sent = self.parsed.get(frame)
+        if sent is None:
+            data = json.loads(frame).get("data") or []
+            sent = self.parsed[frame] = min((t["sent"] for t in data), default=0.0)
+        if sent:
+            self.latencies.append(now - sent)
+
+
+def watchlists(n_symbols: int, count: int, rng: random.Random):
+    """Clients mostly pick from a handful of shared watchlists, like real users"""
+    universe = [f"SYM{i}" for i in range(n_symbols)]
+    shared = [rng.sample(universe, rng.choice(WATCHLIST_SIZES)) for _ in range(count)]
+    return universe, shared
+
+
+async def produce(publish, universe, rate: int, seconds: float):
+    batch = max(rate // 100, 1)
+    end = time.perf_counter() + seconds
+    sent = 0
+    while time.perf_counter() < end:
+        for symbol in random.sample(universe, min(batch, len(universe))):
+            await publish(symbol, {"ltp": round(random.uniform(100, 3000), 2), "sent": time.perf_counter()})
+            sent += 1
+        await asyncio.sleep(0.01)
+    return sent
+
+
+async def run_inprocess(args):
+    from app.websocket.manager import manager
+
+    rng = random.Random(7)
+    universe, shared = watchlists(args.symbols, args.watchlists, rng)
+    await manager.start(bridge=False)
+    latencies, slow_latencies = [], []
+    connections = []
+    for i in range(args.clients):
+        slow = rng.random() * 100 < args.slow_percent
+        socket = FakeSocket(slow_latencies if slow else latencies, delay=0.5 if slow else 0.0)
+        connection = manager.register(socket)
+        manager.subscribe(connection, rng.choice(shared))
+        connections.append(connection)
+
+    sent = await produce(manager.publish_tick, universe, args.ticks_per_sec, args.seconds)
+    await asyncio.sleep(0.5)
+    summary = manager.summary()
+    await manager.stop()
+    report(args, sent, latencies, summary)
+    if slow_latencies:
+        print(f"slow consumers: {len(slow_latencies)} frames delivered, {summary['dropped_frames']} dropped")
+
+
+async def run_remote(args):
+    import redis.asyncio as redis
+    import websockets
+
+    from app.config import settings
+
+    rng = random.Random(7)
+    universe, shared = watchlists(args.symbols, args.watchlists, rng)
+    latencies = []
+
+    async def client(symbols):
+        async with websockets.connect(args.url, max_queue=None) as ws:
+            await ws.send(json.dumps({"action": "subscribe", "symbols": symbols}))
+            async for frame in ws:
+                now = time.time()
+                data = json.loads(frame).get("data") or []
+                if data:
+                    latencies.append(now - min(t["sent"] for t in data))
+
+    clients = []
+    for i in range(args.clients):
+        clients.append(asyncio.create_task(client(rng.choice(shared))))
+        if i % 500 == 499:
+            await asyncio.sleep(0.5)
+    await asyncio.sleep(2)
+
+    r = redis.from_url(args.redis)
+
+    async def publish(symbol, tick):
+        tick["sent"] = time.time()
+        await r.publish(settings.WS_TICK_CHANNEL, json.dumps({"symbol": symbol, **tick}))
+
+    sent = await produce(publish, universe, args.ticks_per_sec, args.seconds)
+    await asyncio.sleep(1)
+    for task in clients:
+        task.cancel()
+    await r.aclose()
+    report(args, sent, latencies, None)
+
+
+def report(args, sent, latencies, summary):
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    print(f"{args.clients} clients, {args.symbols} symbols, {sent} ticks in {args.seconds}s")
+    print(f"frames received {len(latencies)}, latency p50 {np.percentile(lat, 50):.1f} ms, "
+          f"p99 {np.percentile(lat, 99):.1f} ms, max {lat.max():.1f} ms")
+    if summary:
+        print(f"frames built {summary['frames_built']}, queued {summary['frames_queued']}, "
+              f"ticks coalesced {summary['ticks_coalesced']}, groups {summary['subscription_groups']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--watchlists", type=int, default=200)
+    parser.add_argument("--ticks-per-sec", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--slow-percent", type=float, default=1.0)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--redis", default="redis://localhost:6379")
+    args = parser.parse_args()
+    asyncio.run(run_remote(args) if args.url else run_inprocess(args))
+
+
+if __name__ == "__main__":
+    main()
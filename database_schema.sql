@@ -15,6 +15,9 @@ CREATE TABLE users (
     is_active BOOLEAN DEFAULT true,
     is_admin BOOLEAN DEFAULT false,
     subscription_tier VARCHAR(50) DEFAULT 'free', -- free, pro, elite
+    phone_number VARCHAR(20), -- WhatsApp notifications, E.164
+    telegram_chat_id VARCHAR(50),
+    notification_channels JSONB DEFAULT '["email"]', -- email, telegram, whatsapp
     api_limit INT DEFAULT 100,
     two_fa_enabled BOOLEAN DEFAULT false,
     two_fa_secret VARCHAR(255),
@@ -88,13 +91,16 @@ CREATE TABLE backtest_results (
     win_rate FLOAT NOT NULL,
     profit_factor FLOAT,
     expectancy FLOAT,
+    parameters JSONB, -- Grid overrides for parameter sweep runs
     
     -- Period
     start_date TIMESTAMP NOT NULL,
     end_date TIMESTAMP NOT NULL,
     
-    -- Equity Curve (Daily values)
-    equity_curve JSONB, -- Array of {date, value}
+    -- Equity Curve (per bar, little-endian arrays; see app.services.equity_curve)
+    curve_timestamps BYTEA, -- int64 epoch seconds
+    curve_equity BYTEA, -- float64
+    curve_drawdown BYTEA, -- float64, fraction below the running peak
     trades_log JSONB, -- Detailed trades
     
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -158,14 +164,19 @@ CREATE INDEX idx_positions_symbol ON positions(symbol);
 CREATE INDEX idx_positions_status ON positions(status);
 
 -- Trades Table
+-- Partitioned by month on created_at (trades_YYYY_MM, created ahead by the
+-- application); queries bounded on created_at scan only the months they need.
+-- Unique keys must include the partition key, hence (order_id, created_at):
+-- the gateway writes an order's states with the created_at of its first one
 CREATE TABLE trades (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     position_id INT REFERENCES positions(id) ON DELETE SET NULL,
+    strategy_id INT REFERENCES strategies(id) ON DELETE SET NULL,
     
     -- Trade Details
     symbol VARCHAR(20) NOT NULL,
-    order_id VARCHAR(100) UNIQUE,
+    order_id VARCHAR(100),
     broker_order_id VARCHAR(100),
     
     side VARCHAR(10) NOT NULL, -- buy, sell
@@ -174,22 +185,47 @@ CREATE TABLE trades (
     
     -- Status
     status VARCHAR(20) DEFAULT 'pending', -- pending, completed, rejected, cancelled
+    realized_pnl FLOAT, -- fills that reduce a position; NULL for fills that open or add
+    stop_loss FLOAT, -- as ordered
+    target FLOAT,
     
     -- Timestamps
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     executed_at TIMESTAMP,
     
     -- Additional Details
     commission FLOAT,
-    slippage FLOAT
-);
+    slippage FLOAT,
+    
+    PRIMARY KEY (id, created_at),
+    UNIQUE (order_id, created_at)
+) PARTITION BY RANGE (created_at);
 
-CREATE INDEX idx_trades_user_id ON trades(user_id);
+CREATE INDEX idx_trades_user_created ON trades(user_id, created_at);
 CREATE INDEX idx_trades_position_id ON trades(position_id);
 CREATE INDEX idx_trades_symbol ON trades(symbol);
 CREATE INDEX idx_trades_status ON trades(status);
 CREATE INDEX idx_trades_created_at ON trades(created_at);
 
+-- Daily trade rollup (maintained by app.services.trade_stats)
+CREATE TABLE trade_daily_stats (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    
+    trades INT DEFAULT 0,
+    completed_trades INT DEFAULT 0,
+    closing_trades INT DEFAULT 0, -- completed fills that reduce a position
+    winning_trades INT DEFAULT 0,
+    traded_value FLOAT DEFAULT 0,
+    realized_pnl FLOAT DEFAULT 0,
+    last_trade_id BIGINT,
+    
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE INDEX idx_trade_daily_stats_day ON trade_daily_stats(day);
+
 -- Alerts Table
 CREATE TABLE alerts (
     id SERIAL PRIMARY KEY,
@@ -211,9 +247,12 @@ CREATE INDEX idx_alerts_user_id ON alerts(user_id);
 CREATE INDEX idx_alerts_is_active ON alerts(is_active);
 
 -- Audit Logs
+-- Partitioned by month on created_at; the application creates partitions
+-- audit_logs_YYYY_MM ahead of time and drops those past
+-- AUDIT_RETENTION_MONTHS (app/database/partitions.py)
 CREATE TABLE audit_logs (
-    id SERIAL PRIMARY KEY,
-    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    id BIGSERIAL,
+    user_id INT REFERENCES users(id) ON DELETE CASCADE, -- NULL for failed logins
     
     action VARCHAR(255) NOT NULL, -- strategy_created, position_opened, trade_executed
     resource_type VARCHAR(50), -- strategy, position, trade
@@ -223,16 +262,21 @@ CREATE TABLE audit_logs (
     ip_address VARCHAR(50),
     user_agent TEXT,
     
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
 CREATE INDEX idx_audit_logs_user_id ON audit_logs(user_id);
 CREATE INDEX idx_audit_logs_action ON audit_logs(action);
 CREATE INDEX idx_audit_logs_created_at ON audit_logs(created_at);
 
 -- Market Data Cache
+-- Partitioned by month on timestamp (market_data_cache_YYYY_MM); importers
+-- create the partitions for the range they load (ensure_partitions).
+-- One row per (symbol, timeframe, timestamp): bulk loads merge on that key
 CREATE TABLE market_data_cache (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     symbol VARCHAR(20) NOT NULL,
     timeframe VARCHAR(10), -- 1m, 5m, 15m, 1h, 1d
     
@@ -243,11 +287,13 @@ CREATE TABLE market_data_cache (
     volume BIGINT,
     
     timestamp TIMESTAMP NOT NULL,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (id, timestamp),
+    CONSTRAINT uq_market_data_bar UNIQUE (symbol, timeframe, timestamp)
+) PARTITION BY RANGE (timestamp);
 
 CREATE INDEX idx_market_data_symbol_timestamp ON market_data_cache(symbol, timestamp);
-CREATE INDEX idx_market_data_timeframe ON market_data_cache(timeframe);
 
 -- Portfolio Summary (Denormalized for performance)
 CREATE TABLE portfolio_summary (
@@ -258,10 +304,13 @@ CREATE TABLE portfolio_summary (
     cash_available FLOAT,
     invested_capital FLOAT,
     
-    today_pnl FLOAT,
-    today_pnl_percent FLOAT,
-    mtd_pnl FLOAT,
-    ytd_pnl FLOAT,
+    realized_pnl FLOAT DEFAULT 0,
+    unrealized_pnl FLOAT DEFAULT 0,
+    today_pnl FLOAT DEFAULT 0,
+    today_pnl_percent FLOAT DEFAULT 0,
+    mtd_pnl FLOAT DEFAULT 0,
+    ytd_pnl FLOAT DEFAULT 0,
+    as_of DATE, -- day today/mtd/ytd refer to (maintained by app.services.portfolio_summary)
     
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );